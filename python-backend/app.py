@@ -1,11 +1,16 @@
 from flask import Flask, jsonify, request
-from flask_cors import CORS
 from datetime import datetime, date
 import os
 from dotenv import load_dotenv
 
 from config import config
-from models import db, Session, ClosedDate, SyncLog
+from models import db, Session, ClosedDate, SyncLog, DailyRollup
+# These register the session listeners that keep documents, rollups, the
+# closed-day set and cached responses in step with writes
+from serializers import FastJSONProvider
+import cache
+import closed_dates
+import rollups
 
 load_dotenv()
 
@@ -14,20 +19,58 @@ def create_app(config_name=None):
     if config_name is None:
         config_name = os.getenv('FLASK_ENV', 'development')
     
+    # Subsystems only the running app uses are imported here, off the import path
+    from flask_cors import CORS
+    import changes
+    import compression
+    import database
+    import exports
+    import metrics
+    import migrations
+    import sync_logs
+    
     app = Flask(__name__)
     app.config.from_object(config[config_name])
+    app.json = FastJSONProvider(app)
     
     # Initialize extensions
+    metrics.init_app(app)
     db.init_app(app)
+    database.init_app(app)
     CORS(app)
+    cache.init_app(app)
+    closed_dates.init_app(app)
+    changes.init_app(app)
+    compression.init_app(app)
+    exports.init_app(app)
     
     # Register blueprints
     from routes import api_bp
     app.register_blueprint(api_bp, url_prefix='/api')
     
-    # Create database tables
+    # Create or migrate the schema; a no-op query when it is already current
     with app.app_context():
-        db.create_all()
+        migrations.upgrade(db)
+    
+    @app.cli.command('schema-version')
+    def schema_version():
+        """Show the database schema version and the version this code expects"""
+        print(f'Database schema version {migrations.current_version(db.engine)}, '
+              f'code expects {migrations.SCHEMA_VERSION}')
+    
+    @app.cli.command('rebuild-rollups')
+    def rebuild_rollups():
+        """Rebuild the daily_rollups table from the sessions table"""
+        rollups.rebuild(db.session)
+        db.session.commit()
+        print(f'Rebuilt {DailyRollup.query.count()} daily rollups')
+    
+    @app.cli.command('compact-sync-logs')
+    def compact_sync_logs():
+        """Fold sync logs older than SYNC_LOG_RETENTION_DAYS into per-device daily totals"""
+        removed = sync_logs.compact(db.session, app.config['SYNC_LOG_RETENTION_DAYS'])
+        db.session.commit()
+        print(f'Compacted {removed} sync logs into sync_log_daily')
     
     # Health check endpoint
     @app.route('/health', methods=['GET'])
@@ -0,0 +1,440 @@
+"""ASGI serving mode.
+
+`create_asgi_app()` wraps the Flask app from `create_app()` in an ASGI
+application. Request bodies are fed to the view as they arrive and response
+bodies are sent as the view produces them, so slow uploads, streamed session
+listings, NDJSON sync uploads and export downloads neither hold a worker
+while bytes trickle in nor buffer whole payloads in memory.
+
+Views never run on the server's event loop. Session listing, sync and stats
+run the existing Flask views on an async database driver (aiosqlite /
+asyncpg) through `AsyncSession.run_sync`, on a small set of driver loops,
+each an event loop thread with its own async engine: database waits yield to
+the other requests on that loop, and view CPU time stays off the loop that
+accepts connections. This keeps every route contract and write hook
+unchanged. The change stream (GET /api/changes/stream) is served natively on
+the event loop, so an idle subscriber holds neither a thread nor a database
+connection. All other routes run the WSGI app in a thread.
+
+Run with an ASGI server, e.g.:
+    uvicorn --factory asgi:create_asgi_app --workers 1
+"""
+import asyncio
+from collections import deque
+from contextvars import ContextVar
+import io
+import sys
+import threading
+from urllib.parse import parse_qs
+
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
+from sqlalchemy.util import await_only
+from werkzeug.exceptions import ClientDisconnected
+
+from app import create_app
+from models import db
+import changes
+import database
+
+# (method, path prefix) pairs served on the async database driver
+ASYNC_ROUTES = (
+    ('GET', '/api/sessions'),
+    ('POST', '/api/sync'),
+    ('GET', '/api/stats'),
+)
+
+CHANGES_STREAM_PATH = '/api/changes/stream'
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+    'postgres': 'postgresql+asyncpg',
+}
+
+# Request body messages queued ahead of the view
+REQUEST_QUEUE_DEPTH = 4
+# Response bytes a view may queue ahead of a slow client before it waits
+RESPONSE_HIGH_WATER = 256 * 1024
+
+_bridge_session = ContextVar('bridge_session', default=None)
+
+# Write hooks listen on `db.session`, which binds them to the sessionmaker's own
+# subclass of RoutingSession; deriving from it keeps rollups, ETags and cache
+# invalidation firing for writes made through the async driver.
+class BridgeSession(db.session.session_factory.class_):
+    """Sync facade of an AsyncSession that stands in for `db.session` during a request"""
+    
+    def __init__(self, **kwargs):
+        super().__init__(db, **kwargs)
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        return bind if bind is not None else self.bind
+
+def async_database_url(url):
+    """Map a sync database URL onto its async driver, or None if there is none"""
+    url = make_url(url)
+    if url.drivername.startswith('sqlite') and url.database in (None, '', ':memory:'):
+        # An in-memory database is private to the sync engine's connection
+        return None
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        return None
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+class DriverLoop:
+    """An event loop thread with its own async engine; async connections belong to the loop that opened them"""
+    
+    def __init__(self, url, pragmas=None, name='asgi-driver'):
+        self.engine = create_async_engine(url)
+        if pragmas and self.engine.dialect.name == 'sqlite':
+            database.apply_sqlite_pragmas(self.engine.sync_engine, pragmas)
+        self.session_factory = async_sessionmaker(self.engine, sync_session_class=BridgeSession, expire_on_commit=False)
+        # Requests in flight, counted on the server loop
+        self.active = 0
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self.thread.start()
+    
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+        self.loop.close()
+    
+    async def submit(self, coro):
+        """Run a coroutine on this loop and await its result from another loop"""
+        return await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, self.loop))
+    
+    async def close(self):
+        await self.submit(self.engine.dispose())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        await asyncio.to_thread(self.thread.join)
+
+class _Exchange:
+    """
+    Carries one request body to a view and its response back to the server loop
+    
+    feed_body() and forward() run on the server loop. read() and write() run
+    in the view's worker and cross over through `wait`, which runs a coroutine
+    on the server loop and blocks the thread (or suspends the greenlet) until
+    it is done. Writes only wait once RESPONSE_HIGH_WATER bytes are queued, and
+    forward() sends everything queued since its last send as one message.
+    """
+    
+    def __init__(self):
+        self.loop = asyncio.get_running_loop()
+        self.body = asyncio.Queue(REQUEST_QUEUE_DEPTH)
+        self.closed = asyncio.Event()
+        self._lock = threading.Lock()
+        self._outbox = deque()
+        self._buffered = 0
+        self._ready = asyncio.Event()
+        self._drained = asyncio.Event()
+    
+    async def feed_body(self, receive):
+        """Queue the request body as it arrives, then watch for the client going away"""
+        more_body = True
+        while more_body:
+            message = await receive()
+            if message['type'] == 'http.disconnect':
+                break
+            if message.get('body'):
+                await self.body.put(message['body'])
+            more_body = message.get('more_body', False)
+        else:
+            await self.body.put(b'')
+            while (await receive())['type'] != 'http.disconnect':
+                pass
+        self.closed.set()
+    
+    async def _unless_closed(self, awaitable):
+        """Await `awaitable`; ClientDisconnected if the client goes away first"""
+        task = asyncio.ensure_future(awaitable)
+        closed = asyncio.ensure_future(self.closed.wait())
+        try:
+            await asyncio.wait((task, closed), return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            closed.cancel()
+        if not task.done():
+            task.cancel()
+            raise ClientDisconnected()
+        return task.result()
+    
+    async def _drain(self):
+        while self._buffered > RESPONSE_HIGH_WATER // 2:
+            self._drained.clear()
+            await self._drained.wait()
+    
+    def read(self, wait):
+        """Next request body chunk, b'' at the end"""
+        return wait(self._unless_closed(self.body.get()))
+    
+    def write(self, wait, item, size=0):
+        """Queue a (status, headers) pair or a body chunk for the client"""
+        if self.closed.is_set():
+            raise ClientDisconnected()
+        with self._lock:
+            self._outbox.append(item)
+            self._buffered += size
+            full = self._buffered > RESPONSE_HIGH_WATER
+        self.loop.call_soon_threadsafe(self._ready.set)
+        if full:
+            wait(self._unless_closed(self._drain()))
+    
+    async def forward(self, send, worker):
+        """Send what the worker queues until it finishes; re-raise its error, if any"""
+        while True:
+            ready = asyncio.ensure_future(self._ready.wait())
+            await asyncio.wait((ready, worker), return_when=asyncio.FIRST_COMPLETED)
+            ready.cancel()
+            self._ready.clear()
+            with self._lock:
+                items = list(self._outbox)
+                self._outbox.clear()
+                self._buffered = 0
+            self._drained.set()
+            
+            chunks = []
+            for item in items:
+                if isinstance(item, bytes):
+                    chunks.append(item)
+                else:
+                    status, headers = item
+                    await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+            if chunks:
+                await send({'type': 'http.response.body', 'body': b''.join(chunks), 'more_body': True})
+            if worker.done() and not self._outbox:
+                break
+        worker.result()
+        await send({'type': 'http.response.body', 'body': b''})
+
+class _RequestBody(io.RawIOBase):
+    """wsgi.input that reads the request body from an _Exchange as it arrives"""
+    
+    def __init__(self, exchange, wait):
+        self._exchange = exchange
+        self._wait = wait
+        self._pending = b''
+        self._done = False
+    
+    def readable(self):
+        return True
+    
+    def readinto(self, buffer):
+        while not self._pending and not self._done:
+            self._pending = self._exchange.read(self._wait)
+            self._done = not self._pending
+        size = min(len(buffer), len(self._pending))
+        buffer[:size] = self._pending[:size]
+        self._pending = self._pending[size:]
+        return size
+
+def _build_environ(scope):
+    """Translate an ASGI HTTP scope into a WSGI environ; the caller supplies wsgi.input"""
+    server_name, server_port = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', '').encode('utf-8').decode('latin-1'),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server_name,
+        'SERVER_PORT': str(server_port),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+        # The ASGI server ends the body, so chunked uploads without a
+        # Content-Length can be read to the end
+        'wsgi.input_terminated': True,
+    }
+    for raw_name, raw_value in scope.get('headers', []):
+        name = raw_name.decode('latin-1').upper().replace('-', '_')
+        value = raw_value.decode('latin-1')
+        if name in ('CONTENT_TYPE', 'CONTENT_LENGTH'):
+            environ[name] = value
+        else:
+            key = f'HTTP_{name}'
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    return environ
+
+def _serve_wsgi(flask_app, environ, exchange, wait):
+    """Run the WSGI app in a worker, reading the body from and writing the response to `exchange`"""
+    environ['wsgi.input'] = io.BufferedReader(_RequestBody(exchange, wait))
+    response = []
+    
+    def start_response(status, headers, exc_info=None):
+        response[:] = [int(status.split(' ', 1)[0]), [
+            (k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in headers
+        ]]
+    
+    app_iter = flask_app.wsgi_app(environ, start_response)
+    try:
+        started = False
+        for chunk in app_iter:
+            if not chunk:
+                continue
+            if not started:
+                exchange.write(wait, tuple(response))
+                started = True
+            exchange.write(wait, chunk, len(chunk))
+        if not started:
+            exchange.write(wait, tuple(response))
+    except ClientDisconnected:
+        pass
+    finally:
+        if hasattr(app_iter, 'close'):
+            app_iter.close()
+
+def _change_stream_token(scope):
+    """Resume token of a change stream request; TokenError if it is malformed"""
+    headers = {k.decode('latin-1').lower(): v.decode('latin-1') for k, v in scope.get('headers', [])}
+    query = parse_qs(scope.get('query_string', b'').decode('latin-1'))
+    return changes.parse_token(headers.get('last-event-id') or query.get('after', [None])[0])
+
+async def _stream_changes(flask_app, after, receive, send):
+    """Serve GET /api/changes/stream on the event loop (see changes.stream for the WSGI version)"""
+    feed = flask_app.extensions['change_feed']
+    poll_interval = flask_app.config['CHANGES_POLL_INTERVAL']
+    heartbeat = flask_app.config['CHANGES_HEARTBEAT']
+    loop = asyncio.get_running_loop()
+    
+    def in_app(func, *args):
+        # The app context's teardown returns the database connection right away
+        with flask_app.app_context():
+            return func(*args)
+    
+    disconnected = asyncio.Event()
+    
+    async def watch_disconnect():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+        disconnected.set()
+    
+    watcher = asyncio.create_task(watch_disconnect())
+    try:
+        frames, after = await asyncio.to_thread(in_app, changes.open_stream, after)
+        await send({
+            'type': 'http.response.start',
+            'status': 200,
+            'headers': [
+                (b'content-type', b'text/event-stream; charset=utf-8'),
+                (b'cache-control', b'no-cache'),
+                (b'x-accel-buffering', b'no'),
+                # Bypasses Flask, so repeat what CORS(app) sends
+                (b'access-control-allow-origin', b'*'),
+            ],
+        })
+        await send({'type': 'http.response.body', 'body': frames, 'more_body': True})
+        
+        last_sent = loop.time()
+        while not disconnected.is_set():
+            if feed.latest > after:
+                frames, after = await asyncio.to_thread(in_app, changes.read_frames, after)
+                if frames:
+                    await send({'type': 'http.response.body', 'body': frames, 'more_body': True})
+                    last_sent = loop.time()
+                    continue
+                await asyncio.sleep(changes.GAP_PAUSE_SECONDS)
+            elif not await feed.wait_async(after, min(poll_interval, max(heartbeat - (loop.time() - last_sent), 0))):
+                if feed.claim_poll():
+                    feed.publish(await asyncio.to_thread(in_app, changes.latest_token))
+            if loop.time() - last_sent >= heartbeat:
+                await send({'type': 'http.response.body', 'body': changes.KEEPALIVE, 'more_body': True})
+                last_sent = loop.time()
+    finally:
+        watcher.cancel()
+
+def create_asgi_app(config_name=None):
+    """ASGI application factory, alongside `create_app` for WSGI servers"""
+    flask_app = create_app(config_name)
+    
+    async_url = flask_app.config.get('ASYNC_DATABASE_URL') or async_database_url(
+        flask_app.config['SQLALCHEMY_DATABASE_URI']
+    )
+    drivers = []
+    if async_url:
+        drivers = [
+            DriverLoop(async_url, flask_app.config.get('SQLITE_PRAGMAS'), name=f'asgi-driver-{i}')
+            for i in range(max(flask_app.config['ASYNC_DRIVER_LOOPS'], 1))
+        ]
+    
+    @flask_app.before_request
+    def use_bridge_session():
+        bridge = _bridge_session.get()
+        if bridge is not None:
+            db.session.registry.set(bridge)
+    
+    def run_on_bridge(sync_session, environ, exchange, wait):
+        token = _bridge_session.set(sync_session)
+        try:
+            _serve_wsgi(flask_app, environ, exchange, wait)
+        finally:
+            _bridge_session.reset(token)
+    
+    async def serve_on_driver(driver, environ, exchange):
+        # Runs on the driver loop; the view's greenlet suspends while it waits on the server loop
+        def wait(coro):
+            return await_only(asyncio.wrap_future(asyncio.run_coroutine_threadsafe(coro, exchange.loop)))
+        
+        async with driver.session_factory() as session:
+            await session.run_sync(run_on_bridge, environ, exchange, wait)
+    
+    async def dispatch(scope, environ, exchange):
+        if drivers and any(
+            scope['method'] == method and scope['path'].startswith(prefix)
+            for method, prefix in ASYNC_ROUTES
+        ):
+            driver = min(drivers, key=lambda d: d.active)
+            driver.active += 1
+            try:
+                await driver.submit(serve_on_driver(driver, environ, exchange))
+            finally:
+                driver.active -= 1
+            return
+        
+        def wait(coro):
+            return asyncio.run_coroutine_threadsafe(coro, exchange.loop).result()
+        
+        await asyncio.to_thread(_serve_wsgi, flask_app, environ, exchange, wait)
+    
+    async def app(scope, receive, send):
+        if scope['type'] == 'lifespan':
+            while True:
+                message = await receive()
+                if message['type'] == 'lifespan.startup':
+                    await send({'type': 'lifespan.startup.complete'})
+                elif message['type'] == 'lifespan.shutdown':
+                    for driver in drivers:
+                        await driver.close()
+                    await send({'type': 'lifespan.shutdown.complete'})
+                    return
+        
+        if scope['type'] != 'http':
+            raise RuntimeError(f"Unsupported ASGI scope type: {scope['type']}")
+        
+        if scope['method'] == 'GET' and scope['path'] == CHANGES_STREAM_PATH:
+            try:
+                after = _change_stream_token(scope)
+            except changes.TokenError:
+                # Let the Flask view answer the 400
+                pass
+            else:
+                await _stream_changes(flask_app, after, receive, send)
+                return
+        
+        exchange = _Exchange()
+        feeder = asyncio.create_task(exchange.feed_body(receive))
+        worker = asyncio.ensure_future(dispatch(scope, _build_environ(scope), exchange))
+        try:
+            await exchange.forward(send, worker)
+        finally:
+            # Unblocks a worker still waiting on a client that went away
+            exchange.closed.set()
+            feeder.cancel()
+    
+    app.flask_app = flask_app
+    return app
@@ -0,0 +1,173 @@
+"""Load-test benchmark for the API.
+
+Loads a synthetic dataset (see synthetic.py) into a scratch SQLite database,
+drives the main endpoints through the Flask test client and records
+throughput and p50/p95/p99 latency per scenario. Results are written to a
+JSON baseline; later runs with --compare report the change against it and
+exit non-zero when a scenario's p95 regresses beyond --tolerance.
+
+The response cache is disabled unless --cache is passed, so the numbers
+measure the query and serialization path rather than cache hits.
+
+Usage:
+    python benchmark.py --rows 100k --save benchmarks/baseline-100k.json
+    python benchmark.py --rows 100k --compare benchmarks/baseline-100k.json
+"""
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+
+SCENARIOS = ['sessions_page', 'sessions_month', 'sessions_all', 'stats', 'stats_month', 'sync_status', 'sync']
+
+# Full listings above this size measure the client, not the server
+MAX_FULL_LISTING_ROWS = 100_000
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return None
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+def _requests(seed):
+    """Request factories per scenario: callables of (client, iteration) -> response"""
+    from synthetic import generate_sessions
+    
+    # A device re-uploading 50 edited sessions per request, syncing incrementally
+    sync_docs = list(generate_sessions(50, seed=seed + 1))
+    watermark = {'since': None}
+    
+    def sync(client, i):
+        body = {'deviceId': 'benchmark', 'sessions': [dict(doc, tips=doc['tips'] + i) for doc in sync_docs]}
+        if watermark['since']:
+            body['since'] = watermark['since']
+        response = client.post('/api/sync', json=body)
+        watermark['since'] = response.get_json()['watermark']
+        return response
+    
+    return {
+        'sessions_page': lambda c, i: c.get('/api/sessions?limit=100'),
+        'sessions_month': lambda c, i: c.get('/api/sessions?location=halo&startDate=2024-03-01&endDate=2024-03-31'),
+        'sessions_all': lambda c, i: c.get('/api/sessions'),
+        'stats': lambda c, i: c.get('/api/stats'),
+        'stats_month': lambda c, i: c.get('/api/stats?location=halo&startDate=2024-03-01&endDate=2024-03-31'),
+        'sync_status': lambda c, i: c.get('/api/sync-status'),
+        'sync': sync,
+    }
+
+def run(rows, iterations, seed, scenarios):
+    """Load `rows` synthetic sessions and time each scenario; returns the results dict"""
+    from app import create_app
+    import synthetic
+    
+    app = create_app('production')
+    with app.app_context():
+        started = time.perf_counter()
+        synthetic.load(rows, seed=seed)
+        load_seconds = time.perf_counter() - started
+    
+    client = app.test_client()
+    factories = _requests(seed)
+    results = {}
+    for name in scenarios:
+        if name == 'sessions_all' and rows > MAX_FULL_LISTING_ROWS:
+            continue
+        request = factories[name]
+        # Warm up connections and caches outside the measurement
+        request(client, 0)
+        latencies = []
+        started = time.perf_counter()
+        for i in range(1, iterations + 1):
+            t0 = time.perf_counter()
+            response = request(client, i)
+            latencies.append((time.perf_counter() - t0) * 1000)
+            if response.status_code >= 400:
+                raise RuntimeError(f'{name}: HTTP {response.status_code}')
+        elapsed = time.perf_counter() - started
+        latencies.sort()
+        results[name] = {
+            'requests': iterations,
+            'throughput_rps': round(iterations / elapsed, 2),
+            'mean_ms': round(sum(latencies) / len(latencies), 3),
+            'p50_ms': round(percentile(latencies, 50), 3),
+            'p95_ms': round(percentile(latencies, 95), 3),
+            'p99_ms': round(percentile(latencies, 99), 3),
+        }
+        print(f"{name:16} {results[name]['throughput_rps']:>9.1f} req/s  "
+              f"p50 {results[name]['p50_ms']:>8.2f}ms  p95 {results[name]['p95_ms']:>8.2f}ms  "
+              f"p99 {results[name]['p99_ms']:>8.2f}ms")
+    
+    return {
+        'rows': rows,
+        'iterations': iterations,
+        'seed': seed,
+        'load_seconds': round(load_seconds, 2),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'scenarios': results,
+    }
+
+def compare(current, baseline, tolerance):
+    """Print the change against a baseline; returns the scenarios whose p95 regressed"""
+    regressions = []
+    for name, result in current['scenarios'].items():
+        previous = baseline['scenarios'].get(name)
+        if previous is None:
+            print(f'{name:16} (not in baseline)')
+            continue
+        change = result['p95_ms'] / previous['p95_ms'] - 1 if previous['p95_ms'] else 0.0
+        flag = ''
+        if change > tolerance:
+            regressions.append(name)
+            flag = '  REGRESSION'
+        print(f"{name:16} p95 {previous['p95_ms']:>8.2f}ms -> {result['p95_ms']:>8.2f}ms ({change:+.0%}){flag}")
+    return regressions
+
+def main():
+    from synthetic import SIZES
+    
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='10k', help=f"number of sessions or one of {', '.join(SIZES)}")
+    parser.add_argument('--iterations', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--scenario', action='append', choices=SCENARIOS, help='run only these scenarios')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 regression (0.2 = 20%%)')
+    parser.add_argument('--cache', action='store_true', help='keep the response cache enabled')
+    args = parser.parse_args()
+    rows = SIZES.get(args.rows.lower()) or int(args.rows)
+    
+    workdir = tempfile.mkdtemp(prefix='earnings-benchmark-')
+    # Configuration is read from the environment when config.py is imported
+    os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(workdir, 'benchmark.db')}"
+    os.environ['EXPORT_DIR'] = os.path.join(workdir, 'exports')
+    if not args.cache:
+        os.environ['RESPONSE_CACHE_BACKEND'] = 'none'
+    
+    print(f'Benchmarking {rows} sessions, {args.iterations} requests per scenario ({workdir})')
+    current = run(rows, args.iterations, args.seed, args.scenario or SCENARIOS)
+    
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'Saved baseline to {args.save}')
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        if baseline['rows'] != current['rows']:
+            print(f"Warning: baseline has {baseline['rows']} rows, this run has {current['rows']}")
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"p95 regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+"""Response cache for read endpoints, invalidated by table generation.
+
+Cached responses are keyed on the endpoint, its normalized arguments and the
+generation of the scope's table from table_generations (see etags.py). Any
+committed write to the table moves the generation, in every process, so all
+of the scope's entries stop matching at once. The writing process also drops
+them right away instead of waiting for the LRU and TTL to age them out.
+
+Two backends are provided: MemoryCache (per-process LRU with TTL) and
+SQLiteCache (a local database file shared by every worker on the host).
+"""
+from collections import OrderedDict
+from contextlib import closing
+from functools import wraps
+import sqlite3
+import threading
+import time
+
+from flask import current_app, has_app_context, make_response, request
+from sqlalchemy import event
+
+from models import db, Session, ClosedDate
+import etags
+
+PENDING_KEY = 'pending_cache_invalidations'
+
+# Table whose generation versions each scope's entries
+SCOPE_TABLES = {
+    'sessions': Session.__tablename__,
+    'closed_dates': ClosedDate.__tablename__,
+}
+
+class MemoryCache:
+    """Bounded in-process LRU cache with a per-entry TTL"""
+    
+    def __init__(self, max_entries=512, ttl=300):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = 0
+    
+    def version(self):
+        return self._version
+    
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            if entry['expires_at'] < time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return entry['value']
+    
+    def set(self, key, value, scope, version=None):
+        with self._lock:
+            # A write committed while the value was computed; it may be stale
+            if version is not None and version != self._version:
+                return
+            self._entries[key] = {
+                'value': value,
+                'scope': scope,
+                'expires_at': time.monotonic() + self.ttl,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def invalidate(self, scope):
+        with self._lock:
+            self._version += 1
+            for key in [k for k, e in self._entries.items() if e['scope'] == scope]:
+                del self._entries[key]
+    
+    def clear(self):
+        with self._lock:
+            self._version += 1
+            self._entries.clear()
+
+class SQLiteCache:
+    """Cache stored in a local SQLite file so every worker on the host shares it"""
+    
+    def __init__(self, path, max_entries=512, ttl=300):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        with self._connect() as conn:
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS response_cache ('
+                'key TEXT PRIMARY KEY, scope TEXT NOT NULL, '
+                'body BLOB NOT NULL, mimetype TEXT NOT NULL, expires_at REAL NOT NULL, used_at REAL NOT NULL)'
+            )
+            conn.execute('CREATE TABLE IF NOT EXISTS response_cache_version (id INTEGER PRIMARY KEY, version INTEGER NOT NULL)')
+            conn.execute('INSERT OR IGNORE INTO response_cache_version (id, version) VALUES (1, 0)')
+    
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        return closing(conn)
+    
+    def version(self):
+        with self._connect() as conn:
+            return conn.execute('SELECT version FROM response_cache_version WHERE id = 1').fetchone()[0]
+    
+    def get(self, key):
+        now = time.time()
+        with self._connect() as conn:
+            row = conn.execute(
+                'SELECT body, mimetype FROM response_cache WHERE key = ? AND expires_at >= ?', (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            conn.execute('UPDATE response_cache SET used_at = ? WHERE key = ?', (now, key))
+            return bytes(row[0]), row[1]
+    
+    def set(self, key, value, scope, version=None):
+        body, mimetype = value
+        now = time.time()
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            current = conn.execute('SELECT version FROM response_cache_version WHERE id = 1').fetchone()[0]
+            if version is not None and version != current:
+                conn.execute('ROLLBACK')
+                return
+            conn.execute(
+                'INSERT OR REPLACE INTO response_cache (key, scope, body, mimetype, expires_at, used_at) '
+                'VALUES (?, ?, ?, ?, ?, ?)',
+                (key, scope, body, mimetype, now + self.ttl, now),
+            )
+            conn.execute('DELETE FROM response_cache WHERE expires_at < ?', (now,))
+            conn.execute(
+                'DELETE FROM response_cache WHERE key IN (SELECT key FROM response_cache '
+                'ORDER BY used_at DESC LIMIT -1 OFFSET ?)', (self.max_entries,)
+            )
+            conn.execute('COMMIT')
+    
+    def invalidate(self, scope):
+        with self._connect() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            conn.execute('UPDATE response_cache_version SET version = version + 1 WHERE id = 1')
+            conn.execute('DELETE FROM response_cache WHERE scope = ?', (scope,))
+            conn.execute('COMMIT')
+    
+    def clear(self):
+        with self._connect() as conn:
+            conn.execute('UPDATE response_cache_version SET version = version + 1 WHERE id = 1')
+            conn.execute('DELETE FROM response_cache')
+
+def init_app(app):
+    """Create the configured cache backend and attach it to the app"""
+    backend = app.config.get('RESPONSE_CACHE_BACKEND', 'memory')
+    max_entries = app.config.get('RESPONSE_CACHE_MAX_ENTRIES', 512)
+    ttl = app.config.get('RESPONSE_CACHE_TTL', 300)
+    
+    if backend == 'memory':
+        cache = MemoryCache(max_entries=max_entries, ttl=ttl)
+    elif backend == 'sqlite':
+        cache = SQLiteCache(app.config['RESPONSE_CACHE_PATH'], max_entries=max_entries, ttl=ttl)
+    elif backend in (None, 'none'):
+        cache = None
+    else:
+        raise ValueError(f'Unknown RESPONSE_CACHE_BACKEND: {backend}')
+    
+    app.extensions['response_cache'] = cache
+    return cache
+
+def get_cache():
+    if not has_app_context():
+        return None
+    return current_app.extensions.get('response_cache')
+
+def _generation_key(scope):
+    """The scope's table generation, as read by this request"""
+    return '|'.join(etags.generations([SCOPE_TABLES[scope]]))
+
+def cached(scope):
+    """Cache a read view's 200 responses, keyed on endpoint plus normalized args"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            cache = get_cache()
+            if cache is None or request.args.get('stream'):
+                return view(*args, **kwargs)
+            
+            query = sorted((k, v) for k, v in request.args.items(multi=True) if v != '')
+            key = f'{request.endpoint}|{_generation_key(scope)}|{sorted(kwargs.items())}|{query}'
+            hit = cache.get(key)
+            if hit is not None:
+                body, mimetype = hit
+                return current_app.response_class(body, mimetype=mimetype)
+            
+            version = cache.version()
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200 and not response.is_streamed:
+                cache.set(key, (response.get_data(), response.mimetype), scope, version=version)
+            return response
+        return wrapper
+    return decorator
+
+def memoize(key, scope, compute):
+    """Cache the bytes returned by compute() under scope; invalidated like cached() responses"""
+    cache = get_cache()
+    if cache is None:
+        return compute()
+    key = f'{key}|{_generation_key(scope)}'
+    hit = cache.get(key)
+    if hit is not None:
+        return hit[0]
+    version = cache.version()
+    value = compute()
+    cache.set(key, (value, 'application/octet-stream'), scope, version=version)
+    return value
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_invalidations(session, flush_context, instances):
+    pending = session.info.setdefault(PENDING_KEY, {'sessions': False, 'closed_dates': False})
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Session):
+            pending['sessions'] = True
+        elif isinstance(obj, ClosedDate):
+            pending['closed_dates'] = True
+
+@event.listens_for(db.session, 'after_commit')
+def _apply_invalidations(session):
+    pending = session.info.pop(PENDING_KEY, None)
+    cache = get_cache()
+    if not pending or cache is None:
+        return
+    if pending['sessions']:
+        cache.invalidate('sessions')
+    if pending['closed_dates']:
+        cache.invalidate('closed_dates')
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_invalidations(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,334 @@
+"""Change events for sessions and closed dates, replayable and pushed over SSE.
+
+Any transaction that creates, updates or deletes a Session, or closes or
+reopens a date, appends one compact row per touched record to change_events
+just before it commits. The event id is the resume token: GET /api/changes
+replays the events after a token and GET /api/changes/stream pushes them as
+server-sent events, so a device reconnecting with its last token catches up
+without reloading every session.
+
+Writers in this process wake waiting streams on commit. Events committed by
+other processes are found by one `max(id)` query per CHANGES_POLL_INTERVAL
+per process, however many clients are connected. Events older than
+CHANGE_EVENT_RETENTION_DAYS are pruned; a token older than the log gets a
+`reset` event, telling the device to run a full sync.
+"""
+import asyncio
+from datetime import datetime, timedelta
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func
+
+from models import db, Session, ClosedDate, ChangeEvent
+from serializers import dumps
+
+PENDING_KEY = 'pending_change_events'
+PUBLISHED_KEY = 'published_change_event'
+
+# An id gap newer than this may still be filled by a transaction that has not committed yet
+GAP_SETTLE_SECONDS = 2.0
+GAP_PAUSE_SECONDS = 0.1
+PRUNE_INTERVAL_SECONDS = 3600
+KEEPALIVE = b': keepalive\n\n'
+
+_prune_lock = threading.Lock()
+_last_prune = {'at': None}
+
+class TokenError(ValueError):
+    """A resume token that is not a change event id"""
+
+def parse_token(value):
+    """Resume token from a query arg or Last-Event-ID header; None when absent"""
+    if value in (None, ''):
+        return None
+    try:
+        token = int(value)
+    except (TypeError, ValueError):
+        token = -1
+    if token < 0:
+        raise TokenError('Invalid resume token')
+    return token
+
+# ===== RECORDING =====
+
+def _merge_op(previous, op):
+    """Collapse two writes to one record in a transaction into one event op (None: no event)"""
+    if previous is None:
+        # Created and deleted earlier in this transaction, so it did not exist before
+        return None if op == 'delete' else 'create'
+    if op == 'delete':
+        return None if previous == 'create' else 'delete'
+    if previous == 'create':
+        return 'create'
+    if previous == 'delete':
+        return 'update'
+    return op
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_changes(session, flush_context, instances):
+    pending = session.info.setdefault(PENDING_KEY, {})
+    
+    def stage(kind, key, op, obj=None):
+        if (kind, key) in pending:
+            op = _merge_op(pending[(kind, key)][0], op)
+        pending[(kind, key)] = (op, obj)
+    
+    for obj in session.new:
+        if isinstance(obj, Session):
+            stage('session', obj.id, 'create', obj)
+        elif isinstance(obj, ClosedDate):
+            stage('closedDate', obj.date.isoformat(), 'reopen' if obj.is_closed is False else 'close')
+    for obj in session.dirty:
+        if isinstance(obj, Session) and session.is_modified(obj):
+            stage('session', obj.id, 'update', obj)
+        elif isinstance(obj, ClosedDate) and session.is_modified(obj):
+            stage('closedDate', obj.date.isoformat(), 'close' if obj.is_closed else 'reopen')
+    for obj in session.deleted:
+        if isinstance(obj, Session):
+            stage('session', obj.id, 'delete')
+        elif isinstance(obj, ClosedDate):
+            stage('closedDate', obj.date.isoformat(), 'reopen')
+
+@event.listens_for(db.session, 'before_commit')
+def _write_changes(session):
+    session.flush()
+    pending = session.info.pop(PENDING_KEY, None)
+    if not pending:
+        return
+    now = datetime.utcnow()
+    rows = [
+        {
+            'kind': kind,
+            'key': key,
+            'op': op,
+            # Sessions carry their own updated_at so devices can compare it with local edits
+            'updated_at': obj.updated_at if obj is not None and op != 'delete' else now,
+            'created_at': now,
+        }
+        for (kind, key), (op, obj) in pending.items()
+        if op is not None
+    ]
+    if not rows:
+        return
+    session.execute(ChangeEvent.__table__.insert(), rows)
+    session.info[PUBLISHED_KEY] = session.query(func.max(ChangeEvent.id)).scalar()
+    _maybe_prune(session, now)
+
+@event.listens_for(db.session, 'after_commit')
+def _publish_changes(session):
+    latest = session.info.pop(PUBLISHED_KEY, None)
+    if latest is not None and has_app_context():
+        feed = current_app.extensions.get('change_feed')
+        if feed is not None:
+            feed.publish(latest)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_changes(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
+    session.info.pop(PUBLISHED_KEY, None)
+
+def _maybe_prune(session, now):
+    """Delete events past the retention window, at most once per PRUNE_INTERVAL_SECONDS per process"""
+    retention_days = current_app.config.get('CHANGE_EVENT_RETENTION_DAYS') if has_app_context() else None
+    if not retention_days:
+        return
+    with _prune_lock:
+        last = _last_prune['at']
+        if last is not None and time.monotonic() - last < PRUNE_INTERVAL_SECONDS:
+            return
+        _last_prune['at'] = time.monotonic()
+    # The newest event always stays, so the oldest remaining id tells whether a token expired
+    latest = session.query(func.max(ChangeEvent.id)).scalar()
+    session.query(ChangeEvent).filter(
+        ChangeEvent.created_at < now - timedelta(days=retention_days),
+        ChangeEvent.id < latest,
+    ).delete(synchronize_session=False)
+
+# ===== READING =====
+
+def latest_token():
+    return db.session.query(func.max(ChangeEvent.id)).scalar() or 0
+
+def is_expired(token):
+    """Whether events after the token have been pruned"""
+    oldest = db.session.query(func.min(ChangeEvent.id)).scalar()
+    return oldest is not None and token < oldest - 1
+
+def _settled(rows, after):
+    """The leading rows (by id, after a token) up to the first id gap younger than GAP_SETTLE_SECONDS
+    
+    On databases that hand out ids before commit, a slower transaction may
+    still fill such a gap.
+    """
+    settled_before = datetime.utcnow() - timedelta(seconds=GAP_SETTLE_SECONDS)
+    expected = after + 1
+    for index, row in enumerate(rows):
+        if row.id != expected and row.created_at > settled_before:
+            return rows[:index]
+        expected = row.id + 1
+    return rows
+
+def read_events(after, limit):
+    """Up to `limit` events after a token, oldest first, stopping before an unsettled gap"""
+    events = ChangeEvent.query.filter(ChangeEvent.id > after).order_by(ChangeEvent.id).limit(limit).all()
+    return _settled(events, after)
+
+def settled_token(after=0):
+    """The newest token with every event up to it committed
+    
+    Events older than GAP_SETTLE_SECONDS count as settled, so only the
+    recent tail of the log is read.
+    """
+    settled_before = datetime.utcnow() - timedelta(seconds=GAP_SETTLE_SECONDS)
+    anchor = db.session.query(ChangeEvent.id).filter(
+        ChangeEvent.created_at <= settled_before
+    ).order_by(ChangeEvent.created_at.desc()).limit(1).scalar() or 0
+    after = max(after, anchor)
+    recent = db.session.query(ChangeEvent.id, ChangeEvent.created_at).filter(
+        ChangeEvent.id > after
+    ).order_by(ChangeEvent.id).all()
+    settled = _settled(recent, after)
+    return settled[-1].id if settled else after
+
+def session_changes(after, until):
+    """Sessions changed between two tokens: (changed ids, tombstone dicts of deleted ones), oldest first
+    
+    Only each session's last event counts, so a session created and then
+    deleted in the window is reported as deleted.
+    """
+    last = {}
+    for key, op, updated_at in db.session.query(ChangeEvent.key, ChangeEvent.op, ChangeEvent.updated_at).filter(
+        ChangeEvent.kind == 'session',
+        ChangeEvent.id > after,
+        ChangeEvent.id <= until,
+    ).order_by(ChangeEvent.id):
+        # Re-inserted so the result is ordered by each session's last event
+        last.pop(key, None)
+        last[key] = (op, updated_at)
+    changed = [key for key, (op, _) in last.items() if op != 'delete']
+    deleted = [{'id': key, 'deletedAt': at.isoformat()} for key, (op, at) in last.items() if op == 'delete']
+    return changed, deleted
+
+def format_event(change):
+    return b'id: %d\nevent: change\ndata: %s\n\n' % (change.id, dumps(change.to_dict()))
+
+def open_stream(after):
+    """First frames of a stream and the token it continues from"""
+    frames = [b'retry: %d\n\n' % current_app.config['CHANGES_RETRY_MS']]
+    latest = latest_token()
+    get_feed().publish(latest)
+    if after is None:
+        after = latest
+    elif is_expired(after):
+        frames.append(b'event: reset\ndata: %s\n\n' % dumps({'token': str(latest)}))
+        after = latest
+    return b''.join(frames), after
+
+def read_frames(after):
+    """SSE frames for the events after a token, and the new token"""
+    events = read_events(after, current_app.config['CHANGES_BATCH_SIZE'])
+    if not events:
+        return b'', after
+    return b''.join(format_event(change) for change in events), events[-1].id
+
+def stream(after):
+    """Yield SSE frames from a token on, blocking between events (WSGI servers)"""
+    feed = get_feed()
+    poll_interval = current_app.config['CHANGES_POLL_INTERVAL']
+    heartbeat = current_app.config['CHANGES_HEARTBEAT']
+    
+    frames, after = open_stream(after)
+    # Idle streams hold no database connection
+    db.session.close()
+    yield frames
+    
+    last_sent = time.monotonic()
+    while True:
+        if feed.latest > after:
+            frames, after = read_frames(after)
+            db.session.close()
+            if frames:
+                yield frames
+                last_sent = time.monotonic()
+                continue
+            time.sleep(GAP_PAUSE_SECONDS)
+        elif not feed.wait(after, min(poll_interval, max(heartbeat - (time.monotonic() - last_sent), 0))):
+            feed.poll()
+            db.session.close()
+        if time.monotonic() - last_sent >= heartbeat:
+            yield KEEPALIVE
+            last_sent = time.monotonic()
+
+# ===== NOTIFICATION =====
+
+class ChangeFeed:
+    """The newest event id this process knows of, with blocking and asyncio waits for a newer one"""
+    
+    def __init__(self, poll_interval=2):
+        self.poll_interval = poll_interval
+        self.latest = 0
+        self._condition = threading.Condition()
+        self._waiters = set()
+        self._polled_at = None
+    
+    def publish(self, token):
+        with self._condition:
+            if token <= self.latest:
+                return
+            self.latest = token
+            self._condition.notify_all()
+            waiters = list(self._waiters)
+        for loop, future in waiters:
+            loop.call_soon_threadsafe(_resolve, future)
+    
+    def claim_poll(self):
+        """Whether the caller should run this interval's check for other processes' events"""
+        with self._condition:
+            now = time.monotonic()
+            if self._polled_at is not None and now - self._polled_at < self.poll_interval:
+                return False
+            self._polled_at = now
+            return True
+    
+    def poll(self):
+        """Pick up events committed by other processes; one query per poll_interval per process"""
+        if self.claim_poll():
+            self.publish(latest_token())
+    
+    def wait(self, after, timeout):
+        """Block until an event newer than `after` is known; False on timeout"""
+        with self._condition:
+            return self._condition.wait_for(lambda: self.latest > after, timeout)
+    
+    async def wait_async(self, after, timeout):
+        """wait() for asyncio servers, without holding a thread"""
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        waiter = (loop, future)
+        with self._condition:
+            if self.latest > after:
+                return True
+            self._waiters.add(waiter)
+        try:
+            await asyncio.wait_for(future, timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+        finally:
+            with self._condition:
+                self._waiters.discard(waiter)
+
+def _resolve(future):
+    if not future.done():
+        future.set_result(None)
+
+def init_app(app):
+    """Attach the app's change feed"""
+    feed = ChangeFeed(poll_interval=app.config.get('CHANGES_POLL_INTERVAL', 2))
+    app.extensions['change_feed'] = feed
+    return feed
+
+def get_feed():
+    return current_app.extensions['change_feed']
@@ -0,0 +1,128 @@
+"""In-process sorted set of closed dates.
+
+Every worker keeps the closed dates as a sorted tuple, so range queries and
+"is this day closed" checks are a binary search instead of a query. A commit
+that writes ClosedDate rows invalidates the local copy; closes made by other
+processes are picked up by comparing the closed_dates table generation (see
+etags.py) at most every CLOSED_DATES_TTL seconds.
+
+Session writes call is_range_closed(), which also sees closes and reopens
+staged earlier in the same transaction (e.g. by a /api/batch operation).
+"""
+from bisect import bisect_left, bisect_right
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event
+
+from database import primary
+from models import db, ClosedDate, TableGeneration
+
+PENDING_KEY = 'pending_closed_dates'
+
+class ClosedDateSet:
+    """Sorted closed dates of the primary database, reloaded when they change"""
+    
+    def __init__(self, ttl=5):
+        self.ttl = ttl
+        self._dates = ()
+        self._generation = None
+        self._checked_at = None
+        self._lock = threading.Lock()
+    
+    def invalidate(self):
+        with self._lock:
+            self._checked_at = None
+            self._generation = None
+    
+    def _trusted(self, fresh):
+        return not fresh and self._checked_at is not None and time.monotonic() - self._checked_at < self.ttl
+    
+    def dates(self, fresh=False):
+        """The closed dates in ascending order, refreshed if stale
+        
+        With fresh=True the table generation is always checked (one primary
+        key lookup), so the result is never older than the caller's ETag.
+        """
+        if self._trusted(fresh):
+            return self._dates
+        
+        # Held while loading so an invalidate() cannot be overwritten by an older load
+        with self._lock:
+            if self._trusted(fresh):
+                return self._dates
+            # A lagging replica could undo a close this process just committed
+            with primary():
+                generation = db.session.query(TableGeneration.generation).filter(
+                    TableGeneration.name == ClosedDate.__tablename__
+                ).scalar()
+                if self._checked_at is None or generation != self._generation:
+                    self._dates = tuple(
+                        d for (d,) in db.session.query(ClosedDate.date).filter(
+                            ClosedDate.is_closed.is_(True)
+                        ).order_by(ClosedDate.date)
+                    )
+            self._generation = generation
+            self._checked_at = time.monotonic()
+            return self._dates
+    
+    def between(self, start=None, end=None, fresh=False):
+        """Closed dates within [start, end]; either bound may be None"""
+        dates = self.dates(fresh)
+        lo = bisect_left(dates, start) if start is not None else 0
+        hi = bisect_right(dates, end) if end is not None else len(dates)
+        return dates[lo:hi]
+
+def init_app(app):
+    """Attach the app's closed date set"""
+    closed = ClosedDateSet(ttl=app.config.get('CLOSED_DATES_TTL', 5))
+    app.extensions['closed_dates'] = closed
+    return closed
+
+def get_closed_set():
+    return current_app.extensions['closed_dates']
+
+def _staged_changes(session):
+    """{date: is_closed} for ClosedDate rows written but not yet committed in this session"""
+    changes = dict(session.info.get(PENDING_KEY, {}))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, ClosedDate):
+            # is_closed defaults to True when the row is inserted
+            changes[obj.date] = obj.is_closed is not False
+    for obj in session.deleted:
+        if isinstance(obj, ClosedDate):
+            changes[obj.date] = False
+    return changes
+
+def is_range_closed(start, end=None):
+    """Whether every day from start to end (default: start) is closed, counting this transaction's writes"""
+    end = start if end is None else end
+    if end < start:
+        return False
+    changes = _staged_changes(db.session)
+    closed = set(get_closed_set().between(start, end))
+    for day, is_closed in changes.items():
+        if start <= day <= end:
+            if is_closed:
+                closed.add(day)
+            else:
+                closed.discard(day)
+    return len(closed) == (end - start).days + 1
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_closed_dates(session, flush_context, instances):
+    changes = _staged_changes(session)
+    if changes:
+        session.info[PENDING_KEY] = changes
+
+@event.listens_for(db.session, 'after_commit')
+def _invalidate_closed_dates(session):
+    if session.info.pop(PENDING_KEY, None) and has_app_context():
+        closed = current_app.extensions.get('closed_dates')
+        if closed is not None:
+            closed.invalidate()
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_closed_dates(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
@@ -0,0 +1,53 @@
+"""Negotiated response compression (brotli when available, otherwise gzip)."""
+import gzip
+
+from flask import request
+
+try:
+    import brotli
+    HAS_BROTLI = True
+except ImportError:
+    HAS_BROTLI = False
+
+def _choose_encoding():
+    accepted = request.accept_encodings
+    if HAS_BROTLI and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+def init_app(app):
+    """Compress large responses for clients that accept it"""
+    min_size = app.config.get('COMPRESS_MIN_SIZE', 1024)
+    level = app.config.get('COMPRESS_LEVEL', 6)
+    
+    @app.after_request
+    def compress_response(response):
+        if (
+            response.status_code != 200
+            or response.direct_passthrough
+            or response.is_streamed
+            or 'Content-Encoding' in response.headers
+        ):
+            return response
+        
+        response.vary.add('Accept-Encoding')
+        encoding = _choose_encoding()
+        if encoding is None or response.content_length is None or response.content_length < min_size:
+            return response
+        
+        body = response.get_data()
+        if encoding == 'br':
+            body = brotli.compress(body, quality=min(level, 11))
+        else:
+            body = gzip.compress(body, compresslevel=level)
+        
+        response.set_data(body)
+        response.headers['Content-Encoding'] = encoding
+        
+        # The compressed representation needs its own strong validator
+        etag, weak = response.get_etag()
+        if etag and not weak:
+            response.set_etag(f'{etag}-{encoding}')
+        return response
@@ -1,11 +1,27 @@
 import os
 from datetime import timedelta
 
+def _engine_options(url):
+    """Connection pool settings for server databases (SQLite keeps SQLAlchemy's defaults)"""
+    if url.startswith('sqlite'):
+        return {}
+    return {
+        'pool_size': int(os.getenv('DB_POOL_SIZE', 10)),
+        'max_overflow': int(os.getenv('DB_MAX_OVERFLOW', 20)),
+        'pool_timeout': 30,
+        'pool_recycle': 1800,
+        'pool_pre_ping': True,
+    }
+
 class Config:
     """Base configuration"""
     # SQLite database (can switch to PostgreSQL by changing DATABASE_URL)
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///earnings_tracker.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
+    # Async driver URL for ASGI mode; derived from DATABASE_URL when unset
+    ASYNC_DATABASE_URL = os.getenv('ASYNC_DATABASE_URL')
+    # Event loop threads that run the async-driver views in ASGI mode
+    ASYNC_DRIVER_LOOPS = int(os.getenv('ASYNC_DRIVER_LOOPS', 2))
     
     # CORS settings
     CORS_HEADERS = 'Content-Type'
@@ -18,18 +34,79 @@ class Config:
     
     # API settings
     JSON_SORT_KEYS = False
-    JSONIFY_PRETTYPRINT_REGULAR = True
+    JSONIFY_PRETTYPRINT_REGULAR = False
+    
+    # Compress responses at least this large (bytes) for clients sending Accept-Encoding
+    COMPRESS_MIN_SIZE = 1024
+    COMPRESS_LEVEL = 6
+    
+    # Pagination settings for GET /api/sessions
+    SESSIONS_PAGE_SIZE = 100
+    SESSIONS_MAX_PAGE_SIZE = 1000
+    SESSIONS_STREAM_BATCH_SIZE = 500
+    
+    # Rows per lookup/insert batch in POST /api/sync (kept under SQLite's bound-parameter limit)
+    SYNC_BATCH_SIZE = 500
+    # Longest accepted line (one session) in an NDJSON sync upload
+    SYNC_MAX_LINE_BYTES = 1024 * 1024
+    # Maximum operations accepted by one POST /api/batch request
+    BATCH_MAX_OPERATIONS = 500
+    # Sync logs older than this are folded into per-device daily totals (sync_log_daily)
+    SYNC_LOG_RETENTION_DAYS = int(os.getenv('SYNC_LOG_RETENTION_DAYS', 30))
+    # Minimum seconds between automatic compactions after a sync, per process
+    SYNC_LOG_COMPACT_INTERVAL = 3600
+    
+    # Background exports; files default to <instance>/exports
+    EXPORT_DIR = os.getenv('EXPORT_DIR')
+    EXPORT_WORKERS = 2
+    EXPORT_BATCH_SIZE = 1000
+    EXPORT_MAX_FILES = 50
+    
+    # Change events behind GET /api/changes and the SSE stream
+    CHANGE_EVENT_RETENTION_DAYS = int(os.getenv('CHANGE_EVENT_RETENTION_DAYS', 7))
+    CHANGES_POLL_INTERVAL = 2  # seconds between checks for events from other processes
+    CHANGES_HEARTBEAT = 15  # seconds between keepalive comments on an idle stream
+    CHANGES_RETRY_MS = 3000  # reconnect delay suggested to SSE clients
+    CHANGES_BATCH_SIZE = 500
+    
+    # Seconds a worker trusts its closed date set before checking for closes by other processes
+    CLOSED_DATES_TTL = 5
+    
+    # Response cache for read endpoints: 'memory' (per process), 'sqlite'
+    # (a local file shared by all workers on the host) or 'none'
+    RESPONSE_CACHE_BACKEND = os.getenv('RESPONSE_CACHE_BACKEND', 'memory')
+    RESPONSE_CACHE_PATH = os.getenv('RESPONSE_CACHE_PATH', 'response_cache.db')
+    RESPONSE_CACHE_MAX_ENTRIES = 512
+    RESPONSE_CACHE_TTL = 300  # seconds
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
     SESSION_COOKIE_SECURE = False  # Allow HTTP in development
+    JSONIFY_PRETTYPRINT_REGULAR = True
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    
+    SQLALCHEMY_ENGINE_OPTIONS = _engine_options(Config.SQLALCHEMY_DATABASE_URI)
+    
+    # Applied to every new SQLite connection: WAL lets readers proceed during
+    # sync writes, and busy_timeout makes writers wait instead of failing
+    SQLITE_PRAGMAS = {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'cache_size': -64000,  # KiB, i.e. 64 MB
+        'mmap_size': 268435456,  # 256 MB
+        'busy_timeout': 5000,  # ms
+        'temp_store': 'MEMORY',
+    }
+    
+    # Optional read replica for read-only endpoints
+    if os.getenv('DATABASE_REPLICA_URL'):
+        SQLALCHEMY_BINDS = {'replica': os.getenv('DATABASE_REPLICA_URL')}
 
 class TestingConfig(Config):
     """Testing configuration"""
@@ -0,0 +1,50 @@
+"""Engine tuning and read-replica routing."""
+from contextlib import contextmanager
+from functools import wraps
+
+from sqlalchemy import event
+
+from models import db
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the given PRAGMA statements on every new connection of a SQLite engine"""
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+def init_app(app):
+    """Install per-connection SQLite pragmas on every SQLite engine of the app"""
+    pragmas = app.config.get('SQLITE_PRAGMAS')
+    if not pragmas:
+        return
+    
+    with app.app_context():
+        for engine in db.engines.values():
+            if engine.dialect.name == 'sqlite':
+                apply_sqlite_pragmas(engine, pragmas)
+                # Connections opened before the hook was installed lack the pragmas
+                engine.dispose()
+
+def read_replica(view):
+    """Run a read-only view against the read replica when one is configured"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        db.session.info['use_replica'] = True
+        try:
+            return view(*args, **kwargs)
+        finally:
+            db.session.info.pop('use_replica', None)
+    return wrapper
+
+@contextmanager
+def primary():
+    """Send the statements in the block to the primary, even inside a read_replica view"""
+    replica = db.session.info.pop('use_replica', None)
+    try:
+        yield
+    finally:
+        if replica is not None:
+            db.session.info['use_replica'] = replica
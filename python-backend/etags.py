@@ -0,0 +1,91 @@
+"""Conditional GET support for read endpoints.
+
+Every transaction that writes ORM rows bumps a counter per written table in
+table_generations just before it commits. A read endpoint's ETag is a hash
+of the request URL and the generations of the tables it reads, so answering
+If-None-Match takes one primary-key lookup and no row is serialized for a
+304.
+
+The same generations key the response cache (cache.py), so a cached body is
+never served under an ETag newer than the data it was built from.
+"""
+from datetime import datetime
+from functools import wraps
+import hashlib
+
+from flask import g, make_response, request
+from sqlalchemy import event, update
+
+from models import db, TableGeneration
+
+PENDING_KEY = 'pending_table_generations'
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_written_tables(session, flush_context, instances):
+    pending = session.info.setdefault(PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__tablename__', None)
+        if table and table != TableGeneration.__tablename__:
+            pending.add(table)
+
+@event.listens_for(db.session, 'before_commit')
+def _bump_written_tables(session):
+    session.flush()
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        bump(session, pending)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_written_tables(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
+
+def bump(session, tables):
+    """Advance the generation of the given tables within the current transaction"""
+    now = datetime.utcnow()
+    for name in sorted(tables):
+        result = session.execute(
+            update(TableGeneration)
+            .where(TableGeneration.name == name)
+            .values(generation=TableGeneration.generation + 1, changed_at=now)
+        )
+        if result.rowcount == 0:
+            session.execute(TableGeneration.__table__.insert().values(name=name, generation=1, changed_at=now))
+
+def generations(tables):
+    """'name:generation:changed_at' per table, sorted by name; looked up once per request"""
+    known = g.setdefault('table_generations', {})
+    missing = [name for name in tables if name not in known]
+    if missing:
+        for name, generation, changed_at in db.session.query(
+            TableGeneration.name, TableGeneration.generation, TableGeneration.changed_at
+        ).filter(TableGeneration.name.in_(missing)):
+            known[name] = f'{name}:{generation}:{changed_at.isoformat()}'
+        for name in missing:
+            # Never written yet
+            known.setdefault(name, None)
+    return [known[name] for name in sorted(tables) if known[name] is not None]
+
+def current_etag(tables):
+    """Strong ETag for the current request URL over the given tables' generations"""
+    key = request.full_path + '|' + '|'.join(generations(tables))
+    return hashlib.sha1(key.encode('utf-8')).hexdigest()
+
+def conditional(*tables):
+    """Serve a view with a strong ETag and answer a matching If-None-Match with 304"""
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            etag = current_etag(tables)
+            # Compressed responses carry the ETag with an encoding suffix
+            for candidate in (etag, f'{etag}-br', f'{etag}-gzip'):
+                if request.if_none_match.contains(candidate):
+                    response = make_response('', 304)
+                    response.set_etag(candidate)
+                    return response
+            
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+            return response
+        return wrapper
+    return decorator
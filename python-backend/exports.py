@@ -0,0 +1,352 @@
+"""Background export jobs.
+
+An export job renders the sessions matching a date range and location as
+CSV, XLSX or PDF on a small worker pool, streaming rows from the database in
+batches. A job's id is a hash of its parameters and the current generation
+of the session tables, so the same export requested again before any write
+is served from the file already on disk, by any worker process.
+"""
+from concurrent.futures import ThreadPoolExecutor
+import csv
+from datetime import datetime
+import hashlib
+from importlib.util import find_spec
+import os
+import threading
+
+from flask import current_app
+
+from models import db, Session, SessionService, SessionAddon, TableGeneration
+
+# openpyxl and reportlab take a third of a second to import, so they are only
+# located here and imported by the writer that needs them
+HAS_OPENPYXL = find_spec('openpyxl') is not None
+HAS_REPORTLAB = find_spec('reportlab') is not None
+
+SOURCE_TABLES = (Session.__tablename__, SessionService.__tablename__, SessionAddon.__tablename__)
+
+CSV_FIELDS = [
+    'ID', 'Date', 'Location', 'Service Type', 'Duration (min)', 'Rate ($/hr)',
+    'Earnings', 'Add-ons', 'Tips', 'Review', 'Client Review'
+]
+
+XLSX_HEADERS = ['Date', 'Location', 'Service Type', 'Duration', 'Rate', 'Earnings', 'Add-ons', 'Tips', 'Total']
+
+class ExportError(Exception):
+    """An export request that cannot be run"""
+
+def available_formats():
+    """Export formats supported by the installed libraries"""
+    formats = ['csv']
+    if HAS_OPENPYXL:
+        formats.append('xlsx')
+    if HAS_REPORTLAB:
+        formats.append('pdf')
+    return formats
+
+def _iter_sessions(params, batch_size):
+    """Yield (session row, services, addons) for matching sessions, oldest first"""
+    query = db.session.query(
+        Session.id, Session.date, Session.location, Session.tips, Session.review, Session.has_client_review,
+    )
+    if params['location']:
+        query = query.filter(Session.location == params['location'])
+    if params['startDate']:
+        query = query.filter(Session.date >= params['startDate'])
+    if params['endDate']:
+        query = query.filter(Session.date <= params['endDate'])
+    
+    def flush(batch):
+        ids = [row.id for row in batch]
+        services = {}
+        addons = {}
+        for row in db.session.query(
+            SessionService.session_id, SessionService.type, SessionService.duration, SessionService.rate,
+        ).filter(SessionService.session_id.in_(ids)).order_by(SessionService.session_id, SessionService.position):
+            services.setdefault(row.session_id, []).append(row)
+        for row in db.session.query(
+            SessionAddon.session_id, SessionAddon.name, SessionAddon.price,
+        ).filter(SessionAddon.session_id.in_(ids)).order_by(SessionAddon.session_id, SessionAddon.position):
+            addons.setdefault(row.session_id, []).append(row)
+        for row in batch:
+            yield row, services.get(row.id, []), addons.get(row.id, [])
+    
+    batch = []
+    for row in query.order_by(Session.date, Session.id).yield_per(batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from flush(batch)
+            batch = []
+    if batch:
+        yield from flush(batch)
+
+def _service_earnings(service):
+    return ((service.rate or 0) / 60) * (service.duration or 0)
+
+def _write_csv(path, sessions):
+    count = 0
+    with open(path, 'w', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=CSV_FIELDS)
+        writer.writeheader()
+        for session, services, addons in sessions:
+            count += 1
+            addons_str = ', '.join(a.name or '' for a in addons) or 'None'
+            base = {
+                'ID': session.id,
+                'Date': session.date.isoformat(),
+                'Location': session.location,
+                'Add-ons': addons_str,
+                'Tips': f'${session.tips or 0:.2f}',
+                'Review': session.review or '',
+                'Client Review': 'Yes' if session.has_client_review else 'No',
+            }
+            if not services:
+                writer.writerow({**base, 'Service Type': 'N/A', 'Duration (min)': 'N/A',
+                                 'Rate ($/hr)': 'N/A', 'Earnings': '$0.00'})
+            for service in services:
+                writer.writerow({
+                    **base,
+                    'Service Type': service.type or '',
+                    'Duration (min)': service.duration or 0,
+                    'Rate ($/hr)': f'${service.rate or 0:.2f}',
+                    'Earnings': f'${_service_earnings(service):.2f}',
+                })
+    return count
+
+def _write_xlsx(path, sessions):
+    import openpyxl
+    from openpyxl.styles import Font, PatternFill
+    
+    # Write-only mode streams rows to disk instead of building the sheet in memory
+    wb = openpyxl.Workbook(write_only=True)
+    ws = wb.create_sheet('Sessions')
+    header = []
+    for title in XLSX_HEADERS:
+        cell = openpyxl.cell.WriteOnlyCell(ws, value=title)
+        cell.fill = PatternFill(start_color='366092', end_color='366092', fill_type='solid')
+        cell.font = Font(bold=True, color='FFFFFF')
+        header.append(cell)
+    ws.append(header)
+    
+    count = 0
+    for session, services, addons in sessions:
+        count += 1
+        tips = session.tips or 0
+        addons_total = sum(a.price or 0 for a in addons)
+        addons_str = ', '.join(a.name or '' for a in addons)
+        if not services:
+            # One row per session, so add-ons and tips are not dropped from the sheet
+            ws.append([
+                session.date.isoformat(), session.location, '', '', '', '$0.00', addons_str,
+                f'${tips:.2f}', f'${addons_total + tips:.2f}',
+            ])
+        for service in services:
+            earnings = _service_earnings(service)
+            ws.append([
+                session.date.isoformat(), session.location, service.type or '', service.duration or 0,
+                f'${service.rate or 0:.2f}', f'${earnings:.2f}', addons_str, f'${tips:.2f}',
+                f'${earnings + addons_total + tips:.2f}',
+            ])
+    wb.save(path)
+    return count
+
+def _write_pdf(path, sessions):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import letter
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import inch
+    from reportlab.platypus import Paragraph, SimpleDocTemplate, Spacer, Table, TableStyle
+    
+    rows = [['Date', 'Location', 'Services', 'Tips', 'Total']]
+    total_earnings = 0
+    total_addons = 0
+    total_tips = 0
+    for session, services, addons in sessions:
+        earnings = sum(_service_earnings(s) for s in services)
+        addons_total = sum(a.price or 0 for a in addons)
+        tips = session.tips or 0
+        total_earnings += earnings
+        total_addons += addons_total
+        total_tips += tips
+        rows.append([
+            session.date.isoformat(), session.location, ', '.join(s.type or '' for s in services),
+            f'${tips:.2f}', f'${earnings + addons_total + tips:.2f}',
+        ])
+    
+    styles = getSampleStyleSheet()
+    header_style = [
+        ('BACKGROUND', (0, 0), (-1, 0), colors.HexColor('#366092')),
+        ('TEXTCOLOR', (0, 0), (-1, 0), colors.whitesmoke),
+        ('FONTNAME', (0, 0), (-1, 0), 'Helvetica-Bold'),
+        ('ALIGN', (0, 0), (-1, -1), 'CENTER'),
+        ('GRID', (0, 0), (-1, -1), 1, colors.grey),
+    ]
+    summary = Table([
+        ['Metric', 'Value'],
+        ['Total Sessions', str(len(rows) - 1)],
+        ['Total Earnings', f'${total_earnings:.2f}'],
+        ['Total Add-ons', f'${total_addons:.2f}'],
+        ['Total Tips', f'${total_tips:.2f}'],
+        ['Gross Total', f'${total_earnings + total_addons + total_tips:.2f}'],
+    ])
+    summary.setStyle(TableStyle(header_style))
+    details = Table(rows, repeatRows=1)
+    details.setStyle(TableStyle(header_style))
+    
+    SimpleDocTemplate(path, pagesize=letter).build([
+        Paragraph('Earnings Report', styles['Heading1']),
+        Paragraph(f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M:%S')} UTC", styles['Normal']),
+        Spacer(1, 0.3 * inch),
+        summary,
+        Spacer(1, 0.3 * inch),
+        Paragraph('Session Details', styles['Heading2']),
+        details,
+    ])
+    return len(rows) - 1
+
+WRITERS = {
+    'csv': _write_csv,
+    'xlsx': _write_xlsx,
+    'pdf': _write_pdf,
+}
+
+class ExportRunner:
+    """Worker pool plus the registry of export jobs started by this process"""
+    
+    def __init__(self, app):
+        self.app = app
+        self.directory = app.config.get('EXPORT_DIR') or os.path.join(app.instance_path, 'exports')
+        self.batch_size = app.config.get('EXPORT_BATCH_SIZE', 1000)
+        self.max_files = app.config.get('EXPORT_MAX_FILES', 50)
+        self.workers = app.config.get('EXPORT_WORKERS', 2)
+        # Started by the first submitted job, not at app startup
+        self.executor = None
+        self._jobs = {}
+        self._lock = threading.Lock()
+    
+    def _path(self, job_id, fmt):
+        return os.path.join(self.directory, f'{job_id}.{fmt}')
+    
+    def submit(self, params):
+        """Start an export job, or return the finished or running job with the same parameters"""
+        job_id = job_key(params)
+        path = self._path(job_id, params['format'])
+        with self._lock:
+            job = self._jobs.get(job_id)
+            # A finished job whose file was pruned (here or by another process) is run again
+            if job is not None and job['status'] != 'failed' and (job['status'] != 'done' or os.path.exists(path)):
+                return job
+            job = {
+                'id': job_id,
+                'status': 'done' if os.path.exists(path) else 'queued',
+                'params': params,
+                'rows': None,
+                'error': None,
+                'submittedAt': datetime.utcnow().isoformat(),
+                'finishedAt': None,
+            }
+            self._jobs[job_id] = job
+            if job['status'] == 'queued' and self.executor is None:
+                os.makedirs(self.directory, exist_ok=True)
+                self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='export')
+        if job['status'] == 'queued':
+            self.executor.submit(self._run, job, path)
+        return job
+    
+    def get(self, job_id):
+        """Job state, including finished exports written by other processes"""
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is not None and job['status'] == 'done' and not os.path.exists(self.path(job)):
+                del self._jobs[job_id]
+                job = None
+        if job is not None:
+            return job
+        for fmt in WRITERS:
+            if os.path.exists(self._path(job_id, fmt)):
+                return {'id': job_id, 'status': 'done', 'params': {'format': fmt}, 'rows': None,
+                        'error': None, 'submittedAt': None, 'finishedAt': None}
+        return None
+    
+    def path(self, job):
+        return self._path(job['id'], job['params']['format'])
+    
+    def _run(self, job, path):
+        job['status'] = 'running'
+        tmp_path = f'{path}.{threading.get_ident()}.tmp'
+        try:
+            with self.app.app_context():
+                try:
+                    sessions = _iter_sessions(job['params'], self.batch_size)
+                    job['rows'] = WRITERS[job['params']['format']](tmp_path, sessions)
+                finally:
+                    db.session.remove()
+            os.replace(tmp_path, path)
+            job['status'] = 'done'
+        except Exception as e:
+            self.app.logger.exception('Export %s failed', job['id'])
+            job['status'] = 'failed'
+            job['error'] = str(e)
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        job['finishedAt'] = datetime.utcnow().isoformat()
+        self._prune()
+    
+    def _prune(self):
+        """Keep only the newest EXPORT_MAX_FILES finished exports on disk and forget the rest"""
+        files = []
+        for name in os.listdir(self.directory):
+            if name.endswith('.tmp'):
+                continue
+            path = os.path.join(self.directory, name)
+            try:
+                files.append((os.path.getmtime(path), path, name))
+            except FileNotFoundError:
+                pass
+        files.sort(reverse=True)
+        for _, stale, name in files[self.max_files:]:
+            try:
+                os.remove(stale)
+            except FileNotFoundError:
+                pass
+            job_id = name.split('.', 1)[0]
+            with self._lock:
+                job = self._jobs.get(job_id)
+                if job is not None and job['status'] == 'done':
+                    del self._jobs[job_id]
+
+def job_key(params):
+    """Hash of the export parameters and the current generation of the tables it reads"""
+    generations = db.session.query(TableGeneration.name, TableGeneration.generation).filter(
+        TableGeneration.name.in_(SOURCE_TABLES)
+    ).order_by(TableGeneration.name)
+    key = '|'.join(
+        [f"{name}={params[name] or ''}" for name in ('format', 'startDate', 'endDate', 'location')]
+        + [f'{name}:{generation}' for name, generation in generations]
+    )
+    return hashlib.sha256(key.encode('utf-8')).hexdigest()[:32]
+
+def parse_params(data):
+    """Validate an export request body into job parameters"""
+    fmt = (data.get('format') or 'csv').lower()
+    if fmt not in WRITERS:
+        raise ExportError(f"Unknown format. Use one of: {', '.join(WRITERS)}")
+    if fmt not in available_formats():
+        raise ExportError(f'The {fmt} exporter is not installed on this server')
+    params = {'format': fmt, 'location': data.get('location') or None}
+    for name in ('startDate', 'endDate'):
+        value = data.get(name) or None
+        if value is not None:
+            try:
+                value = datetime.strptime(value, '%Y-%m-%d').date()
+            except (TypeError, ValueError):
+                raise ExportError('Invalid date format. Use YYYY-MM-DD')
+        params[name] = value
+    return params
+
+def init_app(app):
+    """Start the export worker pool for the app"""
+    app.extensions['exports'] = ExportRunner(app)
+
+def get_runner():
+    return current_app.extensions['exports']
@@ -0,0 +1,174 @@
+"""Prometheus metrics for the API.
+
+Request latency, response size and in-flight requests are recorded per
+route by request hooks; SQL statement counts and time are attributed to the
+request that issued them through engine events. Metrics live in process
+memory and are exposed in the Prometheus text format at GET /metrics.
+"""
+from bisect import bisect_left
+import threading
+import time
+
+from flask import Response, g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200, 500)
+BATCH_SIZE_BUCKETS = (1, 10, 50, 100, 250, 500, 1000, 5000)
+
+def _format_labels(names, values, extra=()):
+    pairs = list(zip(names, values)) + list(extra)
+    if not pairs:
+        return ''
+    escaped = (str(v).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n') for _, v in pairs)
+    return '{' + ','.join(f'{k}="{v}"' for (k, _), v in zip(pairs, escaped)) + '}'
+
+def _format_value(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    """A labelled metric family"""
+    kind = None
+    
+    def __init__(self, name, documentation, labels=()):
+        self.name = name
+        self.documentation = documentation
+        self.labels = tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+    
+    def collect(self):
+        lines = [f'# HELP {self.name} {self.documentation}', f'# TYPE {self.name} {self.kind}']
+        with self._lock:
+            items = sorted(self._values.items())
+            lines.extend(self._samples(key, value) for key, value in items)
+        return '\n'.join(line for line in lines if line)
+
+class Counter(Metric):
+    kind = 'counter'
+    
+    def inc(self, *labels, amount=1):
+        with self._lock:
+            self._values[labels] = self._values.get(labels, 0) + amount
+    
+    def _samples(self, key, value):
+        return f'{self.name}{_format_labels(self.labels, key)} {_format_value(value)}'
+
+class Gauge(Counter):
+    kind = 'gauge'
+    
+    def dec(self, *labels, amount=1):
+        self.inc(*labels, amount=-amount)
+
+class Histogram(Metric):
+    kind = 'histogram'
+    
+    def __init__(self, name, documentation, labels=(), buckets=LATENCY_BUCKETS):
+        super().__init__(name, documentation, labels)
+        self.buckets = tuple(buckets)
+    
+    def observe(self, value, *labels):
+        with self._lock:
+            state = self._values.get(labels)
+            if state is None:
+                # Per-bucket counts (plus +Inf), sum
+                state = self._values[labels] = [[0] * (len(self.buckets) + 1), 0]
+            state[0][bisect_left(self.buckets, value)] += 1
+            state[1] += value
+    
+    def _samples(self, key, state):
+        counts, total = state
+        lines = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + ('+Inf',), counts):
+            cumulative += count
+            le = bound if bound == '+Inf' else _format_value(float(bound))
+            lines.append(f'{self.name}_bucket{_format_labels(self.labels, key, [("le", le)])} {cumulative}')
+        lines.append(f'{self.name}_sum{_format_labels(self.labels, key)} {_format_value(total)}')
+        lines.append(f'{self.name}_count{_format_labels(self.labels, key)} {cumulative}')
+        return '\n'.join(lines)
+
+REQUESTS = Counter(
+    'http_requests_total', 'HTTP requests by route, method and status.', ('method', 'route', 'status'))
+REQUEST_LATENCY = Histogram(
+    'http_request_duration_seconds', 'Time spent handling a request.', ('method', 'route'))
+RESPONSE_SIZE = Histogram(
+    'http_response_size_bytes', 'Size of non-streamed response bodies.', ('method', 'route'), SIZE_BUCKETS)
+IN_FLIGHT = Gauge(
+    'http_requests_in_flight', 'Requests currently being handled.')
+REQUEST_QUERIES = Histogram(
+    'db_queries_per_request', 'SQL statements executed per request.', ('method', 'route'), QUERY_COUNT_BUCKETS)
+REQUEST_QUERY_TIME = Histogram(
+    'db_query_duration_seconds_per_request', 'Time spent in SQL per request.', ('method', 'route'))
+QUERIES = Counter(
+    'db_queries_total', 'SQL statements executed, by route (or "background").', ('route',))
+SYNC_REQUEST_ROWS = Histogram(
+    'sync_request_sessions', 'Sessions received per POST /api/sync.', (), BATCH_SIZE_BUCKETS)
+SYNC_BATCH_ROWS = Histogram(
+    'sync_upsert_batch_sessions', 'Sessions per upsert batch in POST /api/sync.', (), BATCH_SIZE_BUCKETS)
+SYNC_UNCHANGED_ROWS = Counter(
+    'sync_unchanged_sessions_total', 'Uploaded sessions skipped because their content hash matched.')
+
+REGISTRY = [
+    REQUESTS, REQUEST_LATENCY, RESPONSE_SIZE, IN_FLIGHT, REQUEST_QUERIES, REQUEST_QUERY_TIME, QUERIES,
+    SYNC_REQUEST_ROWS, SYNC_BATCH_ROWS, SYNC_UNCHANGED_ROWS,
+]
+
+def _route():
+    rule = request.url_rule
+    return rule.rule if rule is not None else 'unmatched'
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_query(conn, cursor, statement, parameters, context, executemany):
+    conn.info['query_start'] = time.perf_counter()
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _end_query(conn, cursor, statement, parameters, context, executemany):
+    elapsed = time.perf_counter() - conn.info.pop('query_start', time.perf_counter())
+    if has_request_context() and 'metrics_start' in g:
+        g.metrics_queries += 1
+        g.metrics_query_time += elapsed
+        QUERIES.inc(_route())
+    else:
+        QUERIES.inc('background')
+
+def render():
+    """All metrics in the Prometheus text exposition format"""
+    return '\n'.join(metric.collect() for metric in REGISTRY) + '\n'
+
+def init_app(app):
+    """Record request metrics and serve them at /metrics
+    
+    Registered before other extensions so its after_request hook runs last
+    and sees the final (compressed) response size.
+    """
+    @app.before_request
+    def start_request_metrics():
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = 0
+        g.metrics_query_time = 0.0
+        IN_FLIGHT.inc()
+    
+    @app.after_request
+    def record_request_metrics(response):
+        if 'metrics_start' not in g:
+            return response
+        route = _route()
+        REQUESTS.inc(request.method, route, str(response.status_code))
+        REQUEST_LATENCY.observe(time.perf_counter() - g.metrics_start, request.method, route)
+        REQUEST_QUERIES.observe(g.metrics_queries, request.method, route)
+        REQUEST_QUERY_TIME.observe(g.metrics_query_time, request.method, route)
+        if response.content_length is not None:
+            RESPONSE_SIZE.observe(response.content_length, request.method, route)
+        return response
+    
+    @app.teardown_request
+    def finish_request_metrics(exc):
+        if g.pop('metrics_start', None) is not None:
+            IN_FLIGHT.dec()
+    
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(render(), mimetype='text/plain; version=0.0.4')
@@ -0,0 +1,293 @@
+"""Versioned schema migrations.
+
+Each applied migration is recorded in the schema_version table. On startup
+upgrade() reads the recorded version with one query and returns at once when
+it is current, so booting against an up-to-date database runs no DDL and no
+schema reflection. Otherwise it creates missing tables and applies the
+pending migrations in order.
+
+Databases created before schema_version existed start at version 0. Every
+migration therefore checks the live schema before changing it, so it is
+safe on a database that already has some of its changes.
+
+To change the schema: update the models, append a migration to MIGRATIONS,
+and keep it idempotent.
+"""
+from datetime import datetime
+import json
+
+from flask import current_app
+from sqlalchemy import func, inspect, select, text
+from sqlalchemy.exc import IntegrityError, OperationalError, ProgrammingError
+
+from models import (
+    Session, SessionService, SessionAddon, DailyRollup, SchemaVersion, ChangeEvent,
+    calculate_service_earnings, calculate_addon_earnings, calculate_content_hash,
+)
+import rollups
+from serializers import render_document
+
+BACKFILL_BATCH_SIZE = 1000
+
+def _stored_list(session_id, encoded, column):
+    """Decode a services/add-ons JSON column, reading text that is not JSON as an empty list"""
+    try:
+        return json.loads(encoded or '[]')
+    except ValueError:
+        current_app.logger.warning('Session %s: %s is not valid JSON, backfilling it as empty', session_id, column)
+        return []
+
+def _legacy_items(session_id, encoded, column):
+    """(position, item) pairs of a stored services/add-ons list, skipping entries that are not objects
+    
+    Rows written before validation existed may hold anything; they are logged
+    and backfilled from whatever is usable instead of aborting the upgrade.
+    """
+    value = _stored_list(session_id, encoded, column)
+    if not isinstance(value, list):
+        current_app.logger.warning('Session %s: %s is not a list, backfilling it as empty', session_id, column)
+        return []
+    items = [(position, item) for position, item in enumerate(value) if isinstance(item, dict)]
+    if len(items) != len(value):
+        current_app.logger.warning(
+            'Session %s: skipped %d %s entries that are not objects', session_id, len(value) - len(items), column
+        )
+    return items
+
+def _backfill_session_earnings(conn):
+    """Compute service_earnings/addon_earnings for rows written before the columns existed"""
+    rows = conn.execute(text('SELECT id, services_json, addons_json FROM sessions')).fetchall()
+    updates = [
+        {
+            'id': row.id,
+            'service_earnings': calculate_service_earnings(
+                [item for _, item in _legacy_items(row.id, row.services_json, 'services_json')]
+            ),
+            'addon_earnings': calculate_addon_earnings(
+                [item for _, item in _legacy_items(row.id, row.addons_json, 'addons_json')]
+            ),
+        }
+        for row in rows
+    ]
+    statement = text(
+        'UPDATE sessions SET service_earnings = :service_earnings, '
+        'addon_earnings = :addon_earnings WHERE id = :id'
+    )
+    for start in range(0, len(updates), BACKFILL_BATCH_SIZE):
+        conn.execute(statement, updates[start:start + BACKFILL_BATCH_SIZE])
+
+def _backfill_session_items(conn):
+    """Normalize the services/add-ons JSON of existing sessions into their child tables"""
+    rows = conn.execute(text('SELECT id, services_json, addons_json FROM sessions')).fetchall()
+    services = []
+    addons = []
+    for row in rows:
+        for position, data in _legacy_items(row.id, row.services_json, 'services_json'):
+            item = SessionService.from_dict(data, position)
+            services.append({
+                'session_id': row.id,
+                'position': item.position,
+                'service_id': item.service_id,
+                'type': item.type,
+                'duration': item.duration,
+                'rate': item.rate,
+                'halo_base_price': item.halo_base_price,
+            })
+        for position, data in _legacy_items(row.id, row.addons_json, 'addons_json'):
+            item = SessionAddon.from_dict(data, position)
+            addons.append({
+                'session_id': row.id,
+                'position': item.position,
+                'addon_id': item.addon_id,
+                'name': item.name,
+                'price': item.price,
+                'halo_code': item.halo_code,
+            })
+    
+    for table, values in ((SessionService.__table__, services), (SessionAddon.__table__, addons)):
+        for start in range(0, len(values), BACKFILL_BATCH_SIZE):
+            conn.execute(table.insert(), values[start:start + BACKFILL_BATCH_SIZE])
+
+def _backfill_content_hashes(conn):
+    """Hash the content of sessions written before content_hash existed"""
+    sessions = Session.__table__
+    rows = conn.execute(
+        select(
+            sessions.c.id, sessions.c.location, sessions.c.date, sessions.c.services_json, sessions.c.addons_json,
+            sessions.c.tips, sessions.c.review, sessions.c.rating, sessions.c.has_client_review,
+        ).where(sessions.c.content_hash.is_(None))
+    ).fetchall()
+    updates = [
+        {
+            'id': row.id,
+            'content_hash': calculate_content_hash({
+                'location': row.location,
+                'date': row.date,
+                'services': _stored_list(row.id, row.services_json, 'services_json'),
+                'addons': _stored_list(row.id, row.addons_json, 'addons_json'),
+                'tips': row.tips,
+                'review': row.review,
+                'rating': row.rating,
+                'has_client_review': row.has_client_review,
+            }),
+        }
+        for row in rows
+    ]
+    statement = text('UPDATE sessions SET content_hash = :content_hash WHERE id = :id')
+    for start in range(0, len(updates), BACKFILL_BATCH_SIZE):
+        conn.execute(statement, updates[start:start + BACKFILL_BATCH_SIZE])
+
+def _backfill_documents(conn):
+    """Pre-render the documents of sessions written before document_json existed"""
+    sessions = Session.__table__
+    rows = conn.execute(
+        select(
+            sessions.c.id, sessions.c.location, sessions.c.date, sessions.c.services_json, sessions.c.addons_json,
+            sessions.c.tips, sessions.c.review, sessions.c.rating, sessions.c.has_client_review,
+        ).where(sessions.c.document_json.is_(None))
+    ).fetchall()
+    updates = [
+        {
+            'id': row.id,
+            'document_json': render_document({
+                'id': row.id,
+                'location': row.location,
+                'date': row.date,
+                'services': _stored_list(row.id, row.services_json, 'services_json'),
+                'addons': _stored_list(row.id, row.addons_json, 'addons_json'),
+                'tips': row.tips,
+                'review': row.review,
+                'rating': row.rating,
+                'has_client_review': row.has_client_review,
+            }),
+        }
+        for row in rows
+    ]
+    statement = text('UPDATE sessions SET document_json = :document_json WHERE id = :id')
+    for start in range(0, len(updates), BACKFILL_BATCH_SIZE):
+        conn.execute(statement, updates[start:start + BACKFILL_BATCH_SIZE])
+
+def _add_session_earnings(db):
+    """1: service_earnings/addon_earnings columns on sessions"""
+    columns = {c['name'] for c in inspect(db.engine).get_columns('sessions')}
+    if 'service_earnings' in columns:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE sessions ADD COLUMN service_earnings FLOAT NOT NULL DEFAULT 0'))
+        conn.execute(text('ALTER TABLE sessions ADD COLUMN addon_earnings FLOAT NOT NULL DEFAULT 0'))
+        _backfill_session_earnings(conn)
+
+def _create_missing_indexes(db, table, indexes):
+    existing = {i['name'] for i in inspect(db.engine).get_indexes(table)}
+    with db.engine.begin() as conn:
+        for name, columns in indexes:
+            if name not in existing:
+                conn.execute(text(f'CREATE INDEX {name} ON {table} ({columns})'))
+
+def _add_updated_at_index(db):
+    """2: index for delta sync on sessions.updated_at"""
+    _create_missing_indexes(db, 'sessions', [('ix_sessions_updated_at', 'updated_at')])
+
+def _normalize_session_items(db):
+    """3: fill session_services/session_addons from the JSON columns"""
+    with db.engine.begin() as conn:
+        has_items = conn.execute(text(
+            'SELECT 1 FROM session_services UNION ALL SELECT 1 FROM session_addons LIMIT 1'
+        )).first()
+        has_json_items = conn.execute(text(
+            "SELECT 1 FROM sessions WHERE services_json != '[]' OR addons_json != '[]' LIMIT 1"
+        )).first()
+        if not has_items and has_json_items:
+            _backfill_session_items(conn)
+
+def _build_daily_rollups(db):
+    """4: fill daily_rollups for existing sessions"""
+    # Select ids only: columns added by later migrations may not exist yet
+    if DailyRollup.query.first() is None and db.session.query(Session.id).first() is not None:
+        rollups.rebuild(db.session)
+        db.session.commit()
+
+def _add_route_indexes(db):
+    """5: indexes matching the route access patterns"""
+    _create_missing_indexes(db, 'sessions', [
+        ('ix_sessions_location_date', 'location, date'),
+        ('ix_sessions_date_id', 'date, id'),
+    ])
+    _create_missing_indexes(db, 'daily_rollups', [('ix_daily_rollups_location_date', 'location, date')])
+    _create_missing_indexes(db, 'closed_dates', [('ix_closed_dates_is_closed_date', 'is_closed, date')])
+
+def _add_content_hash(db):
+    """6: sessions.content_hash for skipping unchanged rows in sync"""
+    columns = {c['name'] for c in inspect(db.engine).get_columns('sessions')}
+    if 'content_hash' in columns:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE sessions ADD COLUMN content_hash VARCHAR(64)'))
+        _backfill_content_hashes(conn)
+
+def _add_sync_log_device_index(db):
+    """7: sync_logs (device_id, timestamp) index for per-device last-sync lookups"""
+    _create_missing_indexes(db, 'sync_logs', [('ix_sync_logs_device_timestamp', 'device_id, timestamp')])
+
+def _add_change_events(db):
+    """8: change_events log behind GET /api/changes and the SSE stream"""
+    ChangeEvent.__table__.create(db.engine, checkfirst=True)
+
+def _add_session_documents(db):
+    """9: sessions.document_json, the pre-rendered API document of each session"""
+    columns = {c['name'] for c in inspect(db.engine).get_columns('sessions')}
+    if 'document_json' in columns:
+        return
+    with db.engine.begin() as conn:
+        conn.execute(text('ALTER TABLE sessions ADD COLUMN document_json TEXT'))
+        _backfill_documents(conn)
+
+MIGRATIONS = [
+    (1, _add_session_earnings),
+    (2, _add_updated_at_index),
+    (3, _normalize_session_items),
+    (4, _build_daily_rollups),
+    (5, _add_route_indexes),
+    (6, _add_content_hash),
+    (7, _add_sync_log_device_index),
+    (8, _add_change_events),
+    (9, _add_session_documents),
+]
+
+SCHEMA_VERSION = MIGRATIONS[-1][0]
+
+def current_version(engine):
+    """Recorded schema version, or None if the database has no schema_version table"""
+    try:
+        with engine.connect() as conn:
+            return conn.execute(select(func.max(SchemaVersion.version))).scalar() or 0
+    except (OperationalError, ProgrammingError):
+        return None
+
+def _stamp(db, version):
+    try:
+        with db.engine.begin() as conn:
+            conn.execute(SchemaVersion.__table__.insert().values(version=version, applied_at=datetime.utcnow()))
+    except IntegrityError:
+        # Another process starting at the same time recorded it first
+        pass
+
+def upgrade(db):
+    """Bring the database schema up to SCHEMA_VERSION; one query when it is already current"""
+    version = current_version(db.engine)
+    if version == SCHEMA_VERSION:
+        return
+    if version is not None and version > SCHEMA_VERSION:
+        raise RuntimeError(f'Database schema version {version} is newer than this code ({SCHEMA_VERSION})')
+    
+    fresh = version is None and not inspect(db.engine).has_table(Session.__tablename__)
+    db.create_all()
+    if fresh:
+        # create_all() just built the current schema; there is nothing to migrate
+        _stamp(db, SCHEMA_VERSION)
+        return
+    
+    for number, migration in MIGRATIONS:
+        if number > (version or 0):
+            migration(db)
+            _stamp(db, number)
@@ -1,52 +1,152 @@
 from flask_sqlalchemy import SQLAlchemy
+from flask_sqlalchemy.session import Session as BaseSession
+from sqlalchemy import event
 from datetime import datetime, date
+import hashlib
 import json
 
-db = SQLAlchemy()
+REPLICA_BIND = 'replica'
+
+class RoutingSession(BaseSession):
+    """Session that sends reads to the read replica while `use_replica` is set in its info"""
+    
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (
+            bind is None
+            and self.info.get('use_replica')
+            and not self._flushing
+            and REPLICA_BIND in self._db.engines
+        ):
+            return self._db.engines[REPLICA_BIND]
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+db = SQLAlchemy(session_options={'class_': RoutingSession})
+
+def _number(value):
+    """An uploaded amount as a float, or None if it is missing or not numeric"""
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return None
+
+def calculate_service_earnings(services):
+    """Earnings for a list of services: (rate / 60) * duration for each priced service"""
+    total = 0.0
+    for service in services:
+        if not isinstance(service, dict):
+            continue
+        rate, duration = _number(service.get('rate')), _number(service.get('duration'))
+        if rate is not None and duration is not None:
+            total += (rate / 60) * duration
+    return total
+
+def calculate_addon_earnings(addons):
+    """Revenue for a list of add-ons; a missing or null price counts as 0"""
+    return sum(_number(addon.get('price')) or 0.0 for addon in addons if isinstance(addon, dict))
+
+def _canonical(value):
+    """Normalize a JSON value so equal content encodes identically (5.0 and 5 alike)"""
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    if isinstance(value, dict):
+        return {key: _canonical(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_canonical(item) for item in value]
+    return value
+
+def calculate_content_hash(fields):
+    """SHA-256 of a session's content: everything the device uploads except its id"""
+    document = _canonical({
+        'location': fields['location'],
+        'date': fields['date'].isoformat(),
+        'services': fields['services'],
+        'addOns': fields['addons'],
+        'tips': fields['tips'],
+        'review': fields['review'],
+        'rating': fields['rating'],
+        'hasClientReview': bool(fields['has_client_review']),
+    })
+    encoded = json.dumps(document, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
 
 class Session(db.Model):
     """Session model - represents a single therapy session"""
     __tablename__ = 'sessions'
+    __table_args__ = (
+        # Location + date range filters; keyset pagination and per-date listings
+        db.Index('ix_sessions_location_date', 'location', 'date'),
+        db.Index('ix_sessions_date_id', 'date', 'id'),
+    )
     
     id = db.Column(db.String(50), primary_key=True)
     location = db.Column(db.String(50), nullable=False)  # 'soul-bridge' or 'halo'
     date = db.Column(db.Date, nullable=False, index=True)
     
-    # Services (JSON array)
+    # Services (JSON array, as uploaded; normalized into session_services)
     services_json = db.Column(db.Text, nullable=False, default='[]')
     
-    # Add-ons (JSON array)
+    # Add-ons (JSON array, as uploaded; normalized into session_addons)
     addons_json = db.Column(db.Text, nullable=False, default='[]')
     
+    # Normalized services/add-ons, loaded in batches with one SELECT per query
+    service_items = db.relationship(
+        'SessionService', order_by='SessionService.position',
+        cascade='all, delete-orphan', lazy='selectin',
+    )
+    addon_items = db.relationship(
+        'SessionAddon', order_by='SessionAddon.position',
+        cascade='all, delete-orphan', lazy='selectin',
+    )
+    
+    # Earnings derived from services/add-ons, kept in sync by the setters below
+    service_earnings = db.Column(db.Float, nullable=False, default=0.0)
+    addon_earnings = db.Column(db.Float, nullable=False, default=0.0)
+    
     # Tips and review
     tips = db.Column(db.Float, nullable=False, default=0.0)
     review = db.Column(db.Text, nullable=True)
     rating = db.Column(db.Integer, nullable=True)
     has_client_review = db.Column(db.Boolean, nullable=False, default=False)
     
+    # calculate_content_hash() of the stored content, refreshed on every write
+    content_hash = db.Column(db.String(64), nullable=True)
+    
+    # to_dict() pre-rendered as compact JSON on every write (see serializers.render_document)
+    document_json = db.Column(db.Text, nullable=True)
+    
     # Metadata
     created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
-    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
     
     @property
     def services(self):
-        """Parse services JSON"""
-        return json.loads(self.services_json)
+        """Services as uploaded, including keys the normalized rows do not store"""
+        return json.loads(self.services_json or '[]')
     
     @services.setter
     def services(self, value):
-        """Set services as JSON"""
-        self.services_json = json.dumps(value)
+        """Set services as JSON and replace the normalized rows if they changed"""
+        encoded = json.dumps(value)
+        if encoded == self.services_json:
+            return
+        self.services_json = encoded
+        self.service_earnings = calculate_service_earnings(value)
+        self.service_items = [SessionService.from_dict(s, i) for i, s in enumerate(value) if isinstance(s, dict)]
     
     @property
     def addons(self):
-        """Parse add-ons JSON"""
-        return json.loads(self.addons_json)
+        """Add-ons as uploaded, including keys the normalized rows do not store"""
+        return json.loads(self.addons_json or '[]')
     
     @addons.setter
     def addons(self, value):
-        """Set add-ons as JSON"""
-        self.addons_json = json.dumps(value)
+        """Set add-ons as JSON and replace the normalized rows if they changed"""
+        encoded = json.dumps(value)
+        if encoded == self.addons_json:
+            return
+        self.addons_json = encoded
+        self.addon_earnings = calculate_addon_earnings(value)
+        self.addon_items = [SessionAddon.from_dict(a, i) for i, a in enumerate(value) if isinstance(a, dict)]
     
     def to_dict(self):
         """Convert to dictionary"""
@@ -62,12 +162,183 @@ class Session(db.Model):
             'hasClientReview': self.has_client_review,
         }
     
+    def content_fields(self):
+        """The fields covered by the content hash"""
+        return {
+            'location': self.location,
+            'date': self.date,
+            'services': json.loads(self.services_json or '[]'),
+            'addons': json.loads(self.addons_json or '[]'),
+            # Column defaults are not applied yet when a new row is hashed
+            'tips': self.tips or 0.0,
+            'review': self.review,
+            'rating': self.rating,
+            'has_client_review': self.has_client_review,
+        }
+    
     def __repr__(self):
         return f'<Session {self.id} on {self.date}>'
 
+@event.listens_for(Session, 'before_insert')
+@event.listens_for(Session, 'before_update')
+def _refresh_content_hash(mapper, connection, target):
+    target.content_hash = calculate_content_hash(target.content_fields())
+
+def _without_none(data):
+    return {k: v for k, v in data.items() if v is not None}
+
+class SessionService(db.Model):
+    """One service performed in a session"""
+    __tablename__ = 'session_services'
+    
+    session_id = db.Column(db.String(50), db.ForeignKey('sessions.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    service_id = db.Column(db.String(50), nullable=True)  # client-side id
+    type = db.Column(db.String(50), nullable=True, index=True)
+    duration = db.Column(db.Float, nullable=True)  # minutes
+    rate = db.Column(db.Float, nullable=True)  # hourly rate
+    halo_base_price = db.Column(db.Float, nullable=True)
+    
+    @property
+    def earnings(self):
+        if self.rate is None or self.duration is None:
+            return 0.0
+        return (self.rate / 60) * self.duration
+    
+    @classmethod
+    def from_dict(cls, data, position=0):
+        """Row for one uploaded service; amounts that are not numbers are stored as null"""
+        return cls(
+            position=position,
+            service_id=data.get('id'),
+            type=data.get('type'),
+            duration=_number(data.get('duration')),
+            rate=_number(data.get('rate')),
+            halo_base_price=_number(data.get('haloBasePrice')),
+        )
+    
+    def to_dict(self):
+        return _without_none({
+            'id': self.service_id,
+            'type': self.type,
+            'duration': self.duration,
+            'rate': self.rate,
+            'haloBasePrice': self.halo_base_price,
+        })
+    
+    def __repr__(self):
+        return f'<SessionService {self.type} for {self.session_id}>'
+
+class SessionAddon(db.Model):
+    """One add-on sold in a session"""
+    __tablename__ = 'session_addons'
+    
+    session_id = db.Column(db.String(50), db.ForeignKey('sessions.id', ondelete='CASCADE'), primary_key=True)
+    position = db.Column(db.Integer, primary_key=True)
+    addon_id = db.Column(db.String(50), nullable=True)  # client-side id
+    name = db.Column(db.String(100), nullable=True, index=True)
+    price = db.Column(db.Float, nullable=False, default=0.0)
+    halo_code = db.Column(db.String(50), nullable=True)
+    
+    @classmethod
+    def from_dict(cls, data, position=0):
+        """Row for one uploaded add-on; a missing, null or non-numeric price is stored as 0"""
+        return cls(
+            position=position,
+            addon_id=data.get('id'),
+            name=data.get('name'),
+            price=_number(data.get('price')) or 0.0,
+            halo_code=data.get('haloCode'),
+        )
+    
+    def to_dict(self):
+        return _without_none({
+            'id': self.addon_id,
+            'name': self.name,
+            'price': self.price,
+            'haloCode': self.halo_code,
+        })
+    
+    def __repr__(self):
+        return f'<SessionAddon {self.name} for {self.session_id}>'
+
+class DailyRollup(db.Model):
+    """Per-day, per-location session totals, maintained on every session write"""
+    __tablename__ = 'daily_rollups'
+    __table_args__ = (
+        db.Index('ix_daily_rollups_location_date', 'location', 'date'),
+    )
+    
+    date = db.Column(db.Date, primary_key=True)
+    location = db.Column(db.String(50), primary_key=True)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    service_earnings = db.Column(db.Float, nullable=False, default=0.0)
+    addon_earnings = db.Column(db.Float, nullable=False, default=0.0)
+    tips = db.Column(db.Float, nullable=False, default=0.0)
+    review_count = db.Column(db.Integer, nullable=False, default=0)
+    
+    @property
+    def total_earnings(self):
+        return self.service_earnings + self.addon_earnings + self.tips
+    
+    def to_dict(self):
+        return {
+            'date': self.date.isoformat(),
+            'location': self.location,
+            'sessionCount': self.session_count,
+            'serviceEarnings': self.service_earnings,
+            'addonEarnings': self.addon_earnings,
+            'tips': self.tips,
+            'reviewCount': self.review_count,
+            'totalEarnings': self.total_earnings,
+        }
+    
+    def __repr__(self):
+        return f'<DailyRollup {self.date} {self.location}: {self.session_count} sessions>'
+
+class SchemaVersion(db.Model):
+    """Schema migrations applied to this database (see migrations.py)"""
+    __tablename__ = 'schema_version'
+    
+    version = db.Column(db.Integer, primary_key=True)
+    applied_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<SchemaVersion {self.version}>'
+
+class TableGeneration(db.Model):
+    """Per-table write counter, bumped in every transaction that writes the table"""
+    __tablename__ = 'table_generations'
+    
+    name = db.Column(db.String(50), primary_key=True)
+    generation = db.Column(db.Integer, nullable=False, default=0)
+    changed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    def __repr__(self):
+        return f'<TableGeneration {self.name}={self.generation}>'
+
+class SessionTombstone(db.Model):
+    """Records deleted session ids so delta syncs can propagate deletes"""
+    __tablename__ = 'session_tombstones'
+    
+    session_id = db.Column(db.String(50), primary_key=True)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'id': self.session_id,
+            'deletedAt': self.deleted_at.isoformat(),
+        }
+    
+    def __repr__(self):
+        return f'<SessionTombstone {self.session_id} at {self.deleted_at}>'
+
 class ClosedDate(db.Model):
     """Tracks which dates have been closed out"""
     __tablename__ = 'closed_dates'
+    __table_args__ = (
+        db.Index('ix_closed_dates_is_closed_date', 'is_closed', 'date'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     date = db.Column(db.Date, nullable=False, unique=True, index=True)
@@ -87,6 +358,10 @@ class ClosedDate(db.Model):
 class SyncLog(db.Model):
     """Tracks sync events between devices"""
     __tablename__ = 'sync_logs'
+    __table_args__ = (
+        # Latest sync of one device without scanning its history
+        db.Index('ix_sync_logs_device_timestamp', 'device_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     device_id = db.Column(db.String(100), nullable=False, index=True)
@@ -104,3 +379,57 @@ class SyncLog(db.Model):
     
     def __repr__(self):
         return f'<SyncLog {self.device_id} - {self.action} at {self.timestamp}>'
+
+class SyncLogDaily(db.Model):
+    """Per-device daily totals of sync logs older than the retention window"""
+    __tablename__ = 'sync_log_daily'
+    __table_args__ = (
+        db.Index('ix_sync_log_daily_device_last_sync', 'device_id', 'last_sync_at'),
+    )
+    
+    device_id = db.Column(db.String(100), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    action = db.Column(db.String(50), primary_key=True)
+    sync_count = db.Column(db.Integer, nullable=False, default=0)
+    session_count = db.Column(db.Integer, nullable=False, default=0)
+    first_sync_at = db.Column(db.DateTime, nullable=False)
+    last_sync_at = db.Column(db.DateTime, nullable=False, index=True)
+    
+    def to_dict(self):
+        return {
+            'deviceId': self.device_id,
+            'date': self.date.isoformat(),
+            'action': self.action,
+            'syncCount': self.sync_count,
+            'sessionCount': self.session_count,
+            'firstSyncAt': self.first_sync_at.isoformat(),
+            'lastSyncAt': self.last_sync_at.isoformat(),
+        }
+    
+    def __repr__(self):
+        return f'<SyncLogDaily {self.device_id} {self.date} {self.action}: {self.sync_count} syncs>'
+
+class ChangeEvent(db.Model):
+    """One committed change to a session or closed date; the id is the resume token"""
+    __tablename__ = 'change_events'
+    # Never reuse the id of a pruned event
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(20), nullable=False)  # 'session', 'closedDate'
+    key = db.Column(db.String(50), nullable=False)  # session id or YYYY-MM-DD
+    op = db.Column(db.String(20), nullable=False)  # 'create', 'update', 'delete', 'close', 'reopen'
+    updated_at = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow, index=True)
+    
+    def to_dict(self):
+        return {
+            'token': str(self.id),
+            'type': self.kind,
+            'op': self.op,
+            'sessionId' if self.kind == 'session' else 'date': self.key,
+            'updatedAt': self.updated_at.isoformat(),
+        }
+    
+    def __repr__(self):
+        return f'<ChangeEvent {self.id} {self.kind} {self.key} {self.op}>'
@@ -0,0 +1,126 @@
+"""Query-plan regression check for the API routes.
+
+Drives every route through the Flask test client against a seeded SQLite
+database, records each SELECT/UPDATE/DELETE the routes issue, and runs
+EXPLAIN QUERY PLAN on it. A statement with a WHERE clause whose plan reads
+a table with a bare full scan (no index) fails the check. Unfiltered reads,
+like a full listing, are expected to scan and are ignored.
+
+Usage:
+    python query_plans.py          # exits 1 if any route query full-scans
+"""
+import re
+import sys
+
+from sqlalchemy import event
+
+from app import create_app
+from models import db
+
+# Representative calls covering each route and its query-param variants
+ROUTE_CALLS = [
+    ('POST', '/api/sessions', {
+        'id': 'plan-1', 'location': 'halo', 'date': '2026-02-17',
+        'services': [{'type': 'massage', 'rate': 60, 'duration': 60}],
+        'addOns': [{'name': 'hot stones', 'price': 10}], 'tips': 5,
+    }),
+    ('POST', '/api/sync', {'deviceId': 'plan', 'sessions': [
+        {'id': f'plan-sync-{i}', 'location': 'soul-bridge', 'date': f'2026-02-{10 + i}',
+         'services': [{'type': 'deep-tissue', 'rate': 90, 'duration': 60}], 'tips': i}
+        for i in range(5)
+    ]}),
+    ('GET', '/api/sessions', None),
+    ('GET', '/api/sessions?location=halo', None),
+    ('GET', '/api/sessions?startDate=2026-02-01&endDate=2026-02-28', None),
+    ('GET', '/api/sessions?location=halo&startDate=2026-02-01&endDate=2026-02-28', None),
+    ('GET', '/api/sessions?serviceType=massage', None),
+    ('GET', '/api/sessions?limit=2', None),
+    ('GET', '/api/sessions?stream=ndjson', None),
+    ('GET', '/api/sessions/2026-02-17', None),
+    ('PUT', '/api/sessions/plan-1', {'tips': 7, 'date': '2026-02-18'}),
+    ('DELETE', '/api/sessions/plan-sync-0', None),
+    ('POST', '/api/closed-dates/2026-02-17', None),
+    ('GET', '/api/closed-dates', None),
+    ('GET', '/api/closed-dates?from=2026-02-01&to=2026-02-28', None),
+    ('DELETE', '/api/closed-dates/2026-02-17', None),
+    ('POST', '/api/batch', {'operations': [
+        {'op': 'update_session', 'id': 'plan-1', 'data': {'tips': 8}},
+        {'op': 'delete_session', 'id': 'plan-sync-1'},
+        {'op': 'close_date', 'date': '2026-02-18'},
+    ]}),
+    ('POST', '/api/sync', {'deviceId': 'plan', 'since': '2026-01-01T00:00:00', 'sessions': []}),
+    ('POST', '/api/sync', {'deviceId': 'plan', 'since': '1', 'sessions': []}),
+    ('GET', '/api/sync-status', None),
+    ('GET', '/api/changes?after=1', None),
+    ('GET', '/api/sync-status?deviceId=plan', None),
+    ('GET', '/api/stats', None),
+    ('GET', '/api/stats?location=halo&startDate=2026-02-01&endDate=2026-02-28', None),
+]
+
+FULL_SCAN = re.compile(r'\bSCAN (\w+)(?! USING)')
+
+def capture_statements(app):
+    """Run ROUTE_CALLS and return (route, sql, params) for every statement they issue"""
+    captured = []
+    current = {'route': None}
+    
+    def record(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'UPDATE', 'DELETE')) and not executemany:
+            captured.append((current['route'], statement, parameters))
+    
+    with app.app_context():
+        event.listen(db.engine, 'before_cursor_execute', record)
+    
+    client = app.test_client()
+    try:
+        for method, url, body in ROUTE_CALLS:
+            current['route'] = f'{method} {url}'
+            response = client.open(url, method=method, json=body)
+            response.get_data()
+            if response.status_code >= 400:
+                raise RuntimeError(f'{method} {url} returned {response.status_code}')
+    finally:
+        with app.app_context():
+            event.remove(db.engine, 'before_cursor_execute', record)
+    
+    return captured
+
+def find_full_scans(app, captured):
+    """EXPLAIN each filtered statement and return the ones that full-scan a table"""
+    failures = []
+    with app.app_context():
+        connection = db.engine.raw_connection()
+        try:
+            cursor = connection.cursor()
+            for route, statement, parameters in captured:
+                if not re.search(r'\bWHERE\b', statement, re.IGNORECASE):
+                    continue
+                plan = cursor.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+                details = [row[-1] for row in plan]
+                scans = [d for d in details if FULL_SCAN.search(d)]
+                if scans:
+                    failures.append((route, ' '.join(statement.split()), details))
+        finally:
+            connection.close()
+    return failures
+
+def main():
+    app = create_app('testing')
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            print('Query-plan check runs against SQLite only')
+            return 2
+    
+    captured = capture_statements(app)
+    failures = find_full_scans(app, captured)
+    
+    print(f'Checked {len(captured)} statements from {len(ROUTE_CALLS)} route calls')
+    for route, statement, details in failures:
+        print(f'\nFULL SCAN in {route}\n  {statement}')
+        for detail in details:
+            print(f'    {detail}')
+    
+    return 1 if failures else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,106 @@
+"""Maintenance of the daily_rollups table.
+
+Any flush that adds, changes or deletes a Session records the (date,
+location) days it touched, including the old day when a session moves.
+Just before the transaction commits those days are recomputed from the
+sessions table, so rollups are always updated in the same transaction as
+the sessions they summarize and no route has to remember to do it.
+
+Two transactions refreshing the same day must not interleave, or one could
+delete and re-insert rows computed without the other's sessions. SQLite
+already serializes writers. On PostgreSQL each day is locked with a
+transaction-scoped advisory lock before its sessions are aggregated, so the
+second writer waits and then aggregates (READ COMMITTED) the first one's
+committed sessions as well.
+"""
+from sqlalchemy import ARRAY, bindparam, event, func, inspect, text
+
+from models import db, Session, DailyRollup
+
+PENDING_KEY = 'pending_rollup_dates'
+DATE_BATCH_SIZE = 500
+# First key of the two-key advisory locks taken on PostgreSQL ('roll')
+LOCK_NAMESPACE = 0x726F6C6C
+
+# Locks are taken in ascending date order so two writers cannot deadlock
+_LOCK_DATES = text(
+    'SELECT pg_advisory_xact_lock(:namespace, day) '
+    'FROM (SELECT day FROM unnest(:days) AS day ORDER BY day) AS days'
+).bindparams(bindparam('days', type_=ARRAY(db.Integer)))
+
+def _rollup_rows(session, dates=None):
+    """Aggregate sessions into rollup rows, optionally limited to some dates"""
+    query = session.query(
+        Session.date,
+        Session.location,
+        func.count(Session.id),
+        func.sum(Session.service_earnings),
+        func.sum(Session.addon_earnings),
+        func.sum(Session.tips),
+        func.sum(db.case((Session.has_client_review, 1), else_=0)),
+    )
+    if dates is not None:
+        query = query.filter(Session.date.in_(dates))
+    
+    return [
+        {
+            'date': row_date,
+            'location': location,
+            'session_count': count,
+            'service_earnings': service_total or 0.0,
+            'addon_earnings': addon_total or 0.0,
+            'tips': tips_total or 0.0,
+            'review_count': review_total or 0,
+        }
+        for row_date, location, count, service_total, addon_total, tips_total, review_total
+        in query.group_by(Session.date, Session.location)
+    ]
+
+def _lock_dates(session, dates):
+    """Hold a per-day lock until the transaction ends (PostgreSQL; SQLite writers are already serialized)"""
+    if session.get_bind(mapper=inspect(DailyRollup)).dialect.name != 'postgresql':
+        return
+    session.execute(_LOCK_DATES, {'namespace': LOCK_NAMESPACE, 'days': [d.toordinal() for d in dates]})
+
+def refresh_dates(session, dates):
+    """Recompute the rollups for the given dates from the sessions table"""
+    dates = sorted(dates)
+    for start in range(0, len(dates), DATE_BATCH_SIZE):
+        batch = dates[start:start + DATE_BATCH_SIZE]
+        _lock_dates(session, batch)
+        rows = _rollup_rows(session, batch)
+        session.query(DailyRollup).filter(DailyRollup.date.in_(batch)).delete(synchronize_session=False)
+        if rows:
+            session.execute(DailyRollup.__table__.insert(), rows)
+
+def rebuild(session):
+    """Recompute every rollup from scratch"""
+    session.query(DailyRollup).delete(synchronize_session=False)
+    rows = _rollup_rows(session)
+    if rows:
+        session.execute(DailyRollup.__table__.insert(), rows)
+
+def _touched_dates(obj):
+    """Current and previous dates of a Session being written"""
+    dates = {obj.date}
+    dates.update(inspect(obj).attrs.date.history.deleted)
+    return {d for d in dates if d is not None}
+
+@event.listens_for(db.session, 'before_flush')
+def _collect_touched_dates(session, flush_context, instances):
+    pending = session.info.setdefault(PENDING_KEY, set())
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Session):
+            pending.update(_touched_dates(obj))
+
+@event.listens_for(db.session, 'before_commit')
+def _refresh_touched_dates(session):
+    # Flush outstanding session writes first so every touched date is recorded
+    session.flush()
+    pending = session.info.pop(PENDING_KEY, None)
+    if pending:
+        refresh_dates(session, pending)
+
+@event.listens_for(db.session, 'after_soft_rollback')
+def _discard_touched_dates(session, previous_transaction):
+    session.info.pop(PENDING_KEY, None)
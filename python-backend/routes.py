@@ -1,33 +1,153 @@
-from flask import Blueprint, jsonify, request
-from datetime import datetime, date
-from sqlalchemy import and_, or_
+from flask import Blueprint, Response, current_app, jsonify, request, send_file, stream_with_context
+from datetime import datetime
+from sqlalchemy import and_, func, or_
+import base64
+import binascii
 
-from models import db, Session, ClosedDate, SyncLog
+from models import (
+    db, Session, SessionService, SessionAddon, SessionTombstone, ClosedDate, SyncLog, DailyRollup,
+    calculate_content_hash,
+)
+from cache import cached, memoize
+from database import read_replica
+from etags import conditional
+import changes
+import closed_dates
+import exports
+import metrics
+import sync_logs
+import uploads
+from serializers import dumps, encode_session_rows, iter_session_documents, json_body, json_response, session_rows
 
 api_bp = Blueprint('api', __name__)
 
 # ===== SESSION ENDPOINTS =====
 
-@api_bp.route('/sessions', methods=['GET'])
-def get_sessions():
-    """Get all sessions, optionally filtered by date range"""
+def _apply_session_filters(query, model=Session):
+    """Apply the startDate/endDate/location query params to a query over sessions or rollups"""
     start_date = request.args.get('startDate')
     end_date = request.args.get('endDate')
     location = request.args.get('location')
     
-    query = Session.query
-    
     if start_date:
-        query = query.filter(Session.date >= start_date)
+        query = query.filter(model.date >= start_date)
     if end_date:
-        query = query.filter(Session.date <= end_date)
+        query = query.filter(model.date <= end_date)
     if location:
-        query = query.filter(Session.location == location)
+        query = query.filter(model.location == location)
+    
+    return query
+
+def _filtered_session_query():
+    """Build a session query from the startDate/endDate/location/serviceType query params"""
+    query = _apply_session_filters(Session.query)
+    
+    service_type = request.args.get('serviceType')
+    if service_type:
+        query = query.filter(Session.id.in_(
+            db.session.query(SessionService.session_id).filter(SessionService.type == service_type)
+        ))
+    
+    return query
+
+def _encode_cursor(session):
+    """Encode the (date, id) keyset position of a session as an opaque cursor"""
+    raw = f'{session.date.isoformat()}|{session.id}'.encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def _decode_cursor(cursor):
+    """Decode a cursor back into a (date, id) tuple, raising ValueError if malformed"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        date_part, session_id = base64.urlsafe_b64decode(padded).decode('utf-8').split('|', 1)
+        return datetime.strptime(date_part, '%Y-%m-%d').date(), session_id
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise ValueError('Invalid cursor')
+
+def _stream_sessions(query, fmt):
+    """Stream a session query as NDJSON or a JSON array using a server-side cursor"""
+    batch_size = current_app.config['SESSIONS_STREAM_BATCH_SIZE']
+    
+    def generate():
+        if fmt == 'json':
+            yield b'['
+        first = True
+        for body in iter_session_documents(query, batch_size):
+            if fmt == 'json':
+                yield body if first else b',' + body
+            else:
+                yield body + b'\n'
+            first = False
+        if fmt == 'json':
+            yield b']'
+    
+    mimetype = 'application/json' if fmt == 'json' else 'application/x-ndjson'
+    return Response(stream_with_context(generate()), mimetype=mimetype)
+
+@api_bp.route('/sessions', methods=['GET'])
+@read_replica
+@conditional('sessions')
+@cached('sessions')
+def get_sessions():
+    """Get all sessions, optionally filtered by date range
+    
+    Passing `limit` and/or `cursor` switches to keyset pagination over
+    (date, id) and wraps the page as {'sessions': [...], 'nextCursor': ...}.
+    Passing `stream=ndjson` or `stream=json` streams the rows instead.
+    """
+    limit = request.args.get('limit')
+    cursor = request.args.get('cursor')
+    stream = request.args.get('stream')
+    
+    if stream and stream not in ('ndjson', 'json'):
+        return jsonify({'error': 'Invalid stream format. Use ndjson or json'}), 400
+    
+    query = _filtered_session_query()
     
-    sessions = query.order_by(Session.date.desc()).all()
-    return jsonify([s.to_dict() for s in sessions])
+    if cursor:
+        try:
+            cursor_date, cursor_id = _decode_cursor(cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        query = query.filter(or_(
+            Session.date < cursor_date,
+            and_(Session.date == cursor_date, Session.id < cursor_id),
+        ))
+    
+    query = query.order_by(Session.date.desc(), Session.id.desc())
+    
+    paginate = limit is not None or cursor is not None
+    if paginate:
+        try:
+            limit = int(limit) if limit is not None else current_app.config['SESSIONS_PAGE_SIZE']
+        except ValueError:
+            return jsonify({'error': 'limit must be an integer'}), 400
+        if limit < 1:
+            return jsonify({'error': 'limit must be positive'}), 400
+        limit = min(limit, current_app.config['SESSIONS_MAX_PAGE_SIZE'])
+    
+    if stream:
+        if paginate:
+            query = query.limit(limit)
+        return _stream_sessions(query, stream)
+    
+    if not paginate:
+        return json_response(encode_session_rows(session_rows(query)))
+    
+    # Fetch one extra row to know whether another page exists
+    rows = session_rows(query.limit(limit + 1))
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    
+    return json_response(json_body(
+        {'nextCursor': _encode_cursor(rows[-1]) if has_more else None},
+        sessions=encode_session_rows(rows),
+    ))
 
 @api_bp.route('/sessions/<date_str>', methods=['GET'])
+@read_replica
+@conditional('sessions')
+@cached('sessions')
 def get_sessions_by_date(date_str):
     """Get all sessions for a specific date"""
     try:
@@ -35,26 +155,62 @@ def get_sessions_by_date(date_str):
     except ValueError:
         return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
     
-    sessions = Session.query.filter(Session.date == target_date).order_by(Session.id.desc()).all()
-    return jsonify([s.to_dict() for s in sessions])
+    query = Session.query.filter(Session.date == target_date).order_by(Session.id.desc())
+    return json_response(encode_session_rows(session_rows(query)))
 
-@api_bp.route('/sessions', methods=['POST'])
-def create_session():
-    """Create a new session"""
-    data = request.get_json()
+class OperationError(Exception):
+    """A write operation rejected with an error message and HTTP status"""
     
+    def __init__(self, error, status=400):
+        super().__init__(error)
+        self.error = error
+        self.status = status
+
+def _parse_date(date_str):
+    try:
+        return datetime.strptime(date_str, '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise OperationError('Invalid date format. Use YYYY-MM-DD')
+
+# Numeric fields of uploaded services and add-ons; each may also be null or absent
+SERVICE_AMOUNTS = ('duration', 'rate', 'haloBasePrice')
+ADDON_AMOUNTS = ('price',)
+
+def _check_items(services, addons):
+    """Raise ValueError unless services and add-ons are lists of objects with numeric amounts"""
+    for name, items, amounts in (('services', services, SERVICE_AMOUNTS), ('addOns', addons, ADDON_AMOUNTS)):
+        if not isinstance(items, list):
+            raise ValueError(f'{name} must be a list')
+        for position, item in enumerate(items):
+            if not isinstance(item, dict):
+                raise ValueError(f'{name}[{position}] must be an object')
+            for field in amounts:
+                value = item.get(field)
+                if value is not None and (isinstance(value, bool) or not isinstance(value, (int, float))):
+                    raise ValueError(f'{name}[{position}].{field} must be a number')
+
+def _ensure_open(*days):
+    """Reject a session write that touches a closed day"""
+    for day in sorted(set(days)):
+        if closed_dates.is_range_closed(day):
+            raise OperationError(f'{day.isoformat()} is closed; reopen it to edit its sessions', 409)
+
+def _create_session(data):
+    """Add a new session to the current transaction"""
     if not data or not all(k in data for k in ['id', 'location', 'date']):
-        return jsonify({'error': 'Missing required fields'}), 400
+        raise OperationError('Missing required fields')
     
     # Check if session already exists
     existing = Session.query.filter_by(id=data['id']).first()
     if existing:
-        return jsonify({'error': 'Session already exists'}), 409
+        raise OperationError('Session already exists', 409)
     
+    target_date = _parse_date(data['date'])
     try:
-        target_date = datetime.strptime(data['date'], '%Y-%m-%d').date()
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        _check_items(data.get('services', []), data.get('addOns', []))
+    except ValueError as e:
+        raise OperationError(str(e))
+    _ensure_open(target_date)
     
     session = Session(
         id=data['id'],
@@ -69,24 +225,25 @@ def create_session():
     )
     
     db.session.add(session)
-    db.session.commit()
-    
-    return jsonify(session.to_dict()), 201
+    SessionTombstone.query.filter_by(session_id=session.id).delete()
+    return session
 
-@api_bp.route('/sessions/<session_id>', methods=['PUT'])
-def update_session(session_id):
-    """Update an existing session"""
+def _update_session(session_id, data):
+    """Apply a partial update to a session in the current transaction"""
     session = Session.query.filter_by(id=session_id).first()
     if not session:
-        return jsonify({'error': 'Session not found'}), 404
+        raise OperationError('Session not found', 404)
     
-    data = request.get_json()
+    # Moving a session needs both its current and its new day open
+    new_date = _parse_date(data['date']) if 'date' in data else session.date
+    try:
+        _check_items(data.get('services', []), data.get('addOns', []))
+    except ValueError as e:
+        raise OperationError(str(e))
+    _ensure_open(session.date, new_date)
     
     if 'date' in data:
-        try:
-            session.date = datetime.strptime(data['date'], '%Y-%m-%d').date()
-        except ValueError:
-            return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        session.date = new_date
     
     if 'location' in data:
         session.location = data['location']
@@ -102,37 +259,73 @@ def update_session(session_id):
         session.rating = data['rating']
     if 'hasClientReview' in data:
         session.has_client_review = data['hasClientReview']
+    return session
+
+def _delete_session(session_id):
+    """Delete a session and record its tombstone in the current transaction"""
+    session = Session.query.filter_by(id=session_id).first()
+    if not session:
+        raise OperationError('Session not found', 404)
+    _ensure_open(session.date)
+    
+    db.session.delete(session)
+    db.session.merge(SessionTombstone(session_id=session_id, deleted_at=datetime.utcnow()))
+
+@api_bp.route('/sessions', methods=['POST'])
+def create_session():
+    """Create a new session"""
+    try:
+        session = _create_session(request.get_json())
+    except OperationError as e:
+        return jsonify({'error': e.error}), e.status
+    
+    db.session.commit()
+    return json_response(session.document_json.encode('utf-8'), 201)
+
+@api_bp.route('/sessions/<session_id>', methods=['PUT'])
+def update_session(session_id):
+    """Update an existing session"""
+    try:
+        session = _update_session(session_id, request.get_json())
+    except OperationError as e:
+        return jsonify({'error': e.error}), e.status
     
     db.session.commit()
-    return jsonify(session.to_dict())
+    return json_response(session.document_json.encode('utf-8'))
 
 @api_bp.route('/sessions/<session_id>', methods=['DELETE'])
 def delete_session(session_id):
     """Delete a session"""
-    session = Session.query.filter_by(id=session_id).first()
-    if not session:
-        return jsonify({'error': 'Session not found'}), 404
+    try:
+        _delete_session(session_id)
+    except OperationError as e:
+        return jsonify({'error': e.error}), e.status
     
-    db.session.delete(session)
     db.session.commit()
-    
     return '', 204
 
 # ===== CLOSED DATES ENDPOINTS =====
 
 @api_bp.route('/closed-dates', methods=['GET'])
+@read_replica
+@conditional('closed_dates')
 def get_closed_dates():
-    """Get all closed dates"""
-    closed_dates = ClosedDate.query.filter_by(is_closed=True).all()
-    return jsonify({d.date.isoformat(): True for d in closed_dates})
-
-@api_bp.route('/closed-dates/<date_str>', methods=['POST'])
-def close_date(date_str):
-    """Close a date"""
+    """Get closed dates, optionally limited to `from`..`to` (inclusive, YYYY-MM-DD)
+    
+    Answered from the in-process closed date set; the table is only read
+    again after a close or reopen.
+    """
     try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        start = _parse_date(request.args['from']) if request.args.get('from') else None
+        end = _parse_date(request.args['to']) if request.args.get('to') else None
+    except OperationError as e:
+        return jsonify({'error': e.error}), e.status
+    
+    return jsonify({d.isoformat(): True for d in closed_dates.get_closed_set().between(start, end, fresh=True)})
+
+def _close_date(date_str):
+    """Mark a date closed in the current transaction"""
+    target_date = _parse_date(date_str)
     
     closed_date = ClosedDate.query.filter_by(date=target_date).first()
     if not closed_date:
@@ -141,6 +334,26 @@ def close_date(date_str):
     else:
         closed_date.is_closed = True
         closed_date.closed_at = datetime.utcnow()
+    return closed_date
+
+def _reopen_date(date_str):
+    """Reopen a closed date in the current transaction"""
+    target_date = _parse_date(date_str)
+    
+    closed_date = ClosedDate.query.filter_by(date=target_date).first()
+    if not closed_date:
+        raise OperationError('Date not found', 404)
+    
+    closed_date.is_closed = False
+    return closed_date
+
+@api_bp.route('/closed-dates/<date_str>', methods=['POST'])
+def close_date(date_str):
+    """Close a date"""
+    try:
+        closed_date = _close_date(date_str)
+    except OperationError as e:
+        return jsonify({'error': e.error}), e.status
     
     db.session.commit()
     return jsonify(closed_date.to_dict()), 201
@@ -149,23 +362,375 @@ def close_date(date_str):
 def reopen_date(date_str):
     """Reopen a date"""
     try:
-        target_date = datetime.strptime(date_str, '%Y-%m-%d').date()
-    except ValueError:
-        return jsonify({'error': 'Invalid date format. Use YYYY-MM-DD'}), 400
+        closed_date = _reopen_date(date_str)
+    except OperationError as e:
+        return jsonify({'error': e.error}), e.status
     
-    closed_date = ClosedDate.query.filter_by(date=target_date).first()
-    if closed_date:
-        closed_date.is_closed = False
-        db.session.commit()
-        return jsonify(closed_date.to_dict())
+    db.session.commit()
+    return jsonify(closed_date.to_dict())
+
+# ===== BATCH ENDPOINT =====
+
+# op name -> (handler, required operation fields, HTTP status on success)
+BATCH_OPERATIONS = {
+    'create_session': (lambda op: _create_session(op['data']), ('data',), 201),
+    'update_session': (lambda op: _update_session(op['id'], op['data']), ('id', 'data'), 200),
+    'delete_session': (lambda op: _delete_session(op['id']), ('id',), 204),
+    'close_date': (lambda op: _close_date(op['date']), ('date',), 201),
+    'reopen_date': (lambda op: _reopen_date(op['date']), ('date',), 200),
+}
+
+def _run_batch_operation(op):
+    if not isinstance(op, dict) or op.get('op') not in BATCH_OPERATIONS:
+        raise OperationError(f"Unknown operation. Use one of: {', '.join(BATCH_OPERATIONS)}")
+    handler, fields, status = BATCH_OPERATIONS[op['op']]
+    missing = [field for field in fields if op.get(field) is None]
+    if missing:
+        raise OperationError(f"Missing required fields: {', '.join(missing)}")
+    if 'data' in fields and not isinstance(op['data'], dict):
+        raise OperationError('data must be an object')
+    return handler(op), status
+
+@api_bp.route('/batch', methods=['POST'])
+def run_batch():
+    """Apply an ordered list of session and closed-date operations in one transaction"""
+    data = request.get_json()
+    operations = data.get('operations') if isinstance(data, dict) else None
+    if not isinstance(operations, list):
+        return jsonify({'error': 'operations must be a list'}), 400
+    max_operations = current_app.config['BATCH_MAX_OPERATIONS']
+    if len(operations) > max_operations:
+        return jsonify({'error': f'At most {max_operations} operations per batch'}), 400
+    
+    results = []
+    for index, op in enumerate(operations):
+        try:
+            obj, status = _run_batch_operation(op)
+        except OperationError as e:
+            # All or nothing: one failed operation discards the whole batch
+            db.session.rollback()
+            return jsonify({
+                'error': e.error,
+                'index': index,
+                'results': [{'index': result['index'], 'status': result['status']} for result in results]
+                + [{'index': index, 'status': e.status, 'error': e.error}],
+            }), e.status
+        # Flush and serialize now, so each result shows the row as this
+        # operation left it rather than as a later operation in the batch did
+        db.session.flush()
+        results.append({'index': index, 'status': status, 'result': obj.to_dict() if obj is not None else None})
+    
+    db.session.commit()
+    
+    return jsonify({'status': 'success', 'results': results})
+
+# ===== EXPORT ENDPOINTS =====
+
+def _export_status(job):
+    status = {
+        'id': job['id'],
+        'status': job['status'],
+        'format': job['params']['format'],
+        'rows': job['rows'],
+        'error': job['error'],
+        'submittedAt': job['submittedAt'],
+        'finishedAt': job['finishedAt'],
+    }
+    if job['status'] == 'done':
+        status['downloadUrl'] = f"{request.script_root}/api/exports/{job['id']}/download"
+    return status
+
+@api_bp.route('/exports', methods=['POST'])
+def submit_export():
+    """Start a background export of sessions as CSV, XLSX or PDF"""
+    try:
+        params = exports.parse_params(request.get_json(silent=True) or {})
+    except exports.ExportError as e:
+        return jsonify({'error': str(e)}), 400
     
-    return jsonify({'error': 'Date not found'}), 404
+    job = exports.get_runner().submit(params)
+    return jsonify(_export_status(job)), 200 if job['status'] == 'done' else 202
+
+@api_bp.route('/exports/<job_id>', methods=['GET'])
+def get_export(job_id):
+    """Poll the status of an export job"""
+    job = exports.get_runner().get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export not found'}), 404
+    return jsonify(_export_status(job))
+
+@api_bp.route('/exports/<job_id>/download', methods=['GET'])
+def download_export(job_id):
+    """Download a finished export"""
+    runner = exports.get_runner()
+    job = runner.get(job_id)
+    if job is None:
+        return jsonify({'error': 'Export not found'}), 404
+    if job['status'] != 'done':
+        return jsonify({'error': 'Export is not ready', 'status': job['status']}), 409
+    
+    fmt = job['params']['format']
+    try:
+        return send_file(
+            runner.path(job),
+            as_attachment=True,
+            download_name=f'earnings_{job_id[:8]}.{fmt}',
+            max_age=3600,
+        )
+    except FileNotFoundError:
+        # Pruned after the job was looked up
+        return jsonify({'error': 'Export has expired. Start it again'}), 410
 
 # ===== SYNC ENDPOINTS =====
 
+def _parse_sync_row(session_data):
+    """Validate one uploaded session and return its column values, raising ValueError if invalid"""
+    if not isinstance(session_data, dict):
+        raise ValueError('Session must be an object')
+    if not session_data.get('id'):
+        raise ValueError('Missing id')
+    if not session_data.get('location'):
+        raise ValueError('Missing location')
+    
+    try:
+        target_date = datetime.strptime(session_data.get('date', ''), '%Y-%m-%d').date()
+    except (TypeError, ValueError):
+        raise ValueError('Invalid date format. Use YYYY-MM-DD')
+    
+    try:
+        tips = float(session_data.get('tips', 0))
+    except (TypeError, ValueError):
+        raise ValueError('tips must be a number')
+    
+    _check_items(session_data.get('services', []), session_data.get('addOns', []))
+    
+    return {
+        'id': str(session_data['id']),
+        'location': session_data['location'],
+        'date': target_date,
+        'services': session_data.get('services', []),
+        'addons': session_data.get('addOns', []),
+        'tips': tips,
+        'review': session_data.get('review'),
+        'rating': session_data.get('rating'),
+        'has_client_review': session_data.get('hasClientReview', False),
+    }
+
+def _upsert_session_batch(rows):
+    """Upsert a batch of parsed sessions, skipping rows whose content hash is unchanged
+    
+    Changed rows that would write to a closed day, whether the day they
+    move to or the day they are on now, are rejected like the single-item
+    endpoints reject them. Returns (rows skipped as unchanged, {id: error}
+    for the rejected rows).
+    """
+    metrics.SYNC_BATCH_ROWS.observe(len(rows))
+    ids = [row['id'] for row in rows]
+    stored_hashes = dict(db.session.query(Session.id, Session.content_hash).filter(Session.id.in_(ids)))
+    changed = [
+        row for row in rows
+        if row['id'] not in stored_hashes or stored_hashes[row['id']] != calculate_content_hash(row)
+    ]
+    changed_ids = [row['id'] for row in changed if row['id'] in stored_hashes]
+    existing = {s.id: s for s in Session.query.filter(Session.id.in_(changed_ids))} if changed_ids else {}
+    
+    new_ids = []
+    rejected = {}
+    for row in changed:
+        session = existing.get(row['id'])
+        try:
+            _ensure_open(row['date'], *([session.date] if session else []))
+        except OperationError as e:
+            rejected[row['id']] = e.error
+            continue
+        if session:
+            session.location = row['location']
+            session.services = row['services']
+            session.addons = row['addons']
+            session.tips = row['tips']
+            session.review = row['review']
+            session.rating = row['rating']
+            session.has_client_review = row['has_client_review']
+            session.date = row['date']
+        else:
+            db.session.add(Session(**row))
+            new_ids.append(row['id'])
+    
+    if new_ids:
+        SessionTombstone.query.filter(
+            SessionTombstone.session_id.in_(new_ids)
+        ).delete(synchronize_session=False)
+    
+    db.session.flush()
+    return len(rows) - len(changed), rejected
+
+@api_bp.route('/sync/preflight', methods=['POST'])
+def sync_preflight():
+    """Tell a device which of its sessions the server needs
+    
+    The device sends `{"sessions": [{"id": ..., "hash": ...}]}` with the
+    content hash of each local session; the response lists the ids whose
+    hash is unknown or different, so only those need to be uploaded.
+    """
+    data = request.get_json()
+    if not data or not isinstance(data.get('sessions'), list):
+        return jsonify({'error': 'Missing sessions data'}), 400
+    
+    pairs = {}
+    for entry in data['sessions']:
+        if isinstance(entry, dict) and entry.get('id'):
+            pairs[str(entry['id'])] = entry.get('hash')
+    
+    batch_size = current_app.config['SYNC_BATCH_SIZE']
+    ids = list(pairs)
+    stored_hashes = {}
+    for start in range(0, len(ids), batch_size):
+        stored_hashes.update(db.session.query(Session.id, Session.content_hash).filter(
+            Session.id.in_(ids[start:start + batch_size])
+        ))
+    
+    needed = [session_id for session_id, content_hash in pairs.items()
+              if content_hash is None or stored_hashes.get(session_id) != content_hash]
+    return jsonify({'needed': needed, 'unchanged': len(pairs) - len(needed)})
+
+def _parse_since(value):
+    """Split a `since` value into (change token, legacy timestamp); ValueError if it is neither"""
+    if value in (None, ''):
+        return None, None
+    if isinstance(value, int) or (isinstance(value, str) and value.isdigit()):
+        return changes.parse_token(value), None
+    if not isinstance(value, str):
+        raise ValueError(value)
+    # Watermarks issued before change tokens were ISO timestamps
+    return None, datetime.fromisoformat(value)
+
+def _sync_ndjson_upload():
+    """Stream an NDJSON upload into the database in committed chunks
+    
+    Each line of the body is one session; `deviceId` and `since` come from
+    the query string. Every SYNC_BATCH_SIZE sessions are upserted and
+    committed, and the response streams one NDJSON progress line per chunk
+    followed by a final `done` line, so memory stays bounded by the chunk
+    size and an interrupted upload can resume after the last `processed`
+    count it saw. The `done` line carries no watermark: it returns none of
+    the changes made by other devices, so the device keeps its previous
+    watermark and fetches them with a regular sync.
+    """
+    device_id = request.args.get('deviceId', 'unknown')
+    since = request.args.get('since') or None
+    try:
+        _parse_since(since)
+    except ValueError:
+        return jsonify({'error': 'Invalid since watermark. Send back the watermark of the last sync'}), 400
+    
+    try:
+        reader = uploads.open_upload(request.stream, request.headers.get('Content-Encoding'))
+    except uploads.UploadError as e:
+        return jsonify({'error': str(e)}), 415
+    
+    batch_size = current_app.config['SYNC_BATCH_SIZE']
+    max_line_bytes = current_app.config['SYNC_MAX_LINE_BYTES']
+    
+    def generate():
+        totals = {'processed': 0, 'synced': 0, 'unchanged': 0, 'errorCount': 0}
+        batch = {}
+        # id -> line index of the row kept in `batch`
+        indexes = {}
+        errors = []
+        
+        def commit_chunk(read):
+            rows = list(batch.values())
+            batch.clear()
+            unchanged, rejected = _upsert_session_batch(rows) if rows else (0, {})
+            db.session.commit()
+            metrics.SYNC_UNCHANGED_ROWS.inc(amount=unchanged)
+            errors.extend({'index': indexes[session_id], 'id': session_id, 'error': error}
+                          for session_id, error in rejected.items())
+            indexes.clear()
+            totals['processed'] = read
+            totals['synced'] += len(rows) - unchanged - len(rejected)
+            totals['unchanged'] += unchanged
+            totals['errorCount'] += len(errors)
+            line = dumps({'type': 'progress', **totals, 'errors': errors}) + b'\n'
+            errors.clear()
+            return line
+        
+        read = 0
+        try:
+            for index, (session_data, error) in enumerate(uploads.iter_ndjson(reader, max_line_bytes)):
+                read = index + 1
+                if error is None:
+                    try:
+                        fields = _parse_sync_row(session_data)
+                    except ValueError as e:
+                        error = str(e)
+                if error is not None:
+                    errors.append({
+                        'index': index,
+                        'id': session_data.get('id') if isinstance(session_data, dict) else None,
+                        'error': error,
+                    })
+                else:
+                    # Later duplicates of an id win, within and across chunks
+                    batch.pop(fields['id'], None)
+                    batch[fields['id']] = fields
+                    indexes[fields['id']] = index
+                if len(batch) >= batch_size:
+                    yield commit_chunk(read)
+        except uploads.UploadError as e:
+            # Everything up to the last progress line is committed; `processed` is where to resume
+            db.session.rollback()
+            yield dumps({'type': 'error', 'error': str(e), **totals}) + b'\n'
+            return
+        
+        metrics.SYNC_REQUEST_ROWS.observe(read)
+        if batch or errors:
+            yield commit_chunk(read)
+        
+        sync_log = SyncLog(
+            device_id=device_id,
+            action='sync' if since else 'upload',
+            session_count=totals['synced'],
+            timestamp=datetime.utcnow(),
+        )
+        db.session.add(sync_log)
+        db.session.commit()
+        sync_logs.maybe_compact()
+        yield dumps({
+            'type': 'done',
+            'status': 'success',
+            **totals,
+            'since': since,
+        }) + b'\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+def _changed_session_rows(ids, batch_size):
+    """Session rows for the given ids, in the order of the ids; ids with no session are left out"""
+    rows = {}
+    for start in range(0, len(ids), batch_size):
+        rows.update((row.id, row) for row in session_rows(
+            Session.query.filter(Session.id.in_(ids[start:start + batch_size]))
+        ))
+    return [rows[session_id] for session_id in ids if session_id in rows]
+
 @api_bp.route('/sync', methods=['POST'])
 def sync_sessions():
-    """Sync sessions from device"""
+    """Sync sessions from device
+    
+    The `watermark` is a change event token (see changes.py): every event up
+    to it is committed, so ids are commit-ordered even when transactions
+    finish out of order. If the device sends it back as `since`, only the
+    sessions changed after it are returned, plus tombstones for sessions
+    deleted after it. Without `since`, or with a token older than the change
+    log, the full table is returned.
+    
+    NDJSON uploads (optionally gzip/zstd compressed) are handled by
+    _sync_ndjson_upload() instead.
+    """
+    if request.mimetype in uploads.NDJSON_MIMETYPES:
+        return _sync_ndjson_upload()
+    
     data = request.get_json()
     
     if not data or 'sessions' not in data:
@@ -174,106 +739,250 @@ def sync_sessions():
     device_id = data.get('deviceId', 'unknown')
     sessions_data = data['sessions']
     
-    # Upsert sessions
-    for session_data in sessions_data:
-        existing = Session.query.filter_by(id=session_data['id']).first()
-        
+    try:
+        since_token, since_time = _parse_since(data.get('since'))
+    except ValueError:
+        return jsonify({'error': 'Invalid since watermark. Send back the watermark of the last sync'}), 400
+    since = since_token is not None or since_time is not None
+    
+    # Validate every row up front; later duplicates of an id win
+    valid_rows = {}
+    indexes = {}
+    errors = []
+    for index, session_data in enumerate(sessions_data):
         try:
-            target_date = datetime.strptime(session_data['date'], '%Y-%m-%d').date()
-        except ValueError:
+            fields = _parse_sync_row(session_data)
+        except ValueError as e:
+            errors.append({
+                'index': index,
+                'id': session_data.get('id') if isinstance(session_data, dict) else None,
+                'error': str(e),
+            })
             continue
-        
-        if existing:
-            existing.services = session_data.get('services', [])
-            existing.addons = session_data.get('addOns', [])
-            existing.tips = float(session_data.get('tips', 0))
-            existing.review = session_data.get('review')
-            existing.rating = session_data.get('rating')
-            existing.has_client_review = session_data.get('hasClientReview', False)
-            existing.date = target_date
-        else:
-            session = Session(
-                id=session_data['id'],
-                location=session_data['location'],
-                date=target_date,
-                services=session_data.get('services', []),
-                addons=session_data.get('addOns', []),
-                tips=float(session_data.get('tips', 0)),
-                review=session_data.get('review'),
-                rating=session_data.get('rating'),
-                has_client_review=session_data.get('hasClientReview', False),
-            )
-            db.session.add(session)
-    
-    # Log sync
+        valid_rows.pop(fields['id'], None)
+        valid_rows[fields['id']] = fields
+        indexes[fields['id']] = index
+    
+    metrics.SYNC_REQUEST_ROWS.observe(len(sessions_data))
+    
+    # Upsert sessions
+    batch_size = current_app.config['SYNC_BATCH_SIZE']
+    rows = list(valid_rows.values())
+    unchanged = 0
+    rejected = {}
+    for start in range(0, len(rows), batch_size):
+        batch_unchanged, batch_rejected = _upsert_session_batch(rows[start:start + batch_size])
+        unchanged += batch_unchanged
+        rejected.update(batch_rejected)
+    metrics.SYNC_UNCHANGED_ROWS.inc(amount=unchanged)
+    synced = len(rows) - unchanged - len(rejected)
+    errors.extend({'index': indexes[session_id], 'id': session_id, 'error': error}
+                  for session_id, error in rejected.items())
+    errors.sort(key=lambda error: error['index'])
+    
     sync_log = SyncLog(
         device_id=device_id,
-        action='upload',
-        session_count=len(sessions_data)
+        action='sync' if since else 'upload',
+        session_count=synced,
+        timestamp=datetime.utcnow(),
     )
     db.session.add(sync_log)
     db.session.commit()
+    sync_logs.maybe_compact()
     
-    # Return all sessions
-    all_sessions = Session.query.order_by(Session.date.desc()).all()
-    return jsonify({
+    response = {
         'status': 'success',
-        'synced': len(sessions_data),
-        'sessions': [s.to_dict() for s in all_sessions]
-    })
+        'synced': synced,
+        'unchanged': unchanged,
+        'errors': errors,
+    }
+    if since_token is not None and (since_token > changes.latest_token() or changes.is_expired(since_token)):
+        # Unknown or pruned token; the device has to start over from the full table
+        response['reset'] = True
+        since_token = None
+    
+    # Taken before reading sessions, so nothing at or below it can be missing from the response
+    watermark = changes.settled_token(since_token or 0)
+    response['watermark'] = str(watermark)
+    
+    if since_token is not None:
+        changed_ids, deleted = changes.session_changes(since_token, watermark)
+        response['since'] = str(since_token)
+        response['deleted'] = deleted
+        changed = _changed_session_rows(changed_ids, batch_size)
+        return json_response(json_body(response, sessions=encode_session_rows(changed)))
+    
+    if since_time is None:
+        # Return all sessions
+        all_sessions = session_rows(Session.query.order_by(Session.date.desc()))
+        return json_response(json_body(response, sessions=encode_session_rows(all_sessions)))
+    
+    # A timestamp watermark from before change tokens: everything updated after it
+    changed = session_rows(Session.query.filter(Session.updated_at > since_time).order_by(Session.updated_at))
+    deleted = SessionTombstone.query.filter(
+        SessionTombstone.deleted_at > since_time
+    ).order_by(SessionTombstone.deleted_at).all()
+    
+    response['since'] = since_time.isoformat()
+    response['deleted'] = [t.to_dict() for t in deleted]
+    return json_response(json_body(response, sessions=encode_session_rows(changed)))
+
+def _encode_sessions_by_date():
+    """`totalSessions` and `sessionsByDate` as pre-encoded JSON, separated by a newline"""
+    session_count_by_date = db.session.query(
+        DailyRollup.date,
+        db.func.sum(DailyRollup.session_count)
+    ).group_by(DailyRollup.date).order_by(DailyRollup.date).all()
+    return (
+        dumps(sum(c for _, c in session_count_by_date)) + b'\n'
+        + dumps({d.isoformat(): c for d, c in session_count_by_date})
+    )
 
 @api_bp.route('/sync-status', methods=['GET'])
+@read_replica
+@conditional('sessions', 'sync_logs')
 def get_sync_status():
-    """Get sync statistics"""
-    total_sessions = Session.query.count()
-    session_count_by_date = db.session.query(
-        Session.date,
-        db.func.count(Session.id)
-    ).group_by(Session.date).all()
-    
+    """Get sync statistics
+    
+    The sessions-per-date summary is built from the daily rollups once and
+    kept in the response cache until a session write invalidates it, so a
+    poll costs a cache hit plus one index lookup for `lastSync`. Pass
+    `deviceId` to get that device's last sync instead of the latest overall.
+    """
+    device_id = request.args.get('deviceId') or None
+    summary = memoize('sync-status|sessionsByDate', 'sessions', _encode_sessions_by_date)
+    total, by_date = summary.split(b'\n', 1)
+    
+    last = sync_logs.last_sync(device_id)
+    envelope = {'lastSync': last.isoformat() if last else None}
+    if device_id:
+        envelope['deviceId'] = device_id
+    return json_response(json_body(envelope, totalSessions=total, sessionsByDate=by_date))
+
+# ===== CHANGE EVENTS =====
+
+@api_bp.route('/changes', methods=['GET'])
+def get_changes():
+    """Replay the change events after a resume token (`after`), oldest first
+    
+    Without `after` no events are returned, only the current token to start
+    from. A token whose events were already pruned gets 410; run a full sync
+    and continue from the returned token.
+    """
+    try:
+        after = changes.parse_token(request.args.get('after'))
+        limit = min(int(request.args.get('limit', current_app.config['CHANGES_BATCH_SIZE'])),
+                    current_app.config['CHANGES_BATCH_SIZE'])
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    if after is None:
+        return jsonify({'events': [], 'token': str(changes.latest_token())})
+    if changes.is_expired(after):
+        return jsonify({'error': 'Resume token expired; run a full sync', 'token': str(changes.latest_token())}), 410
+    
+    events = changes.read_events(after, max(limit, 1))
     return jsonify({
-        'totalSessions': total_sessions,
-        'sessionsByDate': {str(d): c for d, c in session_count_by_date},
-        'lastSync': None,
+        'events': [change.to_dict() for change in events],
+        'token': str(events[-1].id if events else after),
     })
 
+@api_bp.route('/changes/stream', methods=['GET'])
+def stream_changes():
+    """Push change events as server-sent events
+    
+    Resumes after the `Last-Event-ID` header (sent by EventSource on
+    reconnect) or the `after` query arg; otherwise starts at the newest event.
+    """
+    try:
+        after = changes.parse_token(request.headers.get('Last-Event-ID') or request.args.get('after'))
+    except changes.TokenError as e:
+        return jsonify({'error': str(e)}), 400
+    
+    return Response(
+        stream_with_context(changes.stream(after)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'},
+    )
+
 # ===== STATS ENDPOINTS =====
 
 @api_bp.route('/stats', methods=['GET'])
+@read_replica
+@conditional('sessions')
+@cached('sessions')
 def get_stats():
-    """Get earnings statistics"""
-    start_date = request.args.get('startDate')
-    end_date = request.args.get('endDate')
-    location = request.args.get('location')
-    
-    query = Session.query
-    
-    if start_date:
-        query = query.filter(Session.date >= start_date)
-    if end_date:
-        query = query.filter(Session.date <= end_date)
-    if location:
-        query = query.filter(Session.location == location)
-    
-    sessions = query.all()
+    """Get earnings statistics
+    
+    Per-location and per-date totals are read from the daily_rollups table;
+    per-service-type and per-add-on sums are grouped in SQL over the
+    session_services and session_addons tables.
+    """
+    groups = _apply_session_filters(db.session.query(
+        DailyRollup.location,
+        DailyRollup.date,
+        DailyRollup.session_count,
+        DailyRollup.service_earnings,
+        DailyRollup.addon_earnings,
+        DailyRollup.tips,
+        DailyRollup.review_count,
+    ), DailyRollup).all()
     
     stats = {
-        'totalSessions': len(sessions),
-        'totalEarnings': sum(float(s.tips) for s in sessions),
+        'totalSessions': 0,
+        'totalEarnings': 0.0,
+        'serviceEarnings': 0.0,
+        'addonEarnings': 0.0,
+        'totalTips': 0.0,
+        'reviewCount': 0,
         'sessionsByLocation': {},
+        'earningsByLocation': {},
         'sessionsByDate': {},
+        'earningsByDate': {},
+        'servicesByType': {},
+        'addonsByName': {},
     }
     
-    for session in sessions:
-        # By location
-        if session.location not in stats['sessionsByLocation']:
-            stats['sessionsByLocation'][session.location] = 0
-        stats['sessionsByLocation'][session.location] += 1
+    for location, session_date, count, service_total, addon_total, tips_total, reviews in groups:
+        earnings = service_total + addon_total + tips_total
+        date_key = session_date.isoformat()
+        
+        stats['totalSessions'] += count
+        stats['totalEarnings'] += earnings
+        stats['serviceEarnings'] += service_total
+        stats['addonEarnings'] += addon_total
+        stats['totalTips'] += tips_total
+        stats['reviewCount'] += reviews
         
-        # By date
-        date_key = session.date.isoformat()
-        if date_key not in stats['sessionsByDate']:
-            stats['sessionsByDate'][date_key] = 0
-        stats['sessionsByDate'][date_key] += 1
+        stats['sessionsByLocation'][location] = stats['sessionsByLocation'].get(location, 0) + count
+        stats['earningsByLocation'][location] = stats['earningsByLocation'].get(location, 0.0) + earnings
+        stats['sessionsByDate'][date_key] = stats['sessionsByDate'].get(date_key, 0) + count
+        stats['earningsByDate'][date_key] = stats['earningsByDate'].get(date_key, 0.0) + earnings
+    
+    by_type = _apply_session_filters(db.session.query(
+        SessionService.type,
+        func.count(),
+        func.sum(SessionService.duration),
+        func.sum(SessionService.rate / 60 * SessionService.duration),
+    ).join(Session, Session.id == SessionService.session_id)).group_by(SessionService.type).all()
+    
+    for type_name, count, minutes, earnings in by_type:
+        stats['servicesByType'][type_name or 'unknown'] = {
+            'count': count,
+            'minutes': minutes or 0,
+            'earnings': earnings or 0.0,
+        }
+    
+    by_addon = _apply_session_filters(db.session.query(
+        SessionAddon.name,
+        func.count(),
+        func.sum(SessionAddon.price),
+    ).join(Session, Session.id == SessionAddon.session_id)).group_by(SessionAddon.name).all()
+    
+    for addon_name, count, revenue in by_addon:
+        stats['addonsByName'][addon_name or 'unknown'] = {
+            'count': count,
+            'revenue': revenue or 0.0,
+        }
     
     return jsonify(stats)
@@ -0,0 +1,176 @@
+"""Fast JSON encoding for API responses.
+
+orjson is used when it is installed and the stdlib encoder otherwise.
+Every session write pre-renders the session's API document into
+sessions.document_json, so listings select that column with the listing's
+own filters and ordering and splice the stored documents into the response
+body, with no per-row decode or encode.
+"""
+from datetime import date, datetime
+import json
+
+from flask import current_app
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy import event
+
+from models import db, Session
+
+try:
+    import orjson
+    HAS_ORJSON = True
+except ImportError:
+    HAS_ORJSON = False
+
+# Sessions rendered per query for rows without document_json
+RENDER_BATCH_SIZE = 500
+
+def _default(obj):
+    if isinstance(obj, (date, datetime)):
+        return obj.isoformat()
+    raise TypeError(f'Object of type {type(obj).__name__} is not JSON serializable')
+
+def dumps(obj):
+    """Encode an object as compact JSON bytes"""
+    if HAS_ORJSON:
+        return orjson.dumps(obj, default=_default)
+    return json.dumps(obj, separators=(',', ':'), default=_default).encode('utf-8')
+
+class FastJSONProvider(DefaultJSONProvider):
+    """JSON provider that encodes with orjson and only pretty-prints when configured to"""
+    
+    def _pretty(self):
+        return bool(self._app.config.get('JSONIFY_PRETTYPRINT_REGULAR'))
+    
+    def dumps(self, obj, **kwargs):
+        if HAS_ORJSON and not kwargs:
+            return orjson.dumps(obj, default=_default).decode('utf-8')
+        return super().dumps(obj, **kwargs)
+    
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if self._pretty():
+            body = json.dumps(obj, indent=2, default=_default).encode('utf-8')
+        else:
+            body = dumps(obj)
+        return self._app.response_class(body + b'\n', mimetype=self.mimetype)
+
+# Listing rows: the keyset position plus the pre-rendered document
+SESSION_COLUMNS = (
+    Session.id,
+    Session.date,
+    Session.document_json,
+)
+
+# Columns a document is rendered from for rows written before document_json existed
+DOCUMENT_SOURCE_COLUMNS = (
+    Session.id,
+    Session.location,
+    Session.date,
+    Session.services_json,
+    Session.addons_json,
+    Session.tips,
+    Session.review,
+    Session.rating,
+    Session.has_client_review,
+)
+
+def _encode_document(session_id, location, session_date, services, addons, tips, review, rating, has_client_review):
+    """One session document matching Session.to_dict()"""
+    return b''.join((
+        b'{"id":', dumps(session_id),
+        b',"location":', dumps(location),
+        b',"date":"', session_date.isoformat().encode('ascii'),
+        b'","services":', dumps(services),
+        b',"addOns":', dumps(addons),
+        b',"tips":', dumps(tips),
+        b',"review":', dumps(review),
+        b',"rating":', dumps(rating),
+        b',"hasClientReview":', b'true' if has_client_review else b'false',
+        b'}',
+    ))
+
+# Values as the database hands them back (Float -> float, String -> str), so a
+# document rendered on write is byte-identical to one rendered from stored rows
+def _float(value):
+    try:
+        return float(value) if value is not None else None
+    except (TypeError, ValueError):
+        return value
+
+def _text(value):
+    return str(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+
+def _int(value):
+    return int(value) if isinstance(value, float) and value.is_integer() else value
+
+def render_document(fields):
+    """Pre-render a session document from its column values and uploaded services/add-ons
+    
+    `fields` has the keys of calculate_content_hash() plus `id`. Services and
+    add-ons are echoed as uploaded, with any extra keys and their original
+    number types, exactly as services_json and addons_json store them.
+    """
+    return _encode_document(
+        _text(fields['id']), fields['location'], fields['date'], fields['services'], fields['addons'],
+        _float(fields['tips'] or 0.0), fields['review'], _int(fields['rating']), bool(fields['has_client_review']),
+    ).decode('utf-8')
+
+@event.listens_for(Session, 'before_insert')
+@event.listens_for(Session, 'before_update')
+def _refresh_document(mapper, connection, target):
+    target.document_json = render_document(dict(target.content_fields(), id=target.id))
+
+def _render_stored(session_ids):
+    """Documents of sessions without document_json, built from their columns"""
+    documents = {}
+    for start in range(0, len(session_ids), RENDER_BATCH_SIZE):
+        batch = session_ids[start:start + RENDER_BATCH_SIZE]
+        rows = db.session.query(*DOCUMENT_SOURCE_COLUMNS).filter(Session.id.in_(batch))
+        for session_id, location, session_date, services_json, addons_json, tips, review, rating, has_client_review in rows:
+            documents[session_id] = _encode_document(
+                session_id, location, session_date, json.loads(services_json or '[]'), json.loads(addons_json or '[]'),
+                tips, review, rating, has_client_review,
+            )
+    return documents
+
+def encode_session_documents(rows):
+    """Encoded session documents for SESSION_COLUMNS rows, spliced from document_json"""
+    missing = [row.id for row in rows if row.document_json is None]
+    rendered = _render_stored(missing) if missing else {}
+    return [
+        row.document_json.encode('utf-8') if row.document_json is not None else rendered[row.id]
+        for row in rows
+    ]
+
+def encode_session_rows(rows):
+    """Encode session row tuples (SESSION_COLUMNS) as a JSON array"""
+    return b'[' + b','.join(encode_session_documents(rows)) + b']'
+
+def session_rows(query):
+    """Select SESSION_COLUMNS as tuples, keeping the query's filters, ordering and limit"""
+    return query.with_entities(*SESSION_COLUMNS).all()
+
+def iter_session_documents(query, batch_size):
+    """Yield encoded session documents, fetching rows through a server-side cursor in batches"""
+    batch = []
+    for row in query.with_entities(*SESSION_COLUMNS).yield_per(batch_size):
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield from encode_session_documents(batch)
+            batch = []
+    if batch:
+        yield from encode_session_documents(batch)
+
+def json_response(body, status=200):
+    """Wrap an already-encoded JSON body in a response"""
+    return current_app.response_class(body + b'\n', status=status, mimetype='application/json')
+
+def json_body(envelope=None, **arrays):
+    """Encode an envelope dict plus pre-encoded JSON values into one response body"""
+    body = dumps(envelope or {})
+    extra = b','.join(dumps(key) + b':' + value for key, value in arrays.items())
+    if not extra:
+        return body
+    if body == b'{}':
+        return b'{' + extra + b'}'
+    return body[:-1] + b',' + extra + b'}'
@@ -0,0 +1,112 @@
+"""Cold-start benchmark for the app factory.
+
+Starts a fresh Python process per run and measures, in that process, the
+time to import app.py, to run create_app() and to serve the first request.
+Runs against a database whose schema is already current (the usual restart)
+and against an empty one (first boot). Results are saved and compared like
+benchmark.py baselines.
+
+Usage:
+    python startup_benchmark.py --runs 20 --save benchmarks/startup.json
+    python startup_benchmark.py --runs 20 --compare benchmarks/startup.json
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+
+from benchmark import compare, percentile
+
+PROBE = '''
+import json, time
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+flask_app = app.create_app()
+created = time.perf_counter()
+response = flask_app.test_client().get('/api/sessions')
+responded = time.perf_counter()
+assert response.status_code == 200, response.status_code
+print(json.dumps({
+    'import': (imported - started) * 1000,
+    'create_app': (created - imported) * 1000,
+    'first_response': (responded - created) * 1000,
+    'total': (responded - started) * 1000,
+}))
+'''
+
+def probe(database_url, workdir):
+    """Run one cold start in a new interpreter and return its timings in ms"""
+    env = dict(os.environ, DATABASE_URL=database_url, FLASK_ENV='production',
+               EXPORT_DIR=os.path.join(workdir, 'exports'))
+    output = subprocess.run(
+        [sys.executable, '-c', PROBE], cwd=os.path.dirname(os.path.abspath(__file__)),
+        env=env, check=True, capture_output=True, text=True,
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+def summarize(samples):
+    samples = sorted(samples)
+    return {
+        'requests': len(samples),
+        'mean_ms': round(sum(samples) / len(samples), 3),
+        'p50_ms': round(percentile(samples, 50), 3),
+        'p95_ms': round(percentile(samples, 95), 3),
+        'p99_ms': round(percentile(samples, 99), 3),
+    }
+
+def run(runs):
+    workdir = tempfile.mkdtemp(prefix='earnings-startup-')
+    current_db = f"sqlite:///{os.path.join(workdir, 'current.db')}"
+    # The first start creates the schema; later starts find it current
+    probe(current_db, workdir)
+    
+    timings = {'current': [], 'fresh': []}
+    for i in range(runs):
+        timings['current'].append(probe(current_db, workdir))
+        timings['fresh'].append(probe(f"sqlite:///{os.path.join(workdir, f'fresh-{i}.db')}", workdir))
+    
+    scenarios = {}
+    for database, results in timings.items():
+        for phase in ('import', 'create_app', 'first_response', 'total'):
+            name = f'{database}_{phase}'
+            scenarios[name] = summarize([r[phase] for r in results])
+            print(f"{name:24} p50 {scenarios[name]['p50_ms']:>8.2f}ms  p95 {scenarios[name]['p95_ms']:>8.2f}ms")
+    return {
+        'runs': runs,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'recorded_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+        'scenarios': scenarios,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='cold starts per database state')
+    parser.add_argument('--save', metavar='PATH', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='PATH', help='compare against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.2, help='allowed p95 regression (0.2 = 20%%)')
+    args = parser.parse_args()
+    
+    current = run(args.runs)
+    
+    if args.save:
+        os.makedirs(os.path.dirname(os.path.abspath(args.save)), exist_ok=True)
+        with open(args.save, 'w') as f:
+            json.dump(current, f, indent=2)
+        print(f'Saved baseline to {args.save}')
+    
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.tolerance)
+        if regressions:
+            print(f"p95 regressed beyond {args.tolerance:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+if __name__ == '__main__':
+    main()
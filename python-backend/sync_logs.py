@@ -0,0 +1,105 @@
+"""Retention and last-sync lookups for the sync_logs table.
+
+Every sync appends a SyncLog row, so the table grows without bound. Logs
+older than SYNC_LOG_RETENTION_DAYS are folded into sync_log_daily, one row
+per device, day and action holding the sync and session counts, and then
+deleted. Compaction runs from the `compact-sync-logs` CLI command and, at
+most once per SYNC_LOG_COMPACT_INTERVAL per process, after a sync commits.
+
+last_sync() answers "when did this device last sync" with one index probe
+on sync_logs, falling back to the daily totals for devices idle longer than
+the retention window.
+"""
+from datetime import datetime, timedelta
+import threading
+import time
+
+from flask import current_app
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+
+from models import db, SyncLog, SyncLogDaily
+import etags
+
+_compaction_lock = threading.Lock()
+_last_compaction = {'at': None}
+
+def retention_cutoff(retention_days, now=None):
+    """Start of the oldest day kept in sync_logs; whole days are compacted at once"""
+    today = (now or datetime.utcnow()).date()
+    return datetime.combine(today - timedelta(days=retention_days), datetime.min.time())
+
+def compact(session, retention_days):
+    """Fold sync logs older than the retention window into sync_log_daily; returns the logs removed"""
+    cutoff = retention_cutoff(retention_days)
+    day = func.date(SyncLog.timestamp, type_=db.Date)
+    groups = session.query(
+        SyncLog.device_id,
+        day,
+        SyncLog.action,
+        func.count(SyncLog.id),
+        func.sum(SyncLog.session_count),
+        func.min(SyncLog.timestamp),
+        func.max(SyncLog.timestamp),
+    ).filter(SyncLog.timestamp < cutoff).group_by(SyncLog.device_id, day, SyncLog.action).all()
+    if not groups:
+        return 0
+    
+    removed = 0
+    for device_id, log_date, action, count, sessions, first_at, last_at in groups:
+        daily = session.get(SyncLogDaily, (device_id, log_date, action))
+        if daily is None:
+            session.add(SyncLogDaily(
+                device_id=device_id, date=log_date, action=action, sync_count=count,
+                session_count=sessions or 0, first_sync_at=first_at, last_sync_at=last_at,
+            ))
+        else:
+            # A day compacted before (e.g. retention was shortened) gains the remaining logs
+            daily.sync_count += count
+            daily.session_count += sessions or 0
+            daily.first_sync_at = min(daily.first_sync_at, first_at)
+            daily.last_sync_at = max(daily.last_sync_at, last_at)
+        removed += count
+    
+    session.query(SyncLog).filter(SyncLog.timestamp < cutoff).delete(synchronize_session=False)
+    # Bulk deletes bypass the flush hooks, so bump the generation here
+    etags.bump(session, {SyncLog.__tablename__})
+    return removed
+
+def maybe_compact():
+    """Run compact() if this process has not done so within SYNC_LOG_COMPACT_INTERVAL"""
+    retention_days = current_app.config.get('SYNC_LOG_RETENTION_DAYS')
+    if not retention_days:
+        return 0
+    now = time.monotonic()
+    with _compaction_lock:
+        last = _last_compaction['at']
+        if last is not None and now - last < current_app.config['SYNC_LOG_COMPACT_INTERVAL']:
+            return 0
+        _last_compaction['at'] = now
+    
+    try:
+        removed = compact(db.session, retention_days)
+        if removed:
+            db.session.commit()
+    except SQLAlchemyError:
+        # The sync that triggered this has already committed; retry next interval
+        db.session.rollback()
+        current_app.logger.exception('Sync log compaction failed')
+        return 0
+    return removed
+
+def last_sync(device_id=None):
+    """Timestamp of the latest sync, overall or for one device, or None"""
+    query = db.session.query(SyncLog.timestamp)
+    if device_id:
+        query = query.filter(SyncLog.device_id == device_id)
+    latest = query.order_by(SyncLog.timestamp.desc()).limit(1).scalar()
+    if latest is not None:
+        return latest
+    
+    # Only compacted history left for this device
+    query = db.session.query(SyncLogDaily.last_sync_at)
+    if device_id:
+        query = query.filter(SyncLogDaily.device_id == device_id)
+    return query.order_by(SyncLogDaily.last_sync_at.desc()).limit(1).scalar()
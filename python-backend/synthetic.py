@@ -0,0 +1,199 @@
+"""Deterministic synthetic session data for load testing.
+
+generate_sessions() yields Halo and Soul Bridge sessions shaped like the
+API's session documents; the same seed always produces the same sessions.
+load() bulk-inserts them into the configured database and rebuilds the
+daily rollups.
+
+Usage:
+    DATABASE_URL=sqlite:///bench.db python synthetic.py --rows 100000
+"""
+import argparse
+from datetime import date, datetime, timedelta
+import json
+import random
+import time
+
+from models import (
+    db, Session, SessionService, SessionAddon, calculate_service_earnings, calculate_addon_earnings,
+    calculate_content_hash,
+)
+from serializers import render_document
+import etags
+import rollups
+
+SIZES = {'10k': 10_000, '100k': 100_000, '1m': 1_000_000}
+
+START_DATE = date(2024, 1, 1)
+
+# Mirrors src/utils/haloPayroll.ts
+HALO_BASE_PRICING = {30: 30, 60: 50, 90: 70, 120: 95}
+HALO_SERVICE_TYPES = [('massage', 0.6), ('deep-tissue', 0.3), ('advanced-bodywork', 0.1)]
+HALO_ADDONS = [
+    ('advanced-bodywork', 'Advanced Bodywork', 12.50),
+    ('argon-eye', 'Argon Eye Treatment', 10.00),
+    ('balance-bomb', 'Balance Bomb', 5.00),
+    ('cupping', 'Cupping', 12.50),
+    ('deep-tissue', 'Deep Tissue / Sports / Lymphatic', 7.50),
+    ('dry-brushing-25', 'Dry Brushing ($25)', 25.00),
+    ('extra-15-min', 'Extra 15 Minutes', 12.50),
+    ('hot-salt-stones', 'Hot Salt Stones', 12.50),
+    ('peppermint-rosemary', 'Peppermint Rosemary Scalp & Foot', 10.00),
+    ('turmeric-face', 'Turmeric Face Oil', 10.00),
+    ('vetiver-guasha', 'Vetiver Guasha Treatment', 10.00),
+]
+
+SOUL_BRIDGE_SERVICE_TYPES = [('massage', 0.7), ('deep-tissue', 0.3)]
+SOUL_BRIDGE_ADDONS = [('Hot Stones', 15.0), ('Aromatherapy', 10.0), ('CBD Oil', 20.0)]
+
+REVIEWS = [
+    'Great session, very relaxing',
+    'Client asked to rebook next week',
+    'Focused on shoulders and lower back',
+    'Client loved the hot stones',
+    'Tight hamstrings, recommended stretching',
+]
+
+def _weighted(rng, choices):
+    return rng.choices([c for c, _ in choices], weights=[w for _, w in choices])[0]
+
+def _halo_session(rng):
+    services = []
+    for _ in range(rng.choices([1, 2], weights=[0.9, 0.1])[0]):
+        duration = rng.choices([30, 60, 90, 120], weights=[0.1, 0.5, 0.3, 0.1])[0]
+        price = HALO_BASE_PRICING[duration]
+        services.append({
+            'id': f'svc-{rng.getrandbits(32):08x}',
+            'type': _weighted(rng, HALO_SERVICE_TYPES),
+            'duration': duration,
+            'rate': price,
+            'haloBasePrice': price,
+        })
+    addons = [
+        {'id': f'addon-{rng.getrandbits(32):08x}', 'name': name, 'price': price, 'haloCode': code}
+        for code, name, price in rng.sample(HALO_ADDONS, rng.choices([0, 1, 2, 3], weights=[0.4, 0.35, 0.2, 0.05])[0])
+    ]
+    return services, addons, float(rng.choice([0, 0, 5, 10, 10, 15, 20, 25, 30]))
+
+def _soul_bridge_session(rng):
+    services = [{
+        'id': f'svc-{rng.getrandbits(32):08x}',
+        'type': _weighted(rng, SOUL_BRIDGE_SERVICE_TYPES),
+        'duration': rng.choices([60, 90, 120], weights=[0.6, 0.3, 0.1])[0],
+        'rate': float(rng.choice([75, 85, 95, 110, 120])),
+    }]
+    addons = [
+        {'id': f'addon-{rng.getrandbits(32):08x}', 'name': name, 'price': price}
+        for name, price in rng.sample(SOUL_BRIDGE_ADDONS, rng.choices([0, 1], weights=[0.7, 0.3])[0])
+    ]
+    return services, addons, float(rng.randint(0, 8) * 5)
+
+def generate_sessions(count, seed=0, days=1095, start_date=START_DATE):
+    """Yield `count` session documents spread over `days` days, deterministic for a seed"""
+    rng = random.Random(seed)
+    for i in range(count):
+        location = 'halo' if rng.random() < 0.6 else 'soul-bridge'
+        if location == 'halo':
+            services, addons, tips = _halo_session(rng)
+        else:
+            services, addons, tips = _soul_bridge_session(rng)
+        reviewed = rng.random() < 0.25
+        yield {
+            'id': f'synthetic-{seed}-{i:07d}',
+            'location': location,
+            'date': (start_date + timedelta(days=i * days // count)).isoformat(),
+            'services': services,
+            'addOns': addons,
+            'tips': tips,
+            'review': rng.choice(REVIEWS) if reviewed else None,
+            'rating': rng.choice([4, 5, 5, 5]) if reviewed else None,
+            'hasClientReview': location == 'halo' and rng.random() < 0.2,
+        }
+
+def _rows(documents, now):
+    sessions, services, addons = [], [], []
+    for doc in documents:
+        session_date = date.fromisoformat(doc['date'])
+        fields = {
+            'location': doc['location'], 'date': session_date, 'services': doc['services'],
+            'addons': doc['addOns'], 'tips': doc['tips'], 'review': doc['review'],
+            'rating': doc['rating'], 'has_client_review': doc['hasClientReview'],
+        }
+        sessions.append({
+            'id': doc['id'],
+            'location': doc['location'],
+            'date': session_date,
+            'services_json': json.dumps(doc['services']),
+            'addons_json': json.dumps(doc['addOns']),
+            'service_earnings': calculate_service_earnings(doc['services']),
+            'addon_earnings': calculate_addon_earnings(doc['addOns']),
+            'tips': doc['tips'],
+            'review': doc['review'],
+            'rating': doc['rating'],
+            'has_client_review': doc['hasClientReview'],
+            'content_hash': calculate_content_hash(fields),
+            'document_json': render_document(dict(fields, id=doc['id'])),
+            'created_at': now,
+            'updated_at': now,
+        })
+        for position, s in enumerate(doc['services']):
+            services.append({
+                'session_id': doc['id'], 'position': position, 'service_id': s.get('id'),
+                'type': s.get('type'), 'duration': s.get('duration'), 'rate': s.get('rate'),
+                'halo_base_price': s.get('haloBasePrice'),
+            })
+        for position, a in enumerate(doc['addOns']):
+            addons.append({
+                'session_id': doc['id'], 'position': position, 'addon_id': a.get('id'),
+                'name': a.get('name'), 'price': float(a.get('price', 0)), 'halo_code': a.get('haloCode'),
+            })
+    return sessions, services, addons
+
+def load(count, seed=0, days=1095, batch_size=10_000):
+    """Bulk-insert synthetic sessions into the app's database and rebuild the rollups"""
+    now = datetime.utcnow()
+    batch = []
+    for doc in generate_sessions(count, seed=seed, days=days):
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            _insert(batch, now)
+            batch = []
+    if batch:
+        _insert(batch, now)
+    rollups.rebuild(db.session)
+    etags.bump(db.session, {Session.__tablename__, SessionService.__tablename__, SessionAddon.__tablename__})
+    db.session.commit()
+
+def _insert(documents, now):
+    sessions, services, addons = _rows(documents, now)
+    db.session.execute(Session.__table__.insert(), sessions)
+    if services:
+        db.session.execute(SessionService.__table__.insert(), services)
+    if addons:
+        db.session.execute(SessionAddon.__table__.insert(), addons)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--rows', default='10k', help=f"number of sessions or one of {', '.join(SIZES)}")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--days', type=int, default=1095, help='number of days the sessions span')
+    parser.add_argument('--json', metavar='PATH', help='write the sessions to a JSON file instead of the database')
+    args = parser.parse_args()
+    count = SIZES.get(args.rows.lower()) or int(args.rows)
+    
+    started = time.perf_counter()
+    if args.json:
+        with open(args.json, 'w') as f:
+            json.dump(list(generate_sessions(count, seed=args.seed, days=args.days)), f)
+        print(f'Wrote {count} sessions to {args.json} in {time.perf_counter() - started:.1f}s')
+        return
+    
+    from app import create_app
+    app = create_app()
+    with app.app_context():
+        load(count, seed=args.seed, days=args.days)
+        print(f"Loaded {count} sessions into {app.config['SQLALCHEMY_DATABASE_URI']} "
+              f'in {time.perf_counter() - started:.1f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,41 @@
+"""Indexes and query plans the API routes rely on (see query_plans.py)"""
+import pytest
+from sqlalchemy import inspect
+
+from app import create_app
+from models import db
+import query_plans
+
+# (table, columns) of the composite indexes the route filters are built around
+EXPECTED_INDEXES = [
+    ('sessions', ['location', 'date']),
+    ('sessions', ['date', 'id']),
+    ('sessions', ['updated_at']),
+    ('daily_rollups', ['location', 'date']),
+    ('closed_dates', ['is_closed', 'date']),
+    ('sync_logs', ['device_id', 'timestamp']),
+]
+
+@pytest.fixture
+def app():
+    app = create_app('testing')
+    with app.app_context():
+        if db.engine.dialect.name != 'sqlite':
+            pytest.skip('Query plans are checked against SQLite only')
+    return app
+
+@pytest.mark.parametrize('table, columns', EXPECTED_INDEXES)
+def test_index_exists(app, table, columns):
+    with app.app_context():
+        indexed = [index['column_names'] for index in inspect(db.engine).get_indexes(table)]
+    assert columns in indexed
+
+def test_filtered_route_queries_use_an_index(app):
+    captured = query_plans.capture_statements(app)
+    assert captured
+    
+    failures = query_plans.find_full_scans(app, captured)
+    assert not failures, '\n'.join(
+        f'FULL SCAN in {route}: {statement}\n    ' + '\n    '.join(details)
+        for route, statement, details in failures
+    )
@@ -0,0 +1,71 @@
+"""Incremental decoding of compressed NDJSON uploads.
+
+Bodies are decompressed and split into lines as they are read from the
+request stream, so memory use depends on the longest line rather than the
+size of the upload.
+"""
+import gzip
+import json
+import zlib
+
+# Errors raised by a reader on a corrupt or truncated body
+DECODE_ERRORS = (OSError, EOFError, zlib.error)
+
+try:
+    import zstandard
+    HAS_ZSTANDARD = True
+    DECODE_ERRORS += (zstandard.ZstdError,)
+except ImportError:
+    HAS_ZSTANDARD = False
+
+NDJSON_MIMETYPES = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+class UploadError(ValueError):
+    """An upload body that cannot be decoded"""
+
+def supported_encodings():
+    encodings = ['identity', 'gzip']
+    if HAS_ZSTANDARD:
+        encodings.append('zstd')
+    return encodings
+
+def open_upload(stream, content_encoding=None):
+    """Wrap a request stream in a reader that decompresses it on the fly"""
+    encoding = (content_encoding or 'identity').strip().lower()
+    if encoding == 'identity':
+        return stream
+    if encoding in ('gzip', 'x-gzip'):
+        return gzip.GzipFile(fileobj=stream, mode='rb')
+    if encoding == 'zstd' and HAS_ZSTANDARD:
+        return zstandard.ZstdDecompressor().stream_reader(stream, read_across_frames=True)
+    raise UploadError(f"Unsupported Content-Encoding: {encoding}. Use one of: {', '.join(supported_encodings())}")
+
+def _readlines(reader, max_line_bytes, chunk_size=65536):
+    """Yield the lines of a binary reader, rejecting any longer than max_line_bytes"""
+    pending = b''
+    while True:
+        try:
+            chunk = reader.read(chunk_size)
+        except DECODE_ERRORS as e:
+            raise UploadError(f'Could not decompress upload: {e}')
+        if not chunk:
+            break
+        pending += chunk
+        *lines, pending = pending.split(b'\n')
+        yield from lines
+        if len(pending) > max_line_bytes:
+            raise UploadError(f'Line longer than {max_line_bytes} bytes')
+    if pending:
+        yield pending
+
+def iter_ndjson(reader, max_line_bytes):
+    """Yield each non-empty line of an NDJSON body as (decoded value, error message)"""
+    for line in _readlines(reader, max_line_bytes):
+        if len(line) > max_line_bytes:
+            raise UploadError(f'Line longer than {max_line_bytes} bytes')
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line), None
+        except ValueError:
+            yield None, 'Invalid JSON'
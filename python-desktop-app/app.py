@@ -9,6 +9,8 @@ from pathlib import Path
 from datetime import datetime, timedelta
 from typing import List, Dict
 
+import numpy as np
+
 from PyQt6.QtWidgets import (
     QApplication, QMainWindow, QWidget, QVBoxLayout, QHBoxLayout,
     QTabWidget, QTableWidget, QTableWidgetItem, QPushButton, QLabel,
@@ -20,10 +22,14 @@ from PyQt6.QtGui import QColor, QFont, QIcon
 from PyQt6.QtChart import QChart, QChartView, QBarSeries, QBarSet, QBarCategoryAxis, QValueAxis
 from PyQt6.QtCore import Qt as QtCore
 
+# Shared with the analysis scripts; installed from ../python-scripts (see requirements.txt)
+from earnings_engine import EarningsEngine
+
 class EarningsTrackerApp(QMainWindow):
     def __init__(self):
         super().__init__()
         self.sessions = []
+        self.engine = EarningsEngine.from_sessions([])
         
         self.setWindowTitle("Earnings Tracker Desktop")
         self.setGeometry(100, 100, 1200, 800)
@@ -265,6 +271,7 @@ class EarningsTrackerApp(QMainWindow):
             try:
                 with open(backups[0], 'r') as f:
                     self.sessions = json.load(f)
+                self.engine = EarningsEngine.from_sessions(self.sessions)
                 self.status_bar.showMessage(f"Loaded {len(self.sessions)} sessions from {backups[0].name}")
                 self.update_dashboard()
                 self.refresh_sessions_table()
@@ -285,6 +292,7 @@ class EarningsTrackerApp(QMainWindow):
             try:
                 with open(file_path, 'r') as f:
                     self.sessions = json.load(f)
+                self.engine = EarningsEngine.from_sessions(self.sessions)
                 self.status_bar.showMessage(f"Loaded {len(self.sessions)} sessions")
                 self.update_dashboard()
                 self.refresh_sessions_table()
@@ -301,24 +309,15 @@ class EarningsTrackerApp(QMainWindow):
             self.total_tips_label.setText("Total Tips: $0.00")
             return
         
-        total_earnings = 0.0
-        total_tips = 0.0
-        
-        for session in self.sessions:
-            for service in session.get('services', []):
-                if 'rate' in service and 'duration' in service:
-                    total_earnings += (service['rate'] / 60) * service['duration']
-            
-            for addon in session.get('addOns', []):
-                total_earnings += addon.get('price', 0)
-            
-            total_tips += session.get('tips', 0)
+        totals = self.engine.totals()
+        total_earnings = totals['earnings']
+        total_tips = totals['tips']
         
         self.total_earnings_label.setText(f"Total Earnings: ${total_earnings:.2f}")
         self.total_sessions_label.setText(f"Total Sessions: {len(self.sessions)}")
         
         if self.sessions:
-            avg = (total_earnings + total_tips) / len(self.sessions)
+            avg = totals['gross'] / len(self.sessions)
             self.avg_per_session_label.setText(f"Average/Session: ${avg:.2f}")
         
         self.total_tips_label.setText(f"Total Tips: ${total_tips:.2f}")
@@ -327,7 +326,14 @@ class EarningsTrackerApp(QMainWindow):
         """Refresh sessions table"""
         self.sessions_table.setRowCount(0)
         
-        for session in sorted(self.sessions, key=lambda x: x.get('date', ''), reverse=True):
+        service_earnings = self.engine.service_earnings.tolist()
+        addon_totals = self.engine.addon_total.tolist()
+        tip_amounts = self.engine.tips.tolist()
+        gross = self.engine.gross.tolist()
+        
+        # Newest first; sessions on the same date keep their order
+        for i in np.argsort(-self.engine.date_ordinal, kind='stable').tolist():
+            session = self.sessions[i]
             row = self.sessions_table.rowCount()
             self.sessions_table.insertRow(row)
             
@@ -335,14 +341,10 @@ class EarningsTrackerApp(QMainWindow):
             location = session.get('location', '')
             services = ", ".join([s.get('type', '') for s in session.get('services', [])])
             
-            earnings = 0.0
-            for service in session.get('services', []):
-                if 'rate' in service and 'duration' in service:
-                    earnings += (service['rate'] / 60) * service['duration']
-            
-            tips = session.get('tips', 0)
-            addons_total = sum(a.get('price', 0) for a in session.get('addOns', []))
-            total = earnings + addons_total + tips
+            earnings = service_earnings[i]
+            tips = tip_amounts[i]
+            addons_total = addon_totals[i]
+            total = gross[i]
             
             self.sessions_table.setItem(row, 0, QTableWidgetItem(date))
             self.sessions_table.setItem(row, 1, QTableWidgetItem(location))
@@ -406,11 +408,12 @@ class EarningsTrackerApp(QMainWindow):
         
         self.analytics_table.setRowCount(0)
         
+        by_location = self.engine.count_by('location')
         metrics = [
             ("Total Sessions", str(len(self.sessions))),
-            ("Unique Dates", str(len(set(s.get('date', '') for s in self.sessions)))),
-            ("Halo Sessions", str(len([s for s in self.sessions if s.get('location') == 'halo']))),
-            ("Soul Bridge Sessions", str(len([s for s in self.sessions if s.get('location') == 'soul-bridge']))),
+            ("Unique Dates", str(len(self.engine.dates))),
+            ("Halo Sessions", str(by_location.get('halo', 0))),
+            ("Soul Bridge Sessions", str(by_location.get('soul-bridge', 0))),
         ]
         
         for metric, value in metrics:
@@ -0,0 +1,69 @@
+"""
+Summary Report Benchmark
+Times EarningsAnalyzer.generate_summary_report on synthetic sessions and
+checks that the whole report makes one pass over the session dicts and
+computes each shared aggregate once
+
+Usage:
+    python benchmark_analyzer.py --sessions 1000000
+"""
+
+import argparse
+import time
+from collections import Counter
+
+from benchmark_engine import make_sessions
+from data_analyzer import EarningsAnalyzer
+from earnings_engine import EarningsEngine
+
+class CountingList(list):
+    """A session list that counts how often it is iterated"""
+    passes = 0
+    
+    def __iter__(self):
+        self.passes += 1
+        return super().__iter__()
+
+def count_aggregations(engine: EarningsEngine) -> Counter:
+    """Wrap the engine's aggregate methods to count their calls"""
+    calls = Counter()
+    for name in ('totals', 'group_totals', 'service_counts', 'addon_revenue'):
+        method = getattr(engine, name)
+        
+        def counted(*args, _name=name, _method=method):
+            calls[(_name,) + args] += 1
+            return _method(*args)
+        
+        setattr(engine, name, counted)
+    return calls
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1_000_000, help='number of synthetic sessions')
+    args = parser.parse_args()
+    
+    sessions = CountingList(make_sessions(args.sessions))
+    analyzer = EarningsAnalyzer(sessions)
+    
+    started = time.perf_counter()
+    engine = analyzer.engine
+    built = time.perf_counter()
+    calls = count_aggregations(engine)
+    first = analyzer.generate_summary_report()
+    reported = time.perf_counter()
+    second = analyzer.generate_summary_report()
+    repeated = time.perf_counter()
+    
+    assert sessions.passes == 1, f'{sessions.passes} passes over the sessions'
+    assert first == second
+    repeats = {call: count for call, count in calls.items() if count > 1}
+    assert not repeats, f'aggregates computed more than once: {repeats}'
+    
+    print(f"{args.sessions} sessions, {sessions.passes} pass over the session dicts")
+    print(f"  aggregates:       {', '.join(' '.join(call) for call in sorted(calls))}")
+    print(f"  engine build:     {(built - started) * 1000:>10.1f}ms")
+    print(f"  first report:     {(reported - built) * 1000:>10.1f}ms")
+    print(f"  repeated report:  {(repeated - reported) * 1000:>10.1f}ms")
+
+if __name__ == '__main__':
+    main()
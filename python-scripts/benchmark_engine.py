@@ -0,0 +1,121 @@
+"""
+Earnings Engine Benchmark
+Times the per-dict loops the scripts used to run against the columnar engine
+on synthetic sessions, and checks that both give the same totals
+
+Usage:
+    python benchmark_engine.py --sessions 1000000
+"""
+
+import argparse
+import random
+import statistics
+import time
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import List, Dict
+
+from earnings_engine import EarningsEngine
+
+SERVICE_TYPES = ['massage', 'deep-tissue', 'reiki', 'reflexology', 'hot-stone']
+ADDONS = [('aromatherapy', 10.0), ('hot towels', 5.0), ('cupping', 15.0)]
+LOCATIONS = ['halo', 'soul-bridge']
+
+def make_sessions(count: int, seed: int = 1) -> List[Dict]:
+    """Synthetic sessions spread over three years"""
+    rng = random.Random(seed)
+    start = date(2024, 1, 1)
+    sessions = []
+    for i in range(count):
+        services = [
+            {'type': rng.choice(SERVICE_TYPES), 'duration': rng.choice((30, 60, 90)), 'rate': rng.choice((60, 80, 100))}
+            for _ in range(rng.choice((1, 1, 1, 2, 3)))
+        ]
+        addons = [{'name': name, 'price': price} for name, price in rng.sample(ADDONS, rng.choice((0, 0, 1, 2)))]
+        sessions.append({
+            'id': str(i),
+            'date': (start + timedelta(days=rng.randrange(1095))).isoformat(),
+            'location': rng.choice(LOCATIONS),
+            'services': services,
+            'addOns': addons,
+            'tips': rng.choice((0, 0, 5, 10, 20)),
+        })
+    return sessions
+
+def session_total(session: Dict) -> float:
+    """The per-session loop each consumer repeated"""
+    total = 0.0
+    for service in session.get('services', []):
+        if 'rate' in service and 'duration' in service:
+            total += (service['rate'] / 60) * service['duration']
+    for addon in session.get('addOns', []):
+        total += addon.get('price', 0)
+    return total + session.get('tips', 0)
+
+def legacy_queries(sessions: List[Dict]) -> Dict:
+    """Total, by-location, by-date and per-session statistics, one loop per query as before"""
+    total = sum(session_total(s) for s in sessions)
+    by_location = defaultdict(float)
+    for s in sessions:
+        by_location[s.get('location', 'unknown')] += session_total(s)
+    by_date = defaultdict(float)
+    for s in sessions:
+        by_date[s.get('date', 'unknown')] += session_total(s)
+    per_session = [session_total(s) for s in sessions]
+    return {
+        'total': total,
+        'by_location': dict(by_location),
+        'by_date': dict(by_date),
+        'mean': statistics.mean(per_session),
+        'stdev': statistics.stdev(per_session),
+    }
+
+def engine_queries(engine: EarningsEngine) -> Dict:
+    return {
+        'total': float(engine.gross.sum()),
+        'by_location': engine.sum_by('location', 'gross'),
+        'by_date': engine.sum_by('date', 'gross'),
+        'mean': float(engine.gross.mean()),
+        'stdev': float(engine.gross.std(ddof=1)),
+    }
+
+def timed(fn, *args):
+    started = time.perf_counter()
+    result = fn(*args)
+    return result, (time.perf_counter() - started) * 1000
+
+def close(a: float, b: float) -> bool:
+    return abs(a - b) <= 1e-6 * max(1.0, abs(a), abs(b))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--sessions', type=int, default=1_000_000, help='number of synthetic sessions')
+    parser.add_argument('--repeat', type=int, default=3, help='runs of each query set')
+    args = parser.parse_args()
+    
+    sessions = make_sessions(args.sessions)
+    
+    legacy_times, build_times, query_times = [], [], []
+    for _ in range(args.repeat):
+        legacy, elapsed = timed(legacy_queries, sessions)
+        legacy_times.append(elapsed)
+        engine, elapsed = timed(EarningsEngine.from_sessions, sessions)
+        build_times.append(elapsed)
+        vectorized, elapsed = timed(engine_queries, engine)
+        query_times.append(elapsed)
+    
+    assert close(legacy['total'], vectorized['total'])
+    assert close(legacy['mean'], vectorized['mean']) and close(legacy['stdev'], vectorized['stdev'])
+    for key in ('by_location', 'by_date'):
+        assert legacy[key].keys() == vectorized[key].keys()
+        assert all(close(legacy[key][k], vectorized[key][k]) for k in legacy[key])
+    
+    legacy_ms, build_ms, query_ms = min(legacy_times), min(build_times), min(query_times)
+    print(f"{args.sessions} sessions, best of {args.repeat}")
+    print(f"  dict loops:       {legacy_ms:>10.1f}ms")
+    print(f"  engine build:     {build_ms:>10.1f}ms (once per session list)")
+    print(f"  engine queries:   {query_ms:>10.1f}ms ({legacy_ms / query_ms:.0f}x faster)")
+    print(f"  build + queries:  {build_ms + query_ms:>10.1f}ms ({legacy_ms / (build_ms + query_ms):.1f}x faster)")
+
+if __name__ == '__main__':
+    main()
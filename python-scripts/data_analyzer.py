@@ -5,11 +5,23 @@ Analyzes trends, statistics, and insights from earnings data
 
 import json
 from datetime import datetime, timedelta
+from functools import cached_property
 from typing import List, Dict, Tuple
-from collections import defaultdict
-import statistics
+
+import numpy as np
+
+from earnings_engine import EarningsEngine
 
 class EarningsAnalyzer:
+    """
+    Earnings metrics over a fixed list of sessions
+    
+    The session dicts are read once, on first use, into an EarningsEngine.
+    Each aggregate below (totals, per-day and per-location totals, session
+    and tip statistics) is then computed once and memoized, and every metric
+    reads from them. Build a new analyzer if the sessions change.
+    """
+    
     def __init__(self, sessions_data: List[Dict]):
         """
         Initialize analyzer
@@ -18,69 +30,44 @@ class EarningsAnalyzer:
             sessions_data: List of session dictionaries with complete data
         """
         self.sessions = sessions_data
-        self.dates = sorted(list(set(s.get('date', '') for s in sessions_data)))
     
-    def get_total_earnings(self) -> float:
-        """Calculate total earnings across all sessions"""
-        total = 0.0
-        for session in self.sessions:
-            for service in session.get('services', []):
-                if 'rate' in service and 'duration' in service:
-                    total += (service['rate'] / 60) * service['duration']
-            
-            for addon in session.get('addOns', []):
-                total += addon.get('price', 0)
-            
-            total += session.get('tips', 0)
-        
-        return total
+    # ===== SHARED AGGREGATES =====
     
-    def get_earnings_by_location(self) -> Dict[str, float]:
-        """Get total earnings broken down by business location"""
-        earnings_by_location = defaultdict(float)
-        
-        for session in self.sessions:
-            location = session.get('location', 'unknown')
-            session_earnings = 0.0
-            
-            for service in session.get('services', []):
-                if 'rate' in service and 'duration' in service:
-                    session_earnings += (service['rate'] / 60) * service['duration']
-            
-            for addon in session.get('addOns', []):
-                session_earnings += addon.get('price', 0)
-            
-            session_earnings += session.get('tips', 0)
-            earnings_by_location[location] += session_earnings
-        
-        return dict(earnings_by_location)
+    @cached_property
+    def engine(self) -> EarningsEngine:
+        """The sessions as columns; the only pass over the session dicts"""
+        return EarningsEngine.from_sessions(self.sessions)
     
-    def get_daily_averages(self) -> Dict[str, float]:
-        """Get average earnings per day"""
-        daily_earnings = defaultdict(float)
-        daily_counts = defaultdict(int)
-        
-        for session in self.sessions:
-            date = session.get('date', 'unknown')
-            session_earnings = 0.0
-            
-            for service in session.get('services', []):
-                if 'rate' in service and 'duration' in service:
-                    session_earnings += (service['rate'] / 60) * service['duration']
-            
-            for addon in session.get('addOns', []):
-                session_earnings += addon.get('price', 0)
-            
-            session_earnings += session.get('tips', 0)
-            
-            daily_earnings[date] += session_earnings
-            daily_counts[date] += 1
-        
-        return {date: daily_earnings[date] for date in daily_earnings}
+    @cached_property
+    def dates(self) -> List[str]:
+        """Sorted distinct session dates"""
+        return [d for d, ordinal in zip(self.engine.dates, self.engine.date_ordinals) if ordinal]
     
-    def get_session_statistics(self) -> Dict:
-        """Get detailed statistics about sessions"""
-        if not self.sessions:
+    @cached_property
+    def _totals(self) -> Dict:
+        return self.engine.totals()
+    
+    @cached_property
+    def _daily(self) -> Dict[str, Dict]:
+        return self.engine.group_totals('date')
+    
+    @cached_property
+    def _by_location(self) -> Dict[str, Dict]:
+        return self.engine.group_totals('location')
+    
+    @cached_property
+    def _service_counts(self) -> Dict[str, int]:
+        return self.engine.service_counts()
+    
+    @cached_property
+    def _addon_revenue(self) -> Dict[str, float]:
+        return self.engine.addon_revenue()
+    
+    @cached_property
+    def _session_statistics(self) -> Dict:
+        session_earnings = self.engine.gross
+        
+        if not len(session_earnings):
             return {
                 'totalSessions': 0,
                 'averageSessionEarnings': 0.0,
@@ -90,58 +77,20 @@ class EarningsAnalyzer:
                 'standardDeviation': 0.0,
             }
         
-        session_earnings = []
-        
-        for session in self.sessions:
-            session_total = 0.0
-            
-            for service in session.get('services', []):
-                if 'rate' in service and 'duration' in service:
-                    session_total += (service['rate'] / 60) * service['duration']
-            
-            for addon in session.get('addOns', []):
-                session_total += addon.get('price', 0)
-            
-            session_total += session.get('tips', 0)
-            session_earnings.append(session_total)
-        
         return {
             'totalSessions': len(session_earnings),
-            'averageSessionEarnings': statistics.mean(session_earnings),
-            'medianSessionEarnings': statistics.median(session_earnings),
-            'minSessionEarnings': min(session_earnings),
-            'maxSessionEarnings': max(session_earnings),
-            'standardDeviation': statistics.stdev(session_earnings) if len(session_earnings) > 1 else 0.0,
+            'averageSessionEarnings': float(session_earnings.mean()),
+            'medianSessionEarnings': float(np.median(session_earnings)),
+            'minSessionEarnings': float(session_earnings.min()),
+            'maxSessionEarnings': float(session_earnings.max()),
+            'standardDeviation': float(session_earnings.std(ddof=1)) if len(session_earnings) > 1 else 0.0,
         }
     
-    def get_service_breakdown(self) -> Dict[str, int]:
-        """Get count of each service type"""
-        service_counts = defaultdict(int)
-        
-        for session in self.sessions:
-            for service in session.get('services', []):
-                service_type = service.get('type', 'unknown')
-                service_counts[service_type] += 1
-        
-        return dict(service_counts)
-    
-    def get_addon_revenue(self) -> Dict[str, float]:
-        """Get revenue from add-ons"""
-        addon_revenue = defaultdict(float)
-        
-        for session in self.sessions:
-            for addon in session.get('addOns', []):
-                addon_name = addon.get('name', 'unknown')
-                addon_price = addon.get('price', 0)
-                addon_revenue[addon_name] += addon_price
-        
-        return dict(addon_revenue)
-    
-    def get_tip_statistics(self) -> Dict:
-        """Get tip statistics"""
-        tips = [s.get('tips', 0) for s in self.sessions if s.get('tips', 0) > 0]
+    @cached_property
+    def _tip_statistics(self) -> Dict:
+        tips = self.engine.tips[self.engine.tips > 0]
         
-        if not tips:
+        if not len(tips):
             return {
                 'totalTips': 0.0,
                 'averageTip': 0.0,
@@ -150,67 +99,76 @@ class EarningsAnalyzer:
                 'tipPercentage': 0.0,
             }
         
-        earnings = self.get_total_earnings() - sum(tips)  # Remove tips from earnings
+        total_tips = self._totals['tips']
+        earnings = self._totals['earnings']  # Earnings without tips
         
         return {
-            'totalTips': sum(tips),
-            'averageTip': statistics.mean(tips),
-            'medianTip': statistics.median(tips),
+            'totalTips': total_tips,
+            'averageTip': float(tips.mean()),
+            'medianTip': float(np.median(tips)),
             'sessionsWithTips': len(tips),
-            'tipPercentage': (sum(tips) / earnings * 100) if earnings > 0 else 0.0,
+            'tipPercentage': (total_tips / earnings * 100) if earnings > 0 else 0.0,
         }
     
+    # ===== METRICS =====
+    
+    def get_total_earnings(self) -> float:
+        """Calculate total earnings across all sessions"""
+        return self._totals['gross']
+    
+    def get_earnings_by_location(self) -> Dict[str, float]:
+        """Get total earnings broken down by business location"""
+        return {location: totals['gross'] for location, totals in self._by_location.items()}
+    
+    def get_daily_averages(self) -> Dict[str, float]:
+        """Get average earnings per day"""
+        return {date: totals['gross'] for date, totals in self._daily.items()}
+    
+    def get_session_statistics(self) -> Dict:
+        """Get detailed statistics about sessions"""
+        return dict(self._session_statistics)
+    
+    def get_service_breakdown(self) -> Dict[str, int]:
+        """Get count of each service type"""
+        return dict(self._service_counts)
+    
+    def get_addon_revenue(self) -> Dict[str, float]:
+        """Get revenue from add-ons"""
+        return dict(self._addon_revenue)
+    
+    def get_tip_statistics(self) -> Dict:
+        """Get tip statistics"""
+        return dict(self._tip_statistics)
+    
     def get_daily_metrics(self) -> Dict[str, Dict]:
         """Get detailed metrics for each day"""
-        daily_metrics = defaultdict(lambda: {
-            'sessions': 0,
-            'earnings': 0.0,
-            'tips': 0.0,
-            'addons': 0.0,
-        })
-        
-        for session in self.sessions:
-            date = session.get('date', 'unknown')
-            
-            daily_metrics[date]['sessions'] += 1
-            
-            for service in session.get('services', []):
-                if 'rate' in service and 'duration' in service:
-                    daily_metrics[date]['earnings'] += (service['rate'] / 60) * service['duration']
-            
-            for addon in session.get('addOns', []):
-                daily_metrics[date]['addons'] += addon.get('price', 0)
-            
-            daily_metrics[date]['tips'] += session.get('tips', 0)
-        
-        return dict(daily_metrics)
+        return {
+            date: {
+                'sessions': totals['sessions'],
+                'earnings': totals['serviceEarnings'],
+                'tips': totals['tips'],
+                'addons': totals['addons'],
+            }
+            for date, totals in self._daily.items()
+        }
     
     def get_best_days(self, limit: int = 5) -> List[Tuple[str, float]]:
         """Get the best earning days"""
-        daily_metrics = self.get_daily_metrics()
-        
-        days = [
-            (date, daily_metrics[date]['earnings'] + daily_metrics[date]['addons'] + daily_metrics[date]['tips'])
-            for date in daily_metrics
-        ]
+        days = [(date, totals['gross']) for date, totals in self._daily.items()]
         
         return sorted(days, key=lambda x: x[1], reverse=True)[:limit]
     
     def get_productivity_score(self) -> Dict:
         """Calculate productivity metrics"""
-        if not self.sessions:
-            return {'score': 0, 'workDays': 0, 'sessionsPerDay': 0}
-        
-        daily_metrics = self.get_daily_metrics()
-        work_days = len(daily_metrics)
-        total_sessions = len(self.sessions)
+        work_days = len(self._daily)
+        total_sessions = self._totals['sessions']
         
         return {
             'score': (total_sessions / work_days) if work_days > 0 else 0,
             'workDays': work_days,
             'totalSessions': total_sessions,
             'sessionsPerDay': total_sessions / work_days if work_days > 0 else 0,
-            'averageDailyEarnings': self.get_total_earnings() / work_days if work_days > 0 else 0,
+            'averageDailyEarnings': self._totals['gross'] / work_days if work_days > 0 else 0,
         }
     
     def generate_summary_report(self) -> str:
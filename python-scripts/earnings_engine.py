@@ -0,0 +1,314 @@
+"""
+Columnar Earnings Engine for Earnings Tracker
+Converts a session list into NumPy arrays once and answers totals, group-bys
+and filters with vectorized operations
+"""
+
+from datetime import date as Date
+from bisect import bisect_left, bisect_right
+from typing import List, Dict, Optional
+
+import numpy as np
+
+# Label used for a missing date, location, service type or add-on name
+UNKNOWN = 'unknown'
+
+def _number(value) -> float:
+    """Coerce an amount from a session dict; missing or empty values count as 0"""
+    return float(value) if value else 0.0
+
+def _ordinal(label: str) -> int:
+    """Proleptic Gregorian ordinal of a YYYY-MM-DD label, 0 when it is not a date"""
+    try:
+        return Date.fromisoformat(label).toordinal()
+    except (TypeError, ValueError):
+        return 0
+
+class EarningsEngine:
+    """
+    Sessions as a per-session table, a per-service table and a per-add-on table
+    
+    Earnings are defined once here and every consumer reads them:
+        service earnings = sum of (rate / 60) * duration over the services
+        earnings         = service earnings + add-on prices
+        gross            = earnings + tips
+    
+    Dates, locations, service types and add-on names are stored as integer
+    codes into label lists. Date labels are sorted, so a code range is a
+    YYYY-MM-DD string range and date codes order chronologically.
+    """
+    
+    def __init__(self, sessions: List[Dict], columns: Dict[str, np.ndarray], labels: Dict[str, List[str]]):
+        self.sessions = sessions
+        self.dates = labels['dates']
+        self.locations = labels['locations']
+        self.service_types = labels['service_types']
+        self.addon_names = labels['addon_names']
+        
+        # Per-session columns
+        self.index = columns['index']
+        self.date_code = columns['date_code']
+        self.location_code = columns['location_code']
+        self.service_earnings = columns['service_earnings']
+        self.addon_total = columns['addon_total']
+        self.tips = columns['tips']
+        self.service_offsets = columns['service_offsets']
+        
+        # Per-service columns; services of session i are rows service_offsets[i]:service_offsets[i + 1]
+        self.service_session = columns['service_session']
+        self.service_type_code = columns['service_type_code']
+        self.service_duration = columns['service_duration']
+        self.service_rate = columns['service_rate']
+        self.service_amount = columns['service_amount']
+        
+        # Per-add-on columns
+        self.addon_session = columns['addon_session']
+        self.addon_name_code = columns['addon_name_code']
+        self.addon_price = columns['addon_price']
+        
+        self.date_ordinals = np.array([_ordinal(label) for label in self.dates], dtype=np.int32)
+        self.date_ordinal = self.date_ordinals[self.date_code]
+        self.earnings = self.service_earnings + self.addon_total
+        self.gross = self.earnings + self.tips
+    
+    @classmethod
+    def from_sessions(cls, sessions: List[Dict]) -> 'EarningsEngine':
+        """
+        Build the tables in one pass over the session dicts
+        
+        Args:
+            sessions: List of session dictionaries
+        """
+        date_codes, location_codes, type_codes, name_codes = {}, {}, {}, {}
+        date_code, location_code, tips, service_count = [], [], [], []
+        service_session, service_type_code, service_duration, service_rate = [], [], [], []
+        addon_session, addon_name_code, addon_price = [], [], []
+        
+        for i, session in enumerate(sessions):
+            label = session.get('date') or UNKNOWN
+            code = date_codes.get(label)
+            if code is None:
+                code = date_codes[label] = len(date_codes)
+            date_code.append(code)
+            
+            label = session.get('location') or UNKNOWN
+            code = location_codes.get(label)
+            if code is None:
+                code = location_codes[label] = len(location_codes)
+            location_code.append(code)
+            
+            tips.append(_number(session.get('tips')))
+            
+            services = session.get('services') or ()
+            service_count.append(len(services))
+            for service in services:
+                label = service.get('type') or UNKNOWN
+                code = type_codes.get(label)
+                if code is None:
+                    code = type_codes[label] = len(type_codes)
+                service_session.append(i)
+                service_type_code.append(code)
+                service_duration.append(_number(service.get('duration')))
+                service_rate.append(_number(service.get('rate')))
+            
+            for addon in session.get('addOns') or ():
+                label = addon.get('name') or UNKNOWN
+                code = name_codes.get(label)
+                if code is None:
+                    code = name_codes[label] = len(name_codes)
+                addon_session.append(i)
+                addon_name_code.append(code)
+                addon_price.append(_number(addon.get('price')))
+        
+        # Renumber dates so code order is label order
+        dates = sorted(date_codes)
+        remap = np.empty(len(dates), dtype=np.int32)
+        for position, label in enumerate(dates):
+            remap[date_codes[label]] = position
+        
+        count = len(sessions)
+        service_session = np.array(service_session, dtype=np.int64)
+        service_duration = np.array(service_duration, dtype=np.float64)
+        service_rate = np.array(service_rate, dtype=np.float64)
+        service_amount = service_rate / 60 * service_duration
+        addon_session = np.array(addon_session, dtype=np.int64)
+        addon_price = np.array(addon_price, dtype=np.float64)
+        
+        columns = {
+            'index': np.arange(count, dtype=np.int64),
+            'date_code': remap[np.array(date_code, dtype=np.int32)],
+            'location_code': np.array(location_code, dtype=np.int32),
+            'tips': np.array(tips, dtype=np.float64),
+            'service_earnings': np.bincount(service_session, weights=service_amount, minlength=count),
+            'addon_total': np.bincount(addon_session, weights=addon_price, minlength=count),
+            'service_offsets': np.concatenate(([0], np.cumsum(np.array(service_count, dtype=np.int64)))),
+            'service_session': service_session,
+            'service_type_code': np.array(service_type_code, dtype=np.int32),
+            'service_duration': service_duration,
+            'service_rate': service_rate,
+            'service_amount': service_amount,
+            'addon_session': addon_session,
+            'addon_name_code': np.array(addon_name_code, dtype=np.int32),
+            'addon_price': addon_price,
+        }
+        labels = {
+            'dates': dates,
+            'locations': list(location_codes),
+            'service_types': list(type_codes),
+            'addon_names': list(name_codes),
+        }
+        return cls(sessions, columns, labels)
+    
+    def __len__(self) -> int:
+        return len(self.index)
+    
+    # ===== FILTERS =====
+    
+    def mask(self, location: Optional[str] = None, start_date: Optional[str] = None,
+             end_date: Optional[str] = None) -> np.ndarray:
+        """
+        Boolean mask of the sessions matching every given condition
+        
+        Args:
+            location: Location name; 'all' or None matches every session
+            start_date: First date to include (YYYY-MM-DD)
+            end_date: Last date to include (YYYY-MM-DD)
+        """
+        selected = np.ones(len(self), dtype=bool)
+        if location not in (None, 'all'):
+            if location in self.locations:
+                selected &= self.location_code == self.locations.index(location)
+            else:
+                selected[:] = False
+        if start_date is not None:
+            selected &= self.date_code >= bisect_left(self.dates, start_date)
+        if end_date is not None:
+            selected &= self.date_code < bisect_right(self.dates, end_date)
+        return selected
+    
+    def select(self, selected: np.ndarray) -> 'EarningsEngine':
+        """Engine over the sessions where `selected` is True, sharing the label lists"""
+        counts = np.diff(self.service_offsets)[selected]
+        # Position of each kept session in the new tables
+        position = np.cumsum(selected) - 1
+        service_kept = selected[self.service_session]
+        addon_kept = selected[self.addon_session]
+        
+        columns = {
+            'index': self.index[selected],
+            'date_code': self.date_code[selected],
+            'location_code': self.location_code[selected],
+            'tips': self.tips[selected],
+            'service_earnings': self.service_earnings[selected],
+            'addon_total': self.addon_total[selected],
+            'service_offsets': np.concatenate(([0], np.cumsum(counts))),
+            'service_session': position[self.service_session[service_kept]],
+            'service_type_code': self.service_type_code[service_kept],
+            'service_duration': self.service_duration[service_kept],
+            'service_rate': self.service_rate[service_kept],
+            'service_amount': self.service_amount[service_kept],
+            'addon_session': position[self.addon_session[addon_kept]],
+            'addon_name_code': self.addon_name_code[addon_kept],
+            'addon_price': self.addon_price[addon_kept],
+        }
+        labels = {
+            'dates': self.dates,
+            'locations': self.locations,
+            'service_types': self.service_types,
+            'addon_names': self.addon_names,
+        }
+        return EarningsEngine(self.sessions, columns, labels)
+    
+    def filter(self, location: Optional[str] = None, start_date: Optional[str] = None,
+               end_date: Optional[str] = None) -> 'EarningsEngine':
+        """Engine over the sessions matching mask()"""
+        return self.select(self.mask(location, start_date, end_date))
+    
+    def session_dicts(self) -> List[Dict]:
+        """The original session dicts in this engine, in input order"""
+        return [self.sessions[i] for i in self.index.tolist()]
+    
+    # ===== TOTALS =====
+    
+    def totals(self) -> Dict:
+        """Session count and summed amounts"""
+        return {
+            'sessions': len(self),
+            'serviceEarnings': float(self.service_earnings.sum()),
+            'addons': float(self.addon_total.sum()),
+            'earnings': float(self.earnings.sum()),
+            'tips': float(self.tips.sum()),
+            'gross': float(self.gross.sum()),
+        }
+    
+    # ===== GROUP-BYS =====
+    
+    def _group(self, codes: np.ndarray, labels: List[str], weights: Optional[np.ndarray] = None) -> np.ndarray:
+        return np.bincount(codes, weights=weights, minlength=len(labels))
+    
+    def _present(self, codes: np.ndarray, labels: List[str]) -> List[int]:
+        """Codes that occur in this engine, in label order"""
+        return np.flatnonzero(self._group(codes, labels)).tolist()
+    
+    def group_totals(self, by: str) -> Dict[str, Dict]:
+        """
+        Totals per date or location, like totals() for each group
+        
+        Args:
+            by: 'date' or 'location'
+        """
+        codes, labels = (self.date_code, self.dates) if by == 'date' else (self.location_code, self.locations)
+        sessions = self._group(codes, labels)
+        sums = {
+            name: self._group(codes, labels, values)
+            for name, values in (
+                ('serviceEarnings', self.service_earnings),
+                ('addons', self.addon_total),
+                ('earnings', self.earnings),
+                ('tips', self.tips),
+                ('gross', self.gross),
+            )
+        }
+        result = {}
+        for code in np.flatnonzero(sessions).tolist():
+            group = {'sessions': int(sessions[code])}
+            for name, values in sums.items():
+                group[name] = float(values[code])
+            result[labels[code]] = group
+        return result
+    
+    def sum_by(self, by: str, values: str = 'gross') -> Dict[str, float]:
+        """
+        One summed per-session column per date or location
+        
+        Args:
+            by: 'date' or 'location'
+            values: 'serviceEarnings', 'addons', 'earnings', 'tips' or 'gross'
+        """
+        column = {
+            'serviceEarnings': self.service_earnings,
+            'addons': self.addon_total,
+            'earnings': self.earnings,
+            'tips': self.tips,
+            'gross': self.gross,
+        }[values]
+        codes, labels = (self.date_code, self.dates) if by == 'date' else (self.location_code, self.locations)
+        sums = self._group(codes, labels, column)
+        return {labels[code]: float(sums[code]) for code in self._present(codes, labels)}
+    
+    def count_by(self, by: str) -> Dict[str, int]:
+        """Sessions per date or location"""
+        codes, labels = (self.date_code, self.dates) if by == 'date' else (self.location_code, self.locations)
+        counts = self._group(codes, labels)
+        return {labels[code]: int(counts[code]) for code in np.flatnonzero(counts).tolist()}
+    
+    def service_counts(self) -> Dict[str, int]:
+        """Number of services of each type"""
+        counts = self._group(self.service_type_code, self.service_types)
+        return {self.service_types[code]: int(counts[code]) for code in np.flatnonzero(counts).tolist()}
+    
+    def addon_revenue(self) -> Dict[str, float]:
+        """Summed price of each add-on"""
+        counts = self._group(self.addon_name_code, self.addon_names)
+        sums = self._group(self.addon_name_code, self.addon_names, self.addon_price)
+        return {self.addon_names[code]: float(sums[code]) for code in np.flatnonzero(counts).tolist()}
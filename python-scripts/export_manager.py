@@ -9,6 +9,10 @@ from datetime import datetime
 from typing import List, Dict
 from pathlib import Path
 
+import numpy as np
+
+from earnings_engine import EarningsEngine
+
 try:
     from reportlab.lib.pagesizes import letter
     from reportlab.platypus import SimpleDocTemplate, Table, TableStyle, Paragraph, Spacer, PageBreak
@@ -35,6 +39,7 @@ class ExportManager:
             sessions_data: List of session dictionaries
         """
         self.sessions = sessions_data
+        self.engine = EarningsEngine.from_sessions(sessions_data)
         self.timestamp = datetime.now().strftime('%Y-%m-%d_%H-%M-%S')
     
     def export_to_csv(self, filename: str = None) -> str:
@@ -56,6 +61,7 @@ class ExportManager:
         ]
         
         rows = []
+        service_amounts = iter(self.engine.service_amount.tolist())
         
         for session in self.sessions:
             date = session.get('date', '')
@@ -70,10 +76,9 @@ class ExportManager:
                     service_type = service.get('type', '')
                     duration = service.get('duration', 0)
                     rate = service.get('rate', 0)
-                    earnings = (rate / 60) * duration
+                    earnings = next(service_amounts)
                     
                     addons_str = ', '.join([a.get('name', '') for a in session.get('addOns', [])])
-                    addons_total = sum([a.get('price', 0) for a in session.get('addOns', [])])
                     
                     rows.append({
                         'ID': session.get('id', ''),
@@ -168,20 +173,21 @@ class ExportManager:
             bottom=Side(style='thin')
         )
         
-        for session in self.sessions:
+        service_amounts = iter(self.engine.service_amount.tolist())
+        session_columns = zip(self.sessions, self.engine.addon_total.tolist(), self.engine.tips.tolist())
+        
+        for session, addons_total, tips in session_columns:
             date = session.get('date', '')
             location = session.get('location', '')
-            tips = float(session.get('tips', 0))
             
-            services = session.get('services', [])
+            services = session.get('services') or ()
             addons = session.get('addOns', [])
-            addons_total = sum(float(a.get('price', 0)) for a in addons)
             
             for service in services:
                 service_type = service.get('type', '')
                 duration = float(service.get('duration', 0))
                 rate = float(service.get('rate', 0))
-                earnings = (rate / 60) * duration
+                earnings = next(service_amounts)
                 
                 addons_str = ', '.join([a.get('name', '') for a in addons])
                 total = earnings + addons_total + tips
@@ -237,11 +243,9 @@ class ExportManager:
         
         # Summary table
         summary_data = [['Metric', 'Value']]
-        total_earnings = sum(
-            sum((s.get('rate', 0) / 60) * s.get('duration', 0) for s in session.get('services', []))
-            for session in self.sessions
-        )
-        total_tips = sum(session.get('tips', 0) for session in self.sessions)
+        totals = self.engine.totals()
+        total_earnings = totals['earnings']
+        total_tips = totals['tips']
         
         summary_data.append(['Total Sessions', str(len(self.sessions))])
         summary_data.append(['Total Earnings', f"${total_earnings:.2f}"])
@@ -267,17 +271,18 @@ class ExportManager:
         
         sessions_data = [['Date', 'Location', 'Services', 'Tips', 'Total']]
         
-        for session in sorted(self.sessions, key=lambda x: x.get('date', ''), reverse=True):
+        # Newest first; sessions on the same date keep their order
+        order = np.argsort(-self.engine.date_ordinal, kind='stable').tolist()
+        gross = self.engine.gross.tolist()
+        tips = self.engine.tips.tolist()
+        
+        for i in order:
+            session = self.sessions[i]
             date = session.get('date', '')
             location = session.get('location', '')
             services_str = ', '.join([s.get('type', '') for s in session.get('services', [])])
-            tips = session.get('tips', 0)
-            
-            earnings = sum((s.get('rate', 0) / 60) * s.get('duration', 0) for s in session.get('services', []))
-            addons = sum(a.get('price', 0) for a in session.get('addOns', []))
-            total = earnings + addons + tips
             
-            sessions_data.append([date, location, services_str, f"${tips:.2f}", f"${total:.2f}"])
+            sessions_data.append([date, location, services_str, f"${tips[i]:.2f}", f"${gross[i]:.2f}"])
         
         sessions_table = Table(sessions_data)
         sessions_table.setStyle(TableStyle([
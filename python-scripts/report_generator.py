@@ -9,6 +9,8 @@ from datetime import datetime, timedelta
 from pathlib import Path
 from typing import List, Dict, Tuple
 
+from earnings_engine import EarningsEngine
+
 class EarningsReport:
     def __init__(self, sessions_data: List[Dict], location: str = 'all'):
         """
@@ -18,103 +20,89 @@ class EarningsReport:
             sessions_data: List of session dictionaries
             location: 'soul-bridge', 'halo', or 'all'
         """
-        self.sessions = sessions_data
         self.location = location
         
         # Filter by location if specified
-        if location != 'all':
-            self.sessions = [s for s in sessions_data if s.get('location') == location]
+        self.engine = EarningsEngine.from_sessions(sessions_data).filter(location=location)
+        self.sessions = self.engine.session_dicts()
         
-        self.filtered_sessions = self.sessions
+        self.filtered = self.engine
+    
+    @property
+    def filtered_sessions(self) -> List[Dict]:
+        """Session dicts left by the last filter"""
+        return self.filtered.session_dicts()
     
     def filter_by_date_range(self, start_date: str, end_date: str) -> 'EarningsReport':
         """Filter sessions by date range (YYYY-MM-DD format)"""
-        self.filtered_sessions = [
-            s for s in self.sessions
-            if start_date <= s.get('date', '') <= end_date
-        ]
+        self.filtered = self.engine.filter(start_date=start_date, end_date=end_date)
         return self
     
     def filter_by_date(self, date: str) -> 'EarningsReport':
         """Filter sessions by specific date (YYYY-MM-DD format)"""
-        self.filtered_sessions = [s for s in self.sessions if s.get('date') == date]
+        self.filtered = self.engine.filter(start_date=date, end_date=date)
         return self
     
     def calculate_daily_totals(self) -> Dict[str, Dict]:
-        """Calculate totals for each day"""
-        daily_data = {}
-        
-        for session in self.filtered_sessions:
-            date = session.get('date', 'unknown')
-            
-            if date not in daily_data:
-                daily_data[date] = {
-                    'sessions': 0,
-                    'earnings': 0.0,
-                    'tips': 0.0,
-                    'services': [],
-                }
-            
-            daily_data[date]['sessions'] += 1
-            daily_data[date]['tips'] += session.get('tips', 0)
-            
-            # Calculate earnings based on services
-            for service in session.get('services', []):
-                daily_data[date]['services'].append(service)
-                if 'rate' in service and 'duration' in service:
-                    earnings = (service['rate'] / 60) * service['duration']
-                    daily_data[date]['earnings'] += earnings
-            
-            daily_data[date]['earnings'] += session.get('tips', 0)
+        """Calculate totals for each day; earnings include add-ons but not tips"""
+        daily_data = {
+            date: {
+                'sessions': totals['sessions'],
+                'earnings': totals['earnings'],
+                'tips': totals['tips'],
+                'services': [],
+            }
+            for date, totals in self.filtered.group_totals('date').items()
+        }
+        
+        dates = self.filtered.dates
+        for code, session in zip(self.filtered.date_code.tolist(), self.filtered_sessions):
+            daily_data[dates[code]]['services'].extend(session.get('services', []))
         
         return daily_data
     
     def generate_daily_report(self, date: str) -> str:
         """Generate a daily report for a specific date"""
         self.filter_by_date(date)
+        day = self.filtered
         
         report = f"EARNINGS REPORT - {date}\n"
         report += "=" * 50 + "\n\n"
         
-        if not self.filtered_sessions:
+        if not len(day):
             report += "No sessions recorded for this date.\n"
             return report
         
-        report += f"Total Sessions: {len(self.filtered_sessions)}\n\n"
+        report += f"Total Sessions: {len(day)}\n\n"
         
-        total_earnings = 0
-        total_tips = 0
-        services_count = {}
+        totals = day.totals()
+        service_amounts = iter(day.service_amount.tolist())
+        addon_prices = iter(day.addon_price.tolist())
         
-        for session in self.filtered_sessions:
+        for session in day.session_dicts():
             report += f"\nSession {session.get('id', 'unknown')}\n"
             report += "-" * 30 + "\n"
             
             # Services
-            for service in session.get('services', []):
+            for service in session.get('services') or ():
                 service_type = service.get('type', 'unknown')
                 duration = service.get('duration', 0)
                 rate = service.get('rate', 0)
-                
-                earnings = (rate / 60) * duration if rate and duration else 0
-                total_earnings += earnings
-                
-                services_count[service_type] = services_count.get(service_type, 0) + 1
-                
-                report += f"  {service_type}: {duration}min @ ${rate}/hr = ${earnings:.2f}\n"
+                report += f"  {service_type}: {duration}min @ ${rate}/hr = ${next(service_amounts):.2f}\n"
             
             # Add-ons
-            for addon in session.get('addOns', []):
-                price = addon.get('price', 0)
-                total_earnings += price
-                report += f"  Add-on: {addon.get('name', 'unknown')} = ${price:.2f}\n"
+            for addon in session.get('addOns') or ():
+                report += f"  Add-on: {addon.get('name', 'unknown')} = ${next(addon_prices):.2f}\n"
             
             # Tips
             tips = session.get('tips', 0)
-            total_tips += tips
-            if tips > 0:
+            if tips and tips > 0:
                 report += f"  Tips: ${tips:.2f}\n"
         
+        total_earnings = totals['earnings']
+        total_tips = totals['tips']
+        services_count = day.service_counts()
+        
         report += "\n" + "=" * 50 + "\n"
         report += "DAILY SUMMARY\n"
         report += f"Total Earnings: ${total_earnings:.2f}\n"